@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for AST to Elasticsearch query translation.
+
+Measures the latency of parsing CQL-JSON, translating the AST with
+``to_filter`` / ``to_dict_filter``, serialising the query with ``to_dict``
+and serving it from a ``FilterCache``, over a corpus of realistic filters,
+with `pytest-benchmark <https://pytest-benchmark.readthedocs.io>`_.
+
+Usage::
+
+    make bench
+    python -m pytest benchmarks/bench_translation.py -k in_1000
+    python -m pytest benchmarks/bench_translation.py --benchmark-save=baseline
+    python -m pytest benchmarks/bench_translation.py \\
+        --benchmark-compare=0001_baseline --benchmark-compare-fail=median:25%
+
+With ``--benchmark-compare-fail`` the run fails if any benchmark is slower
+than the saved result by more than the threshold.
+
+The peak memory allocated by one call, measured with ``tracemalloc`` outside
+the timed rounds, is saved as ``peak_allocated_bytes`` in the ``extra_info``
+of each benchmark, e.g. with ``--benchmark-json=results.json``.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import json
+import math
+import tracemalloc
+
+import pytest
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, FilterCache
+
+
+def eq(name, value):
+    return {'eq': [{'property': name}, value]}
+
+
+def balanced_tree(leaves, depth=0):
+    """Nest the leaves in a balanced tree of alternating AND / OR nodes."""
+    if len(leaves) == 1:
+        return leaves[0]
+    middle = len(leaves) // 2
+    return {
+        'and' if depth % 2 == 0 else 'or': [
+            balanced_tree(leaves[:middle], depth + 1),
+            balanced_tree(leaves[middle:], depth + 1)
+        ]
+    }
+
+
+def polygon(vertices):
+    ring = [
+        [
+            math.cos(2 * math.pi * i / vertices) * 10,
+            50 + math.sin(2 * math.pi * i / vertices) * 5
+        ]
+        for i in range(vertices)
+    ]
+    return {'type': 'Polygon', 'coordinates': [ring + [ring[0]]]}
+
+
+def time_window(start, end):
+    return {
+        'and': [
+            {'after': [{'property': 'datetime'}, start]},
+            {'before': [{'property': 'datetime'}, end]}
+        ]
+    }
+
+
+CORPUS = {
+    'small_eq': eq('platform', 'faam'),
+    'collection_and_window': {
+        'and': [
+            eq('collection', 'sentinel-2-l2a'),
+            time_window('2021-01-01T00:00:00Z', '2021-02-01T00:00:00Z'),
+            {'lt': [{'property': 'eo:cloud_cover'}, 20]}
+        ]
+    },
+    'in_1000': {
+        'in': {
+            'value': {'property': 'id'},
+            'list': [f'item-{i}' for i in range(1000)]
+        }
+    },
+    'or_chain_10': {
+        'or': [eq('flight_number', f'b{i:03d}') for i in range(10)]
+    },
+    'or_chain_200': {
+        'or': [eq('flight_number', f'b{i:03d}') for i in range(200)]
+    },
+    'or_chain_1000': {
+        'or': [eq('flight_number', f'b{i:04d}') for i in range(1000)]
+    },
+    'tree_10': balanced_tree([eq(f'p{i % 7}', i) for i in range(10)]),
+    'tree_100': balanced_tree([eq(f'p{i % 7}', i) for i in range(100)]),
+    'tree_1000': balanced_tree([eq(f'p{i % 7}', i) for i in range(1000)]),
+    'temporal_window': time_window(
+        '2005-01-04T00:00:00Z', '2005-01-06T00:00:00Z'
+    ),
+    'spatial_bbox': {
+        'intersects': [{'property': 'geometry'}, polygon(4)]
+    },
+    'spatial_polygon_1000': {
+        'intersects': [{'property': 'geometry'}, polygon(1000)]
+    },
+}
+
+STAGES = {
+    'parse_json': lambda expr, ast: parse_json(expr),
+    'to_filter': lambda expr, ast: to_filter(ast),
+    'to_filter+to_dict': lambda expr, ast: to_filter(ast).to_dict(),
+    'to_dict_filter': lambda expr, ast: to_dict_filter(ast),
+    # a miss translates into an empty cache, a hit is served from a warm one
+    'cache_miss:to_filter': lambda expr, ast: FilterCache().to_filter(ast),
+    'cache_hit:to_filter': lambda expr, ast: CACHE.to_filter(ast),
+    'cache_miss:to_dict_filter':
+        lambda expr, ast: FilterCache().to_dict_filter(ast),
+    'cache_hit:to_dict_filter': lambda expr, ast: CACHE.to_dict_filter(ast),
+}
+
+CACHE = FilterCache(maxsize=None)
+
+
+def peak_allocation(func, *args) -> int:
+    """The peak memory allocated by one call, in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('stage', list(STAGES))
+@pytest.mark.parametrize('name', list(CORPUS))
+def test_translation(benchmark, name, stage):
+    expr = json.dumps(CORPUS[name])
+    ast = parse_json(expr)
+    func = STAGES[stage]
+    # warm the cache, so the hit stages measure hits
+    func(expr, ast)
+
+    benchmark.group = name
+    benchmark.extra_info['peak_allocated_bytes'] = peak_allocation(
+        func, expr, ast
+    )
+    benchmark(func, expr, ast)
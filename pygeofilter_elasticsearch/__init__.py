@@ -10,4 +10,24 @@ __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 __version__ = '0.1.0'
 
-from .evaluate import to_filter
+from .evaluate import to_filter, to_dict_filter
+from .cache import FilterCache
+from .fields import FieldResolver
+from .templates import compile_template
+from .batch import to_filters, to_dict_filters, to_msearch
+from .search import FilterSearch, AsyncFilterSearch, scan, async_scan
+from .hybrid import split_filter
+from .trace import Tracer
+from .serialise import to_body, dumps, estimate_size
+from .aggregations import to_aggregation_body
+from .shared import to_shared_aggregation_body, to_shared_msearch
+from .routing import TimePartitions, search_target
+
+__all__ = [
+    'to_filter', 'to_dict_filter', 'FilterCache', 'FieldResolver',
+    'compile_template', 'to_filters', 'to_dict_filters', 'to_msearch',
+    'FilterSearch', 'AsyncFilterSearch', 'scan', 'async_scan', 'split_filter',
+    'Tracer', 'to_body', 'dumps', 'estimate_size', 'to_aggregation_body',
+    'to_shared_aggregation_body', 'to_shared_msearch', 'TimePartitions',
+    'search_target',
+]
@@ -0,0 +1,146 @@
+# encoding: utf-8
+"""
+Aggregation pushdown
+
+Translate a CQL filter and a small aggregation spec into a single ``size: 0``
+search body, so Elasticsearch computes counts, facets and statistics of the
+matching documents rather than returning them.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from .evaluate import ElasticsearchDictEvaluator
+
+#: Aggregation types, and whether they group documents into buckets which
+#: may have sub-aggregations.
+AGGREGATION_TYPES = {
+    'count': False,
+    'value_count': False,
+    'min': False,
+    'max': False,
+    'avg': False,
+    'sum': False,
+    'stats': False,
+    'cardinality': False,
+    'terms': True,
+    'date_histogram': True,
+    'histogram': True,
+    'geotile_grid': True,
+}
+
+CALENDAR_INTERVALS = {
+    'minute', '1m', 'hour', '1h', 'day', '1d', 'week', '1w',
+    'month', '1M', 'quarter', '1q', 'year', '1y',
+}
+
+
+def _field(evaluator, name: str, exact: bool) -> str:
+    field = evaluator.resolver(name)
+    if exact and evaluator.index_mapping is not None:
+        field = evaluator.index_mapping.exact_field(field)
+    return field
+
+
+def aggregation(evaluator, spec: dict) -> dict:
+    """ Translate one aggregation spec into an Elasticsearch aggregation.
+
+        :param evaluator: the evaluator whose field resolution to use
+        :param spec: the aggregation spec, e.g.
+                     ``{'type': 'terms', 'property': 'platform', 'size': 20}``.
+                     Further keys are passed on as aggregation parameters.
+                     ``interval`` of a ``date_histogram`` becomes its
+                     ``calendar_interval`` or ``fixed_interval``.
+                     ``aggregations`` holds the sub-aggregation specs of a
+                     bucket aggregation.
+        :return: the aggregation dict
+    """
+    spec = dict(spec)
+    agg_type = spec.pop('type')
+    name = spec.pop('property', None)
+    sub_specs = spec.pop('aggregations', None)
+
+    assert agg_type in AGGREGATION_TYPES, \
+        f'Unsupported aggregation {agg_type!r}'
+    assert name is not None, f'The {agg_type!r} aggregation needs a property'
+    assert not sub_specs or AGGREGATION_TYPES[agg_type], \
+        f'The {agg_type!r} aggregation has no buckets'
+
+    if agg_type == 'count':
+        agg_type = 'value_count'
+
+    if agg_type == 'date_histogram' and 'interval' in spec:
+        interval = spec.pop('interval')
+        if interval in CALENDAR_INTERVALS:
+            spec['calendar_interval'] = interval
+        else:
+            spec['fixed_interval'] = interval
+
+    field = _field(evaluator, name, agg_type in ('terms', 'cardinality'))
+    params = {'field': field, **spec}
+    result = {agg_type: params}
+
+    if sub_specs:
+        result['aggs'] = aggregations(evaluator, sub_specs)
+
+    return result
+
+
+def aggregations(evaluator, specs: dict) -> dict:
+    """ Translate aggregation specs by name.
+
+        :param evaluator: the evaluator whose field resolution to use
+        :param specs: the aggregation specs by name. See :func:`aggregation`.
+        :return: the aggregations dict
+    """
+    return {name: aggregation(evaluator, spec) for name, spec in specs.items()}
+
+
+def to_aggregation_body(ast, specs: dict = None, field_mapping=None,
+                        field_default=None, count: bool = True,
+                        **options) -> dict:
+    """ Translate an AST and aggregation specs into a search body which only
+        returns the aggregations of the matching documents. The filter is
+        placed in filter context, so it is not scored and can be cached.
+
+        e.g.::
+
+            to_aggregation_body(ast, {
+                'platforms': {'type': 'terms', 'property': 'platform'},
+                'monthly': {
+                    'type': 'date_histogram', 'property': 'datetime',
+                    'interval': 'month'
+                },
+                'extent': {
+                    'type': 'geotile_grid', 'property': 'geometry',
+                    'precision': 6
+                },
+                'cloud_cover': {'type': 'stats', 'property': 'eo:cloud_cover'},
+            })
+
+        :param ast: the abstract syntax tree
+        :param specs: the aggregation specs by name. See :func:`aggregation`.
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param count: Count every matching document, in ``hits.total``.
+        :param options: Further evaluator options, such as ``index_mapping``.
+        See :class:`.evaluate.ElasticsearchFilterEvaluator`.
+        :return: the search body
+    """
+    options['filter_context'] = True
+    evaluator = ElasticsearchDictEvaluator(
+        field_mapping, field_default, **options
+    )
+
+    body = {
+        'size': 0,
+        'query': evaluator.evaluate(ast),
+        'track_total_hits': count,
+    }
+    if specs:
+        body['aggs'] = aggregations(evaluator, specs)
+
+    return body
@@ -0,0 +1,193 @@
+# encoding: utf-8
+"""
+Batch translation
+
+Translate many ASTs at once with one evaluator, sharing the field resolution
+across the batch and translating identical ASTs in it once, optionally over a
+pool of processes.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from elasticsearch_dsl import Q
+from pygeofilter import ast
+
+from .cache import LEAF_TYPES, canonical_key, copy_query
+from .evaluate import ElasticsearchDictEvaluator, ElasticsearchFilterEvaluator
+from .fields import FieldResolver
+from .serialise import json_default
+
+
+COMBINATIONS = frozenset((ast.And, ast.Or))
+
+COMPARISONS = frozenset(
+    (ast.Equal, ast.NotEqual, ast.LessThan, ast.LessEqual, ast.GreaterThan,
+     ast.GreaterEqual)
+)
+
+
+def batch_key(node) -> tuple:
+    """ A structural key for an AST, equal for ASTs parsed separately from
+        the same filter and different for any other AST.
+
+        The key is flat: the types of the AND, OR and NOT nodes in prefix
+        order, which fixes how many operands each one takes, and a key for
+        each predicate. Comparisons and IN lists of an attribute and literals
+        are keyed by their type, the attribute name and the literals and
+        their types; other predicates by
+        :func:`pygeofilter_elasticsearch.cache.canonical_key`.
+
+        :param node: the abstract syntax tree
+        :return: a hashable key
+    """
+    key = []
+    stack = [node]
+
+    while stack:
+        current = stack.pop()
+        kind = type(current)
+        if kind in COMBINATIONS:
+            key.append(kind)
+            stack.append(current.rhs)
+            stack.append(current.lhs)
+        elif kind is ast.Not:
+            key.append(kind)
+            stack.append(current.sub_node)
+        elif kind in COMPARISONS and type(current.lhs) is ast.Attribute and \
+                type(current.rhs) in LEAF_TYPES:
+            key.append(
+                (kind, current.lhs.name, type(current.rhs), current.rhs)
+            )
+        elif kind is ast.In and type(current.lhs) is ast.Attribute and \
+                all(type(value) in LEAF_TYPES for value in current.sub_nodes):
+            key.append((
+                kind, current.lhs.name, current.not_,
+                tuple([(type(value), value) for value in current.sub_nodes])
+            ))
+        else:
+            key.append(canonical_key(current))
+
+    return tuple(key)
+
+
+def _translate(asts, field_mapping, field_default, options,
+               evaluator_class=ElasticsearchDictEvaluator):
+    evaluator = evaluator_class(field_mapping, field_default, **options)
+    # results by batch_key, so identical ASTs are translated once, and only
+    # their repeats are copied
+    translated = {}
+    queries = []
+
+    for node in asts:
+        key = batch_key(node)
+        query = translated.get(key)
+        if query is None:
+            query = translated[key] = evaluator.evaluate(node)
+        else:
+            query = copy_query(query)
+        queries.append(query)
+
+    return queries
+
+
+def _translate_chunk(args):
+    return _translate(*args)
+
+
+def to_dict_filters(asts, field_mapping=None, field_default=None,
+                    processes=None, chunksize=500, **options):
+    """ Translate many ASTs to Elasticsearch query dicts.
+
+        Identical ASTs in the batch, including ASTs parsed separately from
+        the same filter, are translated once, see :func:`batch_key`. Each
+        query returned is independent of the others.
+
+        :param asts: the abstract syntax trees
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param processes: Translate over a pool of this many processes. Leave
+        as `None` to translate in this process. Starting the processes and
+        pickling the ASTs and queries costs more than translating all but
+        very large batches.
+        :param chunksize: The number of ASTs each process translates at once.
+        :param options: Further evaluator options, such as ``filter_context``.
+        See :class:`.evaluate.ElasticsearchFilterEvaluator`.
+        :return: a list of query dicts, in the order of ``asts``
+    """
+    asts = list(asts)
+    resolver = FieldResolver.from_options(field_mapping, field_default)
+
+    if not processes or len(asts) <= chunksize:
+        return _translate(asts, resolver, None, options)
+
+    chunks = [
+        (asts[start:start + chunksize], resolver, None, options)
+        for start in range(0, len(asts), chunksize)
+    ]
+
+    queries = []
+    with ProcessPoolExecutor(processes) as executor:
+        for chunk in executor.map(_translate_chunk, chunks):
+            queries.extend(chunk)
+    return queries
+
+
+def to_filters(asts, field_mapping=None, field_default=None, processes=None,
+               chunksize=500, **options):
+    """ Translate many ASTs to ``elasticsearch_dsl`` Query objects.
+
+        Takes the same arguments as :func:`to_dict_filters`.
+
+        :return: a list of Query objects, in the order of ``asts``
+    """
+    asts = list(asts)
+
+    if not processes or len(asts) <= chunksize:
+        return _translate(
+            asts, FieldResolver.from_options(field_mapping, field_default),
+            None, options, ElasticsearchFilterEvaluator
+        )
+
+    return [
+        Q(query) for query in to_dict_filters(
+            asts, field_mapping, field_default, processes, chunksize, **options
+        )
+    ]
+
+
+def to_msearch(asts, field_mapping=None, field_default=None, index=None,
+               search=None, processes=None, chunksize=500, **options) -> str:
+    """ Translate many ASTs to the NDJSON body of an ``_msearch`` request.
+
+        :param asts: the abstract syntax trees
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :param index: The index for every search. Leave as `None` to use the
+        index of the ``_msearch`` request.
+        :param search: Further parameters of every search body, e.g.
+        ``{'size': 10}``
+        :param processes: Translate over a pool of this many processes.
+        :param chunksize: The number of ASTs each process translates at once.
+        :param options: Further evaluator options.
+        :return: the request body, a header line and a body line per AST
+    """
+    header = json.dumps({'index': index} if index else {})
+    lines = []
+
+    queries = to_dict_filters(
+        asts, field_mapping, field_default, processes, chunksize, **options
+    )
+    for query in queries:
+        lines.append(header)
+        lines.append(json.dumps(
+            {**(search or {}), 'query': query}, default=json_default
+        ))
+
+    return ''.join(f'{line}\n' for line in lines)
@@ -0,0 +1,237 @@
+# encoding: utf-8
+"""
+Translation cache
+
+An opt-in LRU cache for translated filters, keyed on a canonical form of the
+pygeofilter AST and the field mapping and options used to translate it.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, time, timedelta
+from string import Template
+from threading import Lock
+
+from elasticsearch_dsl.query import Query
+from pygeofilter import ast
+from pygeofilter import values
+
+from .evaluate import to_filter, to_dict_filter
+from .fields import FieldResolver
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+VALUE_CLASSES = (values.Geometry, values.Envelope, values.Interval)
+
+NODE_CLASSES = (ast.Node,) + VALUE_CLASSES
+
+LEAF_TYPES = frozenset((str, int, float, bool, type(None), date, timedelta))
+
+
+def canonical_key(node):
+    """ Create a canonical, hashable representation of an AST.
+
+        Two ASTs with the same structure and literal values produce equal
+        keys. Literal types are part of the key, so ``1``, ``1.0`` and
+        ``True`` are kept apart.
+
+        The key is a flat tuple of the nodes in pre-order, each node type
+        followed by its fields, and each literal type by its value, so
+        building and hashing it does not recurse however deep the AST is.
+
+        :param node: the AST, or a value within it
+        :return: a tuple
+    """
+    key = []
+    append = key.append
+    stack = [node]
+    pop = stack.pop
+    extend = stack.extend
+
+    while stack:
+        current = pop()
+        kind = type(current)
+        append(kind)
+
+        if kind in LEAF_TYPES:
+            append(current)
+
+        elif kind is datetime or kind is time:
+            # equal instants in different time zones translate differently
+            append(current.isoformat())
+
+        elif kind is list or kind is tuple:
+            append(len(current))
+            extend(reversed(current))
+
+        elif isinstance(current, dict):
+            names = sorted(current)
+            append(tuple(names))
+            extend(current[name] for name in reversed(names))
+
+        elif isinstance(current, NODE_CLASSES):
+            fields = vars(current)
+            append(tuple(fields))
+            extend(reversed(list(fields.values())))
+
+        else:
+            append(current)
+
+    return tuple(key)
+
+
+def mapping_key(field_mapping=None, field_default=None):
+    """ Create a hashable representation of the field mapping options.
+
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :return: a tuple
+    """
+    if isinstance(field_mapping, FieldResolver):
+        field_mapping = field_mapping.key
+
+    if isinstance(field_mapping, dict):
+        field_mapping = tuple(sorted(field_mapping.items()))
+
+    if isinstance(field_default, Template):
+        field_default = field_default.template
+
+    return field_mapping, field_default
+
+
+def _shallow_copy(value):
+    """A copy of a dict, list or Query object, or ``None`` for other values."""
+    kind = type(value)
+    if kind is dict:
+        return dict(value)
+    if kind is list:
+        return list(value)
+    if isinstance(value, Query):
+        copied = kind()
+        copied._params = dict(value._params)
+        return copied
+    return None
+
+
+def copy_query(query):
+    """ Copy the dicts, lists and Query objects of a query, sharing the leaf
+        values. The query is walked with an explicit stack, so copying does
+        not recurse however deep the query is.
+
+        :param query: the query dict or ``elasticsearch_dsl`` Query object
+        :return: an independent copy of the query
+    """
+    copied = _shallow_copy(query)
+    if copied is None:
+        return query
+
+    stack = [copied]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, Query):
+            current = current._params
+        if type(current) is dict:
+            items = current.items()
+        else:
+            items = enumerate(current)
+
+        for key, value in items:
+            child = _shallow_copy(value)
+            if child is not None:
+                current[key] = child
+                stack.append(child)
+
+    return copied
+
+
+class FilterCache:
+    """Thread safe LRU cache of translated filters.
+
+    Filters are stored as they are translated, query dicts or Query objects,
+    and every call returns a fresh copy, so callers may modify the result
+    without affecting the cached filter. The evaluator options are part of
+    the cache key.
+
+    :param maxsize: the number of filters to keep. ``None`` for no limit.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, translate, ast, field_mapping, field_default, options):
+        key = (
+            translate,
+            canonical_key(ast),
+            mapping_key(field_mapping, field_default),
+            canonical_key(options) if options else None
+        )
+
+        with self._lock:
+            query = self._cache.get(key)
+            if query is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return copy_query(query)
+            self.misses += 1
+
+        query = translate(ast, field_mapping, field_default, **options)
+
+        with self._lock:
+            self._cache[key] = query
+            self._cache.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+
+        return copy_query(query)
+
+    def to_filter(self, ast, field_mapping=None, field_default=None,
+                  **options):
+        """ Cached version of :func:`pygeofilter_elasticsearch.to_filter`.
+
+            :param ast: the abstract syntax tree
+            :param field_mapping: Lookup from field name to data model.
+            :param field_default: Default attribute value if not in lookup.
+            :param options: Further evaluator options.
+            :return: an ``elasticsearch_dsl`` Query object
+        """
+        return self._get(
+            to_filter, ast, field_mapping, field_default, options
+        )
+
+    def to_dict_filter(self, ast, field_mapping=None, field_default=None,
+                       **options):
+        """ Cached version of :func:`pygeofilter_elasticsearch.to_dict_filter`.
+
+            :param ast: the abstract syntax tree
+            :param field_mapping: Lookup from field name to data model.
+            :param field_default: Default attribute value if not in lookup.
+            :param options: Further evaluator options.
+            :return: a query dict
+        """
+        return self._get(
+            to_dict_filter, ast, field_mapping, field_default, options
+        )
+
+    def info(self):
+        """Report the cache statistics, as ``functools.lru_cache`` does."""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._cache)
+            )
+
+    def clear(self):
+        """Empty the cache and reset the statistics."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,192 @@
+# encoding: utf-8
+"""
+Clause ordering
+
+Order the clauses of the bool queries in a translated query dict by an
+estimated cost, cheapest first, and guard expensive filters behind cheap
+ones.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+QUERY_COSTS = {
+    'match_none': 0,
+    'match_all': 0,
+    'term': 1,
+    'ids': 1,
+    'terms': 2,
+    'exists': 2,
+    'range': 3,
+    'prefix': 4,
+    'wildcard': 5,
+    'regexp': 5,
+    'geo_bounding_box': 6,
+    'geo_distance': 6,
+    'geo_shape': 7,
+    'script': 9,
+}
+
+#: The cost of a query type which is not in :data:`QUERY_COSTS`.
+DEFAULT_COST = 5
+
+#: Filters of at least this cost are guarded by the cheaper filters.
+GUARD_COST = QUERY_COSTS['prefix']
+
+CLAUSES = ('filter', 'must', 'should', 'must_not')
+
+
+def _leaf(query: dict):
+    """The query type and body of a single query."""
+    (query_type, body), = query.items()
+    return query_type, body
+
+
+def selectivity(query: dict, field_cardinality: dict = None) -> float:
+    """ Estimate the fraction of documents a query matches, from the number
+        of distinct values of its field.
+
+        :param query: the query dict
+        :param field_cardinality: the number of distinct values by field
+        :return: the estimated fraction, ``1.0`` if unknown
+    """
+    if not field_cardinality or len(query) != 1:
+        return 1.0
+
+    query_type, body = _leaf(query)
+    if query_type not in ('term', 'terms') or not isinstance(body, dict) or \
+            len(body) != 1:
+        return 1.0
+
+    (field, value), = body.items()
+    cardinality = field_cardinality.get(field)
+    if not cardinality:
+        return 1.0
+
+    values = 1
+    if query_type == 'terms' and isinstance(value, list):
+        values = len(value)
+    return min(1.0, values / cardinality)
+
+
+def _bool_queries(query: dict) -> list:
+    """The bool queries in a query dict, each after the bool queries nested
+    in it."""
+    found = []
+    stack = [query]
+
+    while stack:
+        current = stack.pop()
+        if len(current) == 1 and 'bool' in current:
+            found.append(current)
+            stack.extend(
+                clause
+                for kind in CLAUSES for clause in current['bool'].get(kind, ())
+            )
+
+    found.reverse()
+    return found
+
+
+def _cost(query: dict, costs: dict) -> int:
+    """The cost of a query, looking up bool queries in ``costs`` by id."""
+    if id(query) in costs:
+        return costs[id(query)]
+    if len(query) != 1:
+        return DEFAULT_COST
+    return QUERY_COSTS.get(_leaf(query)[0], DEFAULT_COST)
+
+
+def _bool_cost(clauses: dict, costs: dict) -> int:
+    return max(
+        (
+            _cost(clause, costs)
+            for kind in CLAUSES for clause in clauses.get(kind, ())
+        ),
+        default=0
+    )
+
+
+def cost(query: dict) -> int:
+    """ Estimate the cost of a query. The cost of a bool query is that of its
+        most expensive clause.
+
+        :param query: the query dict
+        :return: the estimated cost
+    """
+    costs = {}
+    for current in _bool_queries(query):
+        costs[id(current)] = _bool_cost(current['bool'], costs)
+    return _cost(query, costs)
+
+
+def _order_bool(clauses: dict, costs: dict, ordered: dict,
+                field_cardinality: dict, guard: bool) -> dict:
+    """ Order the clauses of a bool query.
+
+        :param costs: the costs of the bool queries among its clauses, by id
+        :param ordered: the ordered bool queries among its clauses, by id
+    """
+    result = {}
+
+    for kind, value in clauses.items():
+        if kind not in CLAUSES:
+            result[kind] = value
+            continue
+
+        keyed = [
+            (
+                (
+                    _cost(clause, costs),
+                    selectivity(clause, field_cardinality)
+                ),
+                ordered.get(id(clause), clause)
+            )
+            for clause in value
+        ]
+        keyed.sort(key=lambda item: item[0])
+        result[kind] = [clause for _, clause in keyed]
+
+        if guard and kind == 'filter':
+            cheap = [
+                clause for (clause_cost, _), clause in keyed
+                if clause_cost < GUARD_COST
+            ]
+            expensive = [
+                clause for (clause_cost, _), clause in keyed
+                if clause_cost >= GUARD_COST
+            ]
+            if cheap and expensive:
+                if len(expensive) > 1 or 'bool' not in expensive[0]:
+                    expensive = [{'bool': {'filter': expensive}}]
+                result[kind] = cheap + expensive
+
+    return {'bool': result}
+
+
+def order_clauses(query: dict, field_cardinality: dict = None,
+                  guard: bool = True) -> dict:
+    """ Order the clauses of every bool query, cheapest and most selective
+        first. The order of the clauses does not change which documents
+        match, or their score.
+
+        :param query: the query dict
+        :param field_cardinality: the number of distinct values by field, to
+                                  put the most selective clauses first
+        :param guard: move the filters costing at least :data:`GUARD_COST`
+                      into a nested bool query after the cheaper filters
+        :return: the ordered query dict
+    """
+    # Order nested bool queries before the queries containing them, without
+    # recursing, so deep queries do not exceed the recursion limit.
+    costs = {}
+    ordered = {}
+    for current in _bool_queries(query):
+        costs[id(current)] = _bool_cost(current['bool'], costs)
+        ordered[id(current)] = _order_bool(
+            current['bool'], costs, ordered, field_cardinality, guard
+        )
+
+    return ordered.get(id(query), query)
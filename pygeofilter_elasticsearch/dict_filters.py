@@ -0,0 +1,346 @@
+# encoding: utf-8
+"""
+Dict Filters
+
+Mirror of :mod:`pygeofilter_elasticsearch.filters` which builds the
+Elasticsearch query DSL as plain dictionaries, rather than as
+``elasticsearch_dsl`` Query objects. The output of each function is equal to
+calling ``to_dict()`` on the result of its counterpart in ``filters``.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from datetime import datetime, timedelta
+
+from typing import List, Union, Tuple
+
+from . import geometry as geo
+from .filters import (
+    like_query, temporal_bounds, temporal_range, terms_query, OP_TO_COMP,
+    spatial_relation
+)
+
+# Functions which are the same for both kinds of query, re-exported so the
+# evaluator can use this module in place of ``filters``.
+from .optimise import optimise  # noqa: F401
+from .cost import order_clauses as order  # noqa: F401
+from .filters import attribute, literal, geometry  # noqa: F401
+
+
+def _is_bool(query: dict) -> bool:
+    return 'bool' in query
+
+
+def _finish(clauses: dict) -> dict:
+    """Wrap the clauses in a bool query, dropping any empty clause lists."""
+    return {
+        'bool': {key: value for key, value in clauses.items() if value != []}
+    }
+
+
+def _only_should(query: dict) -> bool:
+    if not _is_bool(query):
+        return False
+    clauses = query['bool']
+    return not any((
+        clauses.get('must'),
+        clauses.get('must_not'),
+        clauses.get('filter'),
+        'minimum_should_match' in clauses
+    ))
+
+
+def _min_should_match(clauses: dict) -> int:
+    if 'minimum_should_match' in clauses:
+        return clauses['minimum_should_match']
+    if not clauses.get('should') or clauses.get('must') or \
+            clauses.get('filter'):
+        return 0
+    return 1
+
+
+def _invert(query: dict) -> dict:
+    if query == {'match_all': {}}:
+        return {'match_none': {}}
+    if query == {'match_none': {}}:
+        return {'match_all': {}}
+
+    if not _is_bool(query):
+        return {'bool': {'must_not': [query]}}
+
+    clauses = query['bool']
+    must = clauses.get('must', [])
+    filter_ = clauses.get('filter', [])
+    should = clauses.get('should', [])
+    must_not = clauses.get('must_not', [])
+
+    # Because an empty bool query is treated like match_all the inverse
+    # should be match_none
+    if not any((must, filter_, should, must_not)):
+        return {'match_none': {}}
+
+    negations = [_invert(q) for q in must + filter_]
+    negations.extend(must_not)
+
+    if should and _min_should_match(clauses):
+        negations.append({'bool': {'must_not': list(should)}})
+
+    if len(negations) == 1:
+        return negations[0]
+    return {'bool': {'should': negations}}
+
+
+def match_all() -> dict:
+    """A filter which matches every document."""
+    return {'match_all': {}}
+
+
+def match_none() -> dict:
+    """A filter which matches no document."""
+    return {'match_none': {}}
+
+
+def combine(sub_filters: List[dict],
+            combinator: str = 'AND',
+            filter_context: bool = False) -> dict:
+    """ Combine filters using a logical combinator
+
+        All sub filters are merged into a single bool query in one pass, as
+        in :func:`pygeofilter_elasticsearch.filters.combine`.
+
+        :param sub_filters: the filters to combine
+        :param combinator: a string: "AND" / "OR"
+        :param filter_context: whether ANDed filters are placed in the
+                               non-required ``filter`` clause rather than
+                               ``must``
+
+        :return: the combined filter
+    """
+
+    for sub_filter in sub_filters:
+        assert isinstance(sub_filter, dict)
+
+    assert combinator in ('AND', 'OR')
+
+    if len(sub_filters) == 1:
+        return sub_filters[0]
+
+    if combinator == 'AND':
+        must, must_not, filter_ = [], [], []
+        required = filter_ if filter_context else must
+
+        for sub_filter in sub_filters:
+            clauses = sub_filter.get('bool')
+            if clauses is not None and not clauses.get('should') and \
+                    'minimum_should_match' not in clauses:
+                required.extend(clauses.get('must', ()))
+                must_not.extend(clauses.get('must_not', ()))
+                filter_.extend(clauses.get('filter', ()))
+            else:
+                required.append(sub_filter)
+
+        return _finish({'filter': filter_, 'must': must, 'must_not': must_not})
+
+    should = []
+
+    for sub_filter in sub_filters:
+        if _only_should(sub_filter):
+            should.extend(sub_filter['bool'].get('should', ()))
+        else:
+            should.append(sub_filter)
+
+    return {'bool': {'should': should}}
+
+
+def as_filter(sub_filter: dict) -> dict:
+    """ Place a filter in a non-scoring filter context, so Elasticsearch can
+        skip scoring and cache the results.
+
+        :param sub_filter: the filter to wrap
+        :return: a bool query without scoring clauses
+    """
+    assert isinstance(sub_filter, dict)
+
+    clauses = sub_filter.get('bool')
+    if clauses is not None and not clauses.get('must') and \
+            not clauses.get('should'):
+        return sub_filter
+    return {'bool': {'filter': [sub_filter]}}
+
+
+def compare(lhs, rhs, op):
+    assert isinstance(lhs, str)
+    assert op in OP_TO_COMP
+
+    comp = OP_TO_COMP[op]
+
+    if comp:
+        query_type, comparison = comp
+        return {query_type: {lhs: {comparison: rhs}}}
+
+    if op == '=':
+        return {'term': {lhs: rhs}}
+    return {'bool': {'must_not': [{'term': {lhs: rhs}}]}}
+
+
+def negate(sub_filter: dict) -> dict:
+    """ Negate a filter, opposing its meaning.
+
+        :param sub_filter: the filter to negate
+        :return: the negated filter
+    """
+    assert isinstance(sub_filter, dict)
+    return _invert(sub_filter)
+
+
+def between(lhs: str,
+            low: Union[str, int, float],
+            high: Union[str, int, float],
+            not_: bool = False) -> dict:
+    """ Create a filter to match elements that have a value within a certain
+        range.
+
+        :param lhs: the field to compare
+        :param low: the lower value of the range
+        :param high: the upper value of the range
+        :param not_: whether the range shall be inclusive (the default) or
+                     exclusive
+
+        :return: a comparison expression
+    """
+    assert isinstance(lhs, str)
+
+    q = {'range': {lhs: {'gte': low, 'lte': high}}}
+    return _invert(q) if not_ else q
+
+
+def like(lhs: str,
+         pattern: str,
+         wildcard: str,
+         singlechar: str,
+         escapechar: str,
+         not_: bool = False,
+         nocase: bool = False,
+         ) -> dict:
+    """ Create a filter to filter elements according to a string attribute
+        using wildcard expressions.
+
+        :param lhs: the field to compare
+        :param pattern: the wildcard pattern
+        :param wildcard: the wildcard character used in ``pattern``
+        :param singlechar: the single character wildcard used in ``pattern``
+        :param escapechar: the escape character used in ``pattern``
+        :param not_: whether the match shall be negated
+        :param nocase: whether the match shall be case insensitive
+
+        :return: a comparison expression
+    """
+    assert isinstance(lhs, str)
+    assert isinstance(pattern, str)
+
+    query_type, value = like_query(pattern, wildcard, singlechar, escapechar)
+
+    if nocase:
+        value = {'value': value, 'case_insensitive': True}
+
+    q = {query_type: {lhs: value}}
+
+    return _invert(q) if not_ else q
+
+
+def contains(lhs: str,
+             items: Tuple,
+             not_: bool = False,
+             max_terms: int = None,
+             terms_lookup=None) -> dict:
+    """ Create a filter to match elements attribute to be in a list of choices.
+
+        :param lhs: the field to compare
+        :param items: a list of choices
+        :param not_: whether the range shall be inclusive (the default) or
+                     exclusive
+        :param max_terms: the most choices to inline in one ``terms`` query.
+                          See
+                          :func:`pygeofilter_elasticsearch.filters.terms_query`.
+        :param terms_lookup: store longer lists and look them up. See
+                             :func:`pygeofilter_elasticsearch.filters.terms_query`.
+        :return: a comparison expression
+    """
+    assert isinstance(lhs, str)
+
+    q = terms_query(lhs, list(items), max_terms, terms_lookup)
+    return _invert(q) if not_ else q
+
+
+def spatial(lhs, rhs, op: str, bounding_box: bool = False) -> dict:
+    """ Create a spatial filter for the given spatial attribute.
+
+        :param lhs: the field to compare, or the shape if ``rhs`` is the field
+        :param rhs: the shape, as prepared by :func:`geometry`
+        :param op: the spatial operation. one of ``"INTERSECTS"``,
+                   ``"DISJOINT"``, ``"WITHIN"``, ``"CONTAINS"``.
+        :param bounding_box: use a ``geo_bounding_box`` query for envelopes
+                             which are tested for intersection
+        :return: a comparison expression
+    """
+    lhs, shape, relation = spatial_relation(lhs, rhs, op)
+
+    if bounding_box and relation == 'intersects' and \
+            shape.get('type') == 'envelope':
+        return {'geo_bounding_box': {lhs: geo.bounding_box(shape)}}
+
+    return {'geo_shape': {lhs: {'shape': shape, 'relation': relation}}}
+
+
+def bbox(lhs: str,
+         minx: float,
+         miny: float,
+         maxx: float,
+         maxy: float,
+         crs: str = None,
+         bounding_box: bool = False,
+         precision: int = None) -> dict:
+    """ Create a bounding box filter for the given spatial attribute.
+
+        :param lhs: the field to compare
+        :param minx: the lower x part of the bbox
+        :param miny: the lower y part of the bbox
+        :param maxx: the upper x part of the bbox
+        :param maxy: the upper y part of the bbox
+        :param crs: the CRS of the bbox. Elasticsearch only supports WGS84
+        :param bounding_box: use a ``geo_bounding_box`` query
+        :param precision: round the bbox outwards to this many decimal places
+        :return: a comparison expression
+    """
+    shape = geo.envelope(minx, miny, maxx, maxy)
+    if precision is not None:
+        shape = geo.round_coordinates(shape, precision)
+    return spatial(lhs, shape, 'INTERSECTS', bounding_box)
+
+
+def temporal(lhs: str,
+             time_or_period: Union['datetime', Tuple['datetime'],
+                                   Tuple['datetime', 'timedelta']],
+             op: str,
+             granularity: Union[str, 'timedelta'] = None) -> dict:
+    """ Create a temporal filter for the given temporal attribute.
+
+        :param lhs: the field to compare
+        :param time_or_period: the time instant or time span to use as a filter
+        :param op: the comparison operation. one of ``"BEFORE"``,
+                   ``"BEFORE OR DURING"``, ``"DURING"``, ``"DURING OR AFTER"``,
+                   ``"AFTER"``, ``"TEQUALS"``.
+        :param granularity: round the bounds outwards to this granularity.
+                            See :func:`.filters.temporal_range`.
+        :return: a comparison expression
+    """
+    assert isinstance(lhs, str)
+
+    bounds = temporal_range(*temporal_bounds(time_or_period, op), granularity)
+
+    if not bounds:
+        return match_all()
+    return {'range': {lhs: bounds}}
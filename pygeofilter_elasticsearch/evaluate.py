@@ -8,38 +8,347 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
+from functools import partial
+from time import perf_counter
+
 from pygeofilter.backends.evaluator import Evaluator, handle
-from . import filters
+from . import filters, dict_filters, fold
+from .fields import FieldResolver, IndexMapping
+from .filters import TEMPORAL_OPS
+from .trace import TranslationTrace, query_shape, query_size
 from pygeofilter import ast
 from pygeofilter import values
 
+LITERAL_TYPES = frozenset(values.LITERALS)
+
+
+def flatten_combination(node):
+    """ Collect the operands of a run of same operator combinations.
+
+        :param node: an ``ast.And`` or ``ast.Or`` node
+        :return: the operands of the run, in their original order
+    """
+    node_type = type(node)
+    operands = []
+    stack = [node]
+
+    while stack:
+        current = stack.pop()
+        if type(current) is node_type:
+            stack.append(current.rhs)
+            stack.append(current.lhs)
+        else:
+            operands.append(current)
+
+    return operands
+
+
+def get_sub_nodes(node):
+    """ The sub-nodes of an AST node, whose results are passed to its handler.
+
+        :param node: the AST node
+        :return: a list of sub-nodes, flattening runs of ``AND`` / ``OR`` nodes
+    """
+    if isinstance(node, ast.Combination):
+        return flatten_combination(node)
+
+    if not hasattr(node, 'get_sub_nodes'):
+        return []
+
+    sub_nodes = node.get_sub_nodes()
+    if not sub_nodes:
+        return []
+    if isinstance(sub_nodes, list):
+        return sub_nodes
+    return [sub_nodes]
+
 
 class ElasticsearchFilterEvaluator(Evaluator):
-    """Filter evaluator for Elasticsearch."""
+    """Filter evaluator for Elasticsearch.
+
+    :param field_mapping: Lookup from field name to data model, or a
+    :class:`pygeofilter_elasticsearch.fields.FieldResolver` to reuse its
+    compiled field resolution across filters.
+    :param field_default: Default attribute value if not in lookup.
+    :param filter_context: Filter mode. Place every predicate in the
+    non-scoring ``bool.filter`` / ``bool.must_not`` clauses, so results
+    can be cached by Elasticsearch and scoring is skipped.
+    :param simplify_tolerance: Simplify geometries with this tolerance, in
+    coordinate units.
+    :param max_vertices: Simplify geometries with more vertices than this.
+    :param bounding_box: Use ``geo_bounding_box`` queries for rectangles
+    tested for intersection, for ``geo_point`` fields.
+    :param optimise: Rewrite the produced query into an equivalent, cheaper
+    query. See :func:`pygeofilter_elasticsearch.optimise.optimise`.
+    :param index_mapping: The Elasticsearch index mapping, or an
+    :class:`pygeofilter_elasticsearch.fields.IndexMapping`. Exact matches on
+    ``text`` fields use their ``keyword`` sub-field, literals are converted
+    to the type of their field, date equality becomes an exact range and
+    comparisons no document can satisfy become ``match_none``.
+    :param temporal_granularity: Round the bounds of temporal comparisons
+    outwards to this granularity, a ``timedelta`` or one of ``"s"``, ``"m"``,
+    ``"h"``, ``"d"``, and emit them as ISO strings. Nearby time windows then
+    give identical queries, which Elasticsearch can cache.
+    :param order_clauses: Order the clauses of the produced query by their
+    estimated cost, and guard expensive filters behind cheap ones. See
+    :func:`pygeofilter_elasticsearch.cost.order_clauses`.
+    :param field_cardinality: The number of distinct values by field, to
+    order equally costly clauses by their selectivity.
+    :param max_terms: The most choices of an ``IN`` list to inline in one
+    ``terms`` query. Longer lists are deduplicated, sorted and split into a
+    ``bool.should`` of ``terms`` queries, or looked up with ``terms_lookup``.
+    :param terms_lookup: A function of the field and the choices of a long
+    ``IN`` list which stores the choices in a document and returns the
+    ``terms`` lookup, e.g. ``{'index': 'lists', 'id': '1', 'path': 'values'}``.
+    :param tracer: A :class:`pygeofilter_elasticsearch.trace.Tracer` to record
+    the time spent on each node type and the shape and size of each query.
+    Leave as `None` to measure nothing.
+    :param coordinate_precision: Round geometry coordinates to this many
+    decimal places, to shorten the query. Bounding boxes are rounded
+    outwards. 6 decimal places of degrees are about 0.1m.
+    """
+
+    filters = filters
+
+    #: Fold predicates between literals into ``match_all`` / ``match_none``,
+    #: and simplify the combinations and negations around them.
+    fold_constants = True
 
-    def __init__(self, field_mapping, field_default):
+    #: Nesting depth past which sub-trees are evaluated with an explicit
+    #: stack rather than by recursion.
+    max_depth = 100
+
+    def __init__(self, field_mapping, field_default, filter_context=False,
+                 simplify_tolerance=None, max_vertices=None,
+                 bounding_box=False, optimise=False, index_mapping=None,
+                 temporal_granularity=None, order_clauses=False,
+                 field_cardinality=None, max_terms=None, terms_lookup=None,
+                 tracer=None, coordinate_precision=None):
         self.field_mapping = field_mapping
         self.field_default = field_default
+        self.resolver = FieldResolver.from_options(
+            field_mapping, field_default
+        )
+        self.filter_context = filter_context
+        self.simplify_tolerance = simplify_tolerance
+        self.max_vertices = max_vertices
+        self.bounding_box = bounding_box
+        self.optimise = optimise
+        self.index_mapping = IndexMapping.from_options(index_mapping)
+        self.temporal_granularity = temporal_granularity
+        self.order_clauses = order_clauses
+        self.field_cardinality = field_cardinality
+        self.max_terms = max_terms
+        self.terms_lookup = terms_lookup
+        self.tracer = tracer
+        self.coordinate_precision = coordinate_precision
+
+    def evaluate(self, node, adopt_result=True):
+        """Evaluate the AST. A run of same operator ``AND`` / ``OR`` nodes is
+        treated as a single combination of all of their operands. Sub-trees
+        nested deeper than :attr:`max_depth` are evaluated with an explicit
+        stack instead of recursion, so deep trees do not exceed the Python
+        recursion limit.
+        """
+        tracer = self.tracer
+        if tracer is None:
+            result = self._evaluate(node, self.handler_map, self.adopt, 0)
+        else:
+            # time the handlers through wrappers, so evaluation is unchanged
+            # when no tracer is used
+            timings = {}
+            started = perf_counter()
+            handler_map, adopt = self.timed_handlers(timings)
+            result = self._evaluate(node, handler_map, adopt, 0)
+
+        if not adopt_result:
+            return result
+
+        result = self.adopt_result(result)
+        if tracer is not None:
+            self.trace(result, timings, perf_counter() - started)
+        return result
+
+    def _evaluate(self, node, handler_map, adopt, depth):
+        if type(node) in LITERAL_TYPES:
+            # literals have no sub-nodes
+            handler = handler_map.get(type(node))
+            return handler(self, node) if handler is not None else adopt(node)
+
+        if depth >= self.max_depth:
+            return self._walk(node, handler_map, adopt)
+
+        depth += 1
+        sub_args = [
+            self._evaluate(sub_node, handler_map, adopt, depth)
+            for sub_node in get_sub_nodes(node)
+        ]
+
+        handler = handler_map.get(type(node))
+        if handler is not None:
+            return handler(self, node, *sub_args)
+        return adopt(node, *sub_args)
+
+    def _walk(self, node, handler_map, adopt):
+        results = []
+        # (node, None) is a node still to expand, (node, n) a node whose n
+        # sub-node results are on top of the results stack
+        stack = [(node, None)]
+
+        while stack:
+            current, count = stack.pop()
+
+            if count is None:
+                sub_nodes = get_sub_nodes(current)
+                stack.append((current, len(sub_nodes)))
+                stack.extend(
+                    (sub_node, None) for sub_node in reversed(sub_nodes)
+                )
+                continue
+
+            if count:
+                sub_args = results[-count:]
+                del results[-count:]
+            else:
+                sub_args = ()
+
+            handler = handler_map.get(type(current))
+            if handler is not None:
+                result = handler(self, current, *sub_args)
+            else:
+                result = adopt(current, *sub_args)
+
+            results.append(result)
+
+        result, = results
+        return result
+
+    def timed_handlers(self, timings):
+        """ Wrap the handlers to add their call count and time to
+            ``timings`` by node type name.
+
+            :param timings: the ``[count, seconds]`` by node type name
+            :return: the wrapped handler map and ``adopt`` method
+        """
+        def timed(handler):
+            def call(*args):
+                started = perf_counter()
+                try:
+                    return handler(*args)
+                finally:
+                    totals = timings.setdefault(
+                        type(args[1]).__name__, [0, 0.0]
+                    )
+                    totals[0] += 1
+                    totals[1] += perf_counter() - started
+            return call
+
+        handler_map = {
+            node_type: timed(handler)
+            for node_type, handler in self.handler_map.items()
+        }
+        return handler_map, partial(timed(type(self).adopt), self)
+
+    def trace(self, result, timings, seconds):
+        """Record the measurements of a translation with the tracer."""
+        query = result.to_dict() if hasattr(result, 'to_dict') else result
+        clauses, depth = query_shape(query)
+        self.tracer.record(TranslationTrace(
+            timings, seconds, clauses, depth, query_size(query)
+        ))
+
+    def coerce(self, field, value, exact=True):
+        """Convert a literal to the type of its field, if an index mapping
+        is used. Raises ``ValueError`` if the field cannot hold the value."""
+        if self.index_mapping is None:
+            return value
+        return self.index_mapping.coerce(field, value, exact)
+
+    def literal_only(self, *nodes) -> bool:
+        """Whether a predicate on these sub-nodes can be folded, because
+        none of them is an attribute or other expression."""
+        return self.fold_constants and \
+            not any(isinstance(node, ast.Node) for node in nodes)
+
+    def constant(self, value):
+        """The filter for a predicate which is always ``value``."""
+        return self.filters.match_all() if value else self.filters.match_none()
+
+    def unsatisfiable(self, not_=False):
+        """The filter for a comparison no document can satisfy."""
+        return self.filters.match_all() if not_ else self.filters.match_none()
+
+    def adopt_result(self, result):
+        if self.filter_context:
+            result = self.filters.as_filter(result)
+        if self.optimise:
+            result = self.filters.optimise(result)
+        if self.order_clauses:
+            result = self.filters.order(result, self.field_cardinality)
+        return result
 
     @handle(ast.Not)
     def not_(self, node, sub):
-        return filters.negate(sub)
+        return self.filters.negate(sub)
 
     @handle(ast.And, ast.Or)
-    def combination(self, node, lhs, rhs):
-        return filters.combine((lhs, rhs), node.op.value)
+    def combination(self, node, *sub_filters):
+        op = node.op.value
+
+        if self.fold_constants:
+            # match_none decides an AND and match_all an OR, the other one
+            # can be dropped
+            match_all = self.filters.match_all()
+            match_none = self.filters.match_none()
+            if op == 'AND':
+                decisive, neutral = match_none, match_all
+            else:
+                decisive, neutral = match_all, match_none
+
+            if any(sub_filter == decisive for sub_filter in sub_filters):
+                return decisive
+            sub_filters = [
+                sub_filter for sub_filter in sub_filters
+                if sub_filter != neutral
+            ]
+            if not sub_filters:
+                return neutral
+
+        return self.filters.combine(sub_filters, op, self.filter_context)
 
     @handle(ast.Comparison, subclasses=True)
     def comparison(self, node, lhs, rhs):
-        return filters.compare(
+        op = node.op.value
+        if self.literal_only(node.lhs, node.rhs):
+            return self.constant(fold.compare(lhs, rhs, op))
+
+        try:
+            rhs = self.coerce(lhs, rhs, exact=op in ('=', '<>'))
+        except ValueError:
+            return self.unsatisfiable(op == '<>')
+
+        if op in ('=', '<>') and self.index_mapping is not None and \
+                self.index_mapping.is_date(lhs):
+            return self.filters.between(lhs, rhs, rhs, op == '<>')
+
+        return self.filters.compare(
             lhs,
             rhs,
-            node.op.value
+            op
         )
 
     @handle(ast.Between)
     def between(self, node, lhs, low, high):
-        return filters.between(
+        if self.literal_only(node.lhs, node.low, node.high):
+            return self.constant(fold.between(lhs, low, high, node.not_))
+
+        try:
+            low = self.coerce(lhs, low, exact=False)
+            high = self.coerce(lhs, high, exact=False)
+        except ValueError:
+            return self.unsatisfiable(node.not_)
+
+        return self.filters.between(
             lhs,
             low,
             high,
@@ -48,54 +357,142 @@ class ElasticsearchFilterEvaluator(Evaluator):
 
     @handle(ast.Attribute)
     def attribute(self, node):
-        return filters.attribute(node.name, self.field_mapping, self.field_default)
+        field = self.resolver(node.name)
+        if self.index_mapping is not None:
+            return self.index_mapping.exact_field(field)
+        return field
 
     @handle(*values.LITERALS)
     def literal(self, node):
-        return filters.literal(node)
+        return self.filters.literal(node)
 
     @handle(ast.Like)
     def like(self, node, lhs):
-        return filters.like(
+        return self.filters.like(
             lhs,
             node.pattern,
             node.wildcard,
             node.singlechar,
             node.escapechar,
-            node.not_
+            node.not_,
+            node.nocase
         )
 
     @handle(ast.In)
     def in_(self, node, lhs, *options):
-        return filters.contains(
+        if self.literal_only(node.lhs, *node.sub_nodes):
+            return self.constant(fold.contains(lhs, options, node.not_))
+
+        if self.index_mapping is not None:
+            coerced = []
+            for option in options:
+                try:
+                    coerced.append(self.coerce(lhs, option))
+                except ValueError:
+                    pass
+            if not coerced:
+                return self.unsatisfiable(node.not_)
+            options = tuple(coerced)
+
+        return self.filters.contains(
             lhs,
             options,
-            node.not_
+            node.not_,
+            self.max_terms,
+            self.terms_lookup
         )
 
     @handle(ast.TemporalPredicate, subclasses=True)
     def temporal(self, node, lhs, rhs):
-        return filters.temporal(
+        if self.literal_only(node.lhs, node.rhs) and fold.is_time(lhs) and \
+                node.op.value in TEMPORAL_OPS:
+            return self.constant(fold.temporal(lhs, rhs, node.op.value))
+
+        return self.filters.temporal(
             lhs,
             rhs,
-            node.op.value
+            node.op.value,
+            self.temporal_granularity
         )
 
     @handle(ast.SpatialComparisonPredicate, subclasses=True)
     def spatial_operation(self, node, lhs, rhs):
-        ...
+        return self.filters.spatial(
+            lhs,
+            rhs,
+            node.op.value,
+            self.bounding_box
+        )
 
     @handle(ast.BBox)
     def bbox(self, node, lhs):
-        ...
+        return self.filters.bbox(
+            lhs,
+            node.minx,
+            node.miny,
+            node.maxx,
+            node.maxy,
+            node.crs,
+            self.bounding_box,
+            self.coordinate_precision
+        )
+
+    @handle(values.Interval)
+    def interval(self, node, start, end):
+        return start, end
+
+    @handle(type(None))
+    def none(self, node):
+        return None
+
+    @handle(values.Geometry, values.Envelope)
+    def geometry(self, node):
+        return self.filters.geometry(
+            node,
+            self.simplify_tolerance,
+            self.max_vertices,
+            self.coordinate_precision
+        )
 
 
-def to_filter(ast, field_mapping=None, field_default=None):
+def to_filter(ast, field_mapping=None, field_default=None, **options):
     """ Helper function to translate AST to Django Query expressions.
 
         :param ast: the abstract syntax tree
         :param field_mapping: Lookup from field name to data model.
         :param field_default: Default attribute value if not in lookup.
         Leave as `None` to use the field name as the default.
+        :param options: Further evaluator options, such as ``filter_context``.
+        See :class:`ElasticsearchFilterEvaluator`.
+    """
+    evaluator = ElasticsearchFilterEvaluator(
+        field_mapping, field_default, **options
+    )
+    return evaluator.evaluate(ast)
+
+
+class ElasticsearchDictEvaluator(ElasticsearchFilterEvaluator):
+    """Filter evaluator for Elasticsearch producing plain query dicts.
+
+    Skips building ``elasticsearch_dsl`` Query objects, so the result can be
+    handed straight to the Elasticsearch client.
+    """
+
+    filters = dict_filters
+
+
+def to_dict_filter(ast, field_mapping=None, field_default=None, **options):
+    """ Helper function to translate AST directly to an Elasticsearch query
+        dict. The result is equal to ``to_filter(ast).to_dict()``.
+
+        :param ast: the abstract syntax tree
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param options: Further evaluator options, such as ``filter_context``.
+        See :class:`ElasticsearchFilterEvaluator`.
     """
-    return ElasticsearchFilterEvaluator(field_mapping, field_default).evaluate(ast)
+    evaluator = ElasticsearchDictEvaluator(
+        field_mapping, field_default, **options
+    )
+    return evaluator.evaluate(ast)
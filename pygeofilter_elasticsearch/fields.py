@@ -0,0 +1,283 @@
+# encoding: utf-8
+"""
+Field resolution
+
+Compile a field mapping, default field template and wildcard rules once into
+a resolver which the evaluator reuses, rather than expanding the default
+template for every attribute of every filter.
+
+Optionally, use the Elasticsearch index mapping to query fields the way they
+are indexed.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import re
+from datetime import date, datetime
+from string import Template
+
+
+def _template(value):
+    return value if isinstance(value, Template) else Template(value)
+
+
+def compile_rule(pattern: str) -> 're.Pattern':
+    """ Compile a wildcard rule pattern. ``*`` matches any run of characters,
+        everything else matches literally.
+
+        :param pattern: the rule pattern, e.g. ``properties.*``
+        :return: a compiled regular expression
+    """
+    parts = (re.escape(part) for part in pattern.split('*'))
+    return re.compile('(.*)'.join(parts) + r'\Z')
+
+
+class FieldResolver:
+    """Resolves attribute names to Elasticsearch fields.
+
+    Names are looked up in the field mapping first, then matched against the
+    rules in order, then expanded with the default template. Resolved names
+    are memoised, so reuse one resolver across filters to share the work.
+
+    :param field_mapping: Lookup from field name to data model.
+    :param field_default: Default attribute value if not in lookup, a
+    ``string.Template`` or string using ``$name``. Leave as `None` to use the
+    field name as the default.
+    :param rules: Wildcard rules, a dict from pattern to template, tried in
+    order for names which are not in the mapping. ``*`` in the pattern
+    matches any characters. The template may use ``$name`` for the full name
+    and ``$match`` for the text matched by the first ``*``.
+    e.g. ``{'eo:*': 'properties.eo.$match'}``
+    :param maxsize: The number of resolved names to memoise.
+    """
+
+    def __init__(self, field_mapping=None, field_default=None, rules=None,
+                 maxsize=4096):
+        self.table = dict(field_mapping or {})
+        self.field_default = \
+            _template(field_default) if field_default else None
+        self.rules = [
+            (pattern, compile_rule(pattern), _template(template))
+            for pattern, template in (rules or {}).items()
+        ]
+        self.maxsize = maxsize
+        self._resolved = dict(self.table)
+
+    @classmethod
+    def from_options(cls, field_mapping=None, field_default=None):
+        """ Build a resolver from the evaluator's ``field_mapping`` and
+            ``field_default`` options, returning a resolver given as the
+            field mapping as it is.
+
+            :param field_mapping: Lookup from field name to data model, or a
+                                  :class:`FieldResolver`
+            :param field_default: Default attribute value if not in lookup.
+            :return: a :class:`FieldResolver`
+        """
+        if isinstance(field_mapping, cls):
+            assert field_default is None, \
+                'field_default cannot be used with a FieldResolver'
+            return field_mapping
+
+        return cls(field_mapping, field_default)
+
+    @property
+    def key(self):
+        """A hashable representation of the resolver configuration."""
+        return (
+            tuple(sorted(self.table.items())),
+            self.field_default.template if self.field_default else None,
+            tuple(
+                (pattern, template.template)
+                for pattern, _, template in self.rules
+            )
+        )
+
+    def resolve(self, name: str) -> str:
+        """ Resolve an attribute name to its Elasticsearch field.
+
+            :param name: the attribute name
+            :return: the field
+        """
+        try:
+            return self._resolved[name]
+        except KeyError:
+            field = self._expand(name)
+
+        if len(self._resolved) < self.maxsize + len(self.table):
+            self._resolved[name] = field
+
+        return field
+
+    __call__ = resolve
+
+    def _expand(self, name):
+        for _, regex, template in self.rules:
+            match = regex.match(name)
+            if match:
+                return template.substitute(
+                    name=name,
+                    match=match.group(1) if regex.groups else ''
+                )
+
+        if self.field_default:
+            return self.field_default.substitute(name=name) or name
+
+        return name
+
+
+KEYWORD_TYPES = {'keyword', 'constant_keyword', 'wildcard'}
+INTEGER_TYPES = {'long', 'integer', 'short', 'byte', 'unsigned_long'}
+FLOAT_TYPES = {'double', 'float', 'half_float', 'scaled_float'}
+DATE_TYPES = {'date', 'date_nanos'}
+
+
+def _mapping_properties(mapping: dict) -> dict:
+    """The top level ``properties`` of an index mapping, as returned by the
+    get mapping API for one index, its ``mappings`` or its ``properties``."""
+    if 'properties' not in mapping and 'mappings' not in mapping and \
+            len(mapping) == 1:
+        mapping = next(iter(mapping.values()))
+    mapping = mapping.get('mappings', mapping)
+    return mapping.get('properties', {})
+
+
+def _to_int(value, exact):
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, float) and exact:
+        raise ValueError(f'{value} is not an integer')
+    return value
+
+
+def _to_date(value):
+    if isinstance(value, str):
+        try:
+            if 'T' not in value and ' ' not in value:
+                # keep date-only values as dates, which Elasticsearch rounds
+                # to the whole day, e.g. ``lte`` to the end of the day
+                return date.fromisoformat(value)
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            # date math, or a custom date format of the field
+            return value
+    return value
+
+
+class IndexMapping:
+    """Field types of an Elasticsearch index mapping, used to pick the query
+    and literal types which match how a field is indexed.
+
+    :param mapping: the index mapping, as returned by the get mapping API
+    for one index, or its ``mappings`` or ``properties``
+    """
+
+    def __init__(self, mapping: dict):
+        self.fields = {}
+        self.exact_fields = {}
+
+        stack = [('', _mapping_properties(mapping))]
+        while stack:
+            prefix, properties = stack.pop()
+            for name, spec in properties.items():
+                path = f'{prefix}{name}'
+                self.fields[path] = spec.get(
+                    'type', 'object' if 'properties' in spec else None
+                )
+
+                if 'properties' in spec:
+                    stack.append((f'{path}.', spec['properties']))
+
+                sub_fields = spec.get('fields', {})
+                for sub_name, sub_spec in sub_fields.items():
+                    self.fields[f'{path}.{sub_name}'] = sub_spec.get('type')
+
+                if self.fields[path] == 'text':
+                    keywords = [
+                        sub_name for sub_name, sub_spec in sub_fields.items()
+                        if sub_spec.get('type') in KEYWORD_TYPES
+                    ]
+                    if keywords:
+                        sub_name = 'keyword' if 'keyword' in keywords \
+                            else keywords[0]
+                        self.exact_fields[path] = f'{path}.{sub_name}'
+
+    @classmethod
+    def from_options(cls, index_mapping=None):
+        """ Build an index mapping from the evaluator's ``index_mapping``
+            option, returning an :class:`IndexMapping` as it is.
+
+            :param index_mapping: the index mapping dict, or an
+                                  :class:`IndexMapping`
+            :return: an :class:`IndexMapping`, or ``None``
+        """
+        if index_mapping is None or isinstance(index_mapping, cls):
+            return index_mapping
+        return cls(index_mapping)
+
+    def field_type(self, field: str):
+        """ The mapped type of a field.
+
+            :param field: the Elasticsearch field
+            :return: the type, or ``None`` if the field is not mapped
+        """
+        return self.fields.get(field)
+
+    def exact_field(self, field: str) -> str:
+        """ The field to use for exact matches, the ``keyword`` sub-field of a
+            ``text`` field or the field itself.
+
+            :param field: the Elasticsearch field
+            :return: the field to query
+        """
+        return self.exact_fields.get(field, field)
+
+    def is_date(self, field: str) -> bool:
+        return self.fields.get(field) in DATE_TYPES
+
+    def coerce(self, field: str, value, exact: bool = True):
+        """ Convert a literal to the type of a field.
+
+            :param field: the Elasticsearch field
+            :param value: the literal value
+            :param exact: whether the value is matched exactly, rather than
+                          used as a range bound
+            :return: the converted value
+            :raises ValueError: if no document can hold the value in the field
+        """
+        field_type = self.fields.get(field)
+        if field_type is None or not isinstance(value, (str, int, float)):
+            return value
+
+        if field_type in KEYWORD_TYPES:
+            if isinstance(value, bool):
+                return 'true' if value else 'false'
+            return str(value)
+
+        if field_type in INTEGER_TYPES or field_type in FLOAT_TYPES:
+            if isinstance(value, bool):
+                raise ValueError(f'{value} is not a number')
+            if field_type in FLOAT_TYPES:
+                return float(value) if isinstance(value, str) else value
+            return _to_int(value, exact)
+
+        if field_type == 'boolean':
+            if isinstance(value, bool):
+                return value
+            if value in ('true', 'false'):
+                return value == 'true'
+            raise ValueError(f'{value} is not a boolean')
+
+        if field_type in DATE_TYPES:
+            return _to_date(value)
+
+        return value
@@ -8,16 +8,20 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
+import elasticsearch_dsl.query
 from elasticsearch_dsl import Q
-from elasticsearch_dsl.query import Query
-from operator import and_, or_
-from functools import reduce
-from datetime import datetime, timedelta
+from elasticsearch_dsl.query import Query, Bool
+from datetime import datetime, timedelta, timezone
 
 from typing import List, Union, Tuple
 
+from . import geometry as geo
+from .optimise import optimise as optimise_query
+from .cost import order_clauses
 
-def attribute(name: str, field_mapping: dict = None, field_default=None) -> str:
+
+def attribute(name: str, field_mapping: dict = None,
+              field_default=None) -> str:
     """Create an attribute lookup expression using a field mapping dictionary.
 
     :param name: the field name to filter
@@ -42,11 +46,31 @@ def literal(value):
     return value
 
 
-def combine(sub_filters: List['elasticsearch_dsl.query.Query'], combinator: str = 'AND') -> 'elasticsearch_dsl.query.Q':
+def match_all() -> 'elasticsearch_dsl.query.Query':
+    """A filter which matches every document."""
+    return Q('match_all')
+
+
+def match_none() -> 'elasticsearch_dsl.query.Query':
+    """A filter which matches no document."""
+    return Q('match_none')
+
+
+def combine(sub_filters: List['elasticsearch_dsl.query.Query'],
+            combinator: str = 'AND',
+            filter_context: bool = False) -> 'elasticsearch_dsl.query.Q':
     """ Combine filters using a logical combinator
 
+        All sub filters are merged into a single bool query in one pass. Bool
+        sub filters which can be merged without changing their meaning have
+        their clauses lifted into the combined query, so a run of same
+        operator combinations produces a flat clause list.
+
         :param sub_filters: the filters to combine
         :param combinator: a string: "AND" / "OR"
+        :param filter_context: whether ANDed filters are placed in the
+                               non-required ``filter`` clause rather than
+                               ``must``
 
         :return: the combined filter
     """
@@ -56,9 +80,76 @@ def combine(sub_filters: List['elasticsearch_dsl.query.Query'], combinator: str
 
     assert combinator in ('AND', 'OR')
 
-    op = and_ if combinator == "AND" else or_
+    if len(sub_filters) == 1:
+        return sub_filters[0]
+
+    if combinator == 'AND':
+        must, must_not, filter_ = [], [], []
+        required = filter_ if filter_context else must
+
+        for sub_filter in sub_filters:
+            if isinstance(sub_filter, Bool) and not sub_filter.should and \
+                    'minimum_should_match' not in sub_filter._params:
+                required.extend(sub_filter.must)
+                must_not.extend(sub_filter.must_not)
+                filter_.extend(sub_filter.filter)
+            else:
+                required.append(sub_filter)
+
+        return Bool(must=must, must_not=must_not, filter=filter_)
 
-    return reduce(lambda acc, q: op(acc, q) if acc else q, sub_filters)
+    should = []
+
+    for sub_filter in sub_filters:
+        if isinstance(sub_filter, Bool) and not any((
+                sub_filter.must,
+                sub_filter.must_not,
+                sub_filter.filter,
+                'minimum_should_match' in sub_filter._params)):
+            should.extend(sub_filter.should)
+        else:
+            should.append(sub_filter)
+
+    return Bool(should=should)
+
+
+def as_filter(sub_filter: 'elasticsearch_dsl.query.Query',
+              ) -> 'elasticsearch_dsl.query.Query':
+    """ Place a filter in a non-scoring filter context, so Elasticsearch can
+        skip scoring and cache the results.
+
+        :param sub_filter: the filter to wrap
+        :return: a bool query without scoring clauses
+    """
+    assert isinstance(sub_filter, Query)
+
+    if isinstance(sub_filter, Bool) and not sub_filter.must and \
+            not sub_filter.should:
+        return sub_filter
+    return Bool(filter=[sub_filter])
+
+
+def optimise(sub_filter: 'elasticsearch_dsl.query.Query',
+             ) -> 'elasticsearch_dsl.query.Query':
+    """ Rewrite a filter into an equivalent, cheaper filter.
+        See :func:`pygeofilter_elasticsearch.optimise.optimise`.
+
+        :param sub_filter: the filter to optimise
+        :return: the optimised filter
+    """
+    assert isinstance(sub_filter, Query)
+    return Q(optimise_query(sub_filter.to_dict()))
+
+
+def order(sub_filter: 'elasticsearch_dsl.query.Query',
+          field_cardinality: dict = None) -> 'elasticsearch_dsl.query.Query':
+    """ Order the clauses of a filter by their estimated cost.
+
+        :param sub_filter: the filter to order
+        :param field_cardinality: the number of distinct values by field
+        :return: the ordered filter
+    """
+    return Q(order_clauses(sub_filter.to_dict(), field_cardinality))
 
 
 OP_TO_COMP = {
@@ -86,7 +177,8 @@ def compare(lhs, rhs, op):
     return ~Q('term', **{lhs: rhs})
 
 
-def negate(sub_filter: 'elasticsearch_dsl.query.Query') -> 'elasticsearch_dsl.query.Query':
+def negate(sub_filter: 'elasticsearch_dsl.query.Query',
+           ) -> 'elasticsearch_dsl.query.Query':
     """ Negate a filter, opposing its meaning.
 
         :param sub_filter: the filter to negate
@@ -117,99 +209,458 @@ def between(lhs: str,
     return ~q if not_ else q
 
 
+ELASTIC_WILDCARD = '*'
+ELASTIC_SINGLECHAR = '?'
+ELASTIC_ESCAPECHAR = '\\'
+
+_ANY = object()
+_ONE = object()
+
+
+def like_query(pattern: str,
+               wildcard: str,
+               singlechar: str,
+               escapechar: str) -> Tuple[str, str]:
+    """ Translate a CQL LIKE pattern into the cheapest Elasticsearch term
+        level query which matches it.
+
+        :param pattern: the CQL pattern
+        :param wildcard: the wildcard character used in ``pattern``
+        :param singlechar: the single character wildcard used in ``pattern``
+        :param escapechar: the escape character used in ``pattern``
+
+        :return: a ``(query_type, value)`` tuple. ``term`` for a pattern
+                 without wildcards, ``prefix`` for a literal followed by a
+                 single trailing wildcard, otherwise ``wildcard`` with an
+                 escaped Elasticsearch pattern.
+    """
+    parts = []
+    chars = iter(pattern)
+
+    for char in chars:
+        if char == escapechar:
+            # a trailing escape character matches itself
+            parts.append(next(chars, escapechar))
+        elif char == wildcard:
+            parts.append(_ANY)
+        elif char == singlechar:
+            parts.append(_ONE)
+        else:
+            parts.append(char)
+
+    wildcards = sum(1 for part in parts if part is _ANY or part is _ONE)
+
+    if not wildcards:
+        return 'term', ''.join(parts)
+
+    if wildcards == 1 and parts[-1] is _ANY:
+        return 'prefix', ''.join(parts[:-1])
+
+    special = (ELASTIC_WILDCARD, ELASTIC_SINGLECHAR, ELASTIC_ESCAPECHAR)
+    return 'wildcard', ''.join(
+        ELASTIC_WILDCARD if part is _ANY else
+        ELASTIC_SINGLECHAR if part is _ONE else
+        ELASTIC_ESCAPECHAR + part if part in special else
+        part
+        for part in parts
+    )
+
+
 def like(lhs: str,
          pattern: str,
          wildcard: str,
          singlechar: str,
          escapechar: str,
          not_: bool = False,
+         nocase: bool = False,
          ) -> 'elasticsearch_dsl.query.Query':
-    """ Create a filter to filter elements according to a string attribute using
-        wildcard expressions.
+    """ Create a filter to filter elements according to a string attribute
+        using wildcard expressions.
 
         :param lhs: the field to compare
-        :param rhs: the wildcard pattern: a string containing any number of '%'
-                    characters as wildcards.
-        :param case: whether the lookup shall be done case sensitively or not
-        :param not_: whether the range shall be inclusive (the default) or
-                     exclusive
+        :param pattern: the wildcard pattern
+        :param wildcard: the wildcard character used in ``pattern``
+        :param singlechar: the single character wildcard used in ``pattern``
+        :param escapechar: the escape character used in ``pattern``
+        :param not_: whether the match shall be negated
+        :param nocase: whether the match shall be case insensitive
 
         :return: a comparison expression object
     """
     assert isinstance(lhs, str)
     assert isinstance(pattern, str)
 
-    elastic_wildcard = '*'
-    elastic_singlechar = '?'
-    elastic_escapechar = '\\'
+    query_type, value = like_query(pattern, wildcard, singlechar, escapechar)
 
-    pattern = pattern.replace(wildcard, elastic_wildcard)
-    pattern = pattern.replace(singlechar, elastic_singlechar)
+    if nocase:
+        value = {'value': value, 'case_insensitive': True}
 
-    q = Q('query_string', query=pattern, fields=[lhs])
+    q = Q(query_type, **{lhs: value})
 
     return ~q if not_ else q
 
 
+#: The default ``index.max_terms_count`` of an Elasticsearch index.
+MAX_TERMS = 65536
+
+
+def _sort_key(value):
+    # group values by type, so mixed lists sort without comparing across types
+    return type(value).__name__, value
+
+
+def terms_values(items) -> list:
+    """ Deduplicate and sort the choices of a ``terms`` query, so equal lists
+        give identical queries.
+
+        :param items: a list of choices
+        :return: the sorted unique choices
+    """
+    try:
+        return sorted(set(items), key=_sort_key)
+    except TypeError:
+        # unhashable or unorderable choices keep their order
+        unique = []
+        for item in items:
+            if item not in unique:
+                unique.append(item)
+        return unique
+
+
+def terms_query(lhs: str, items, max_terms: int = None,
+                terms_lookup=None) -> dict:
+    """ Build the query dict of a ``terms`` query, bounding the size of the
+        query for long lists of choices.
+
+        Lists longer than ``max_terms`` are deduplicated and sorted. If they
+        are still too long they either become a ``terms`` lookup, if
+        ``terms_lookup`` is given, or a ``bool.should`` of ``terms`` queries
+        of at most ``max_terms`` choices each.
+
+        :param lhs: the field to compare
+        :param items: a list of choices
+        :param max_terms: the most choices to inline in one ``terms`` query.
+                          Leave as ``None`` to inline every choice.
+        :param terms_lookup: a function of the field and the choices which
+                             stores the choices in a document and returns
+                             the lookup, e.g. ``{'index': 'lists',
+                             'id': '1', 'path': 'values'}``.
+                             Lookups still count towards the
+                             ``index.max_terms_count`` of the index.
+        :return: the query dict
+    """
+    if max_terms is None or len(items) <= max_terms:
+        return {'terms': {lhs: items}}
+
+    assert max_terms > 0
+
+    values = terms_values(items)
+    if len(values) <= max_terms:
+        return {'terms': {lhs: values}}
+
+    if terms_lookup is not None:
+        return {'terms': {lhs: terms_lookup(lhs, values)}}
+
+    return {
+        'bool': {
+            'should': [
+                {'terms': {lhs: values[start:start + max_terms]}}
+                for start in range(0, len(values), max_terms)
+            ]
+        }
+    }
+
+
 def contains(lhs: str,
              items: Tuple,
-             not_: bool =False) -> 'elasticsearch_dsl.query.Query':
+             not_: bool =False,
+             max_terms: int = None,
+             terms_lookup=None) -> 'elasticsearch_dsl.query.Query':
     """ Create a filter to match elements attribute to be in a list of choices.
 
         :param lhs: the field to compare
         :param items: a list of choices
         :param not_: whether the range shall be inclusive (the default) or
                      exclusive
+        :param max_terms: the most choices to inline in one ``terms`` query.
+                          See :func:`terms_query`.
+        :param terms_lookup: store longer lists and look them up.
+                             See :func:`terms_query`.
         :return: a comparison expression object
     """
     assert isinstance(lhs, str)
 
-    q = Q('terms', **{lhs: items})
+    if max_terms is None:
+        q = Q('terms', **{lhs: items})
+    else:
+        q = Q(terms_query(lhs, items, max_terms, terms_lookup))
     return ~q if not_ else q
 
 
+SPATIAL_RELATIONS = {
+    'INTERSECTS': 'intersects',
+    'DISJOINT': 'disjoint',
+    'WITHIN': 'within',
+    'CONTAINS': 'contains',
+}
+
+INVERSE_SPATIAL_OPS = {
+    'WITHIN': 'CONTAINS',
+    'CONTAINS': 'WITHIN',
+}
+
+
+def geometry(value, tolerance: float = None, max_vertices: int = None,
+             precision: int = None) -> dict:
+    """ Prepare a geometry value for use in a ``geo_shape`` query.
+
+        Axis aligned rectangles are turned into the cheaper ``envelope`` shape,
+        other geometries are optionally simplified.
+
+        :param value: a pygeofilter ``Geometry`` or ``Envelope``
+        :param tolerance: the simplification tolerance, in coordinate units
+        :param max_vertices: cap on the number of vertices in the geometry
+        :param precision: round the coordinates to this many decimal places
+        :return: the shape
+    """
+    shape = value.__geo_interface__
+
+    bounds = geo.rectangle_bounds(shape)
+    if bounds:
+        shape = geo.envelope(*bounds)
+    elif tolerance or max_vertices:
+        shape = geo.simplify(shape, tolerance, max_vertices)
+
+    if precision is not None:
+        shape = geo.round_coordinates(shape, precision)
+
+    return shape
+
+
+def spatial_relation(lhs, rhs, op: str) -> Tuple[str, dict, str]:
+    """ Resolve the field, shape and ``geo_shape`` relation of a spatial
+        predicate, allowing the shape on either side.
+
+        :param lhs: the field to compare, or the shape if ``rhs`` is the field
+        :param rhs: the shape, or the field
+        :param op: the spatial operation
+        :return: a ``(field, shape, relation)`` tuple
+    """
+    if not isinstance(lhs, str) and isinstance(rhs, str):
+        lhs, rhs = rhs, lhs
+        op = INVERSE_SPATIAL_OPS.get(op, op)
+
+    assert isinstance(lhs, str)
+
+    if op not in SPATIAL_RELATIONS:
+        raise NotImplementedError(
+            f'Spatial operation {op} is not supported by Elasticsearch'
+        )
+
+    return lhs, rhs, SPATIAL_RELATIONS[op]
+
+
+def spatial(lhs, rhs, op: str, bounding_box: bool = False,
+            ) -> 'elasticsearch_dsl.query.Query':
+    """ Create a spatial filter for the given spatial attribute.
+
+        :param lhs: the field to compare, or the shape if ``rhs`` is the field
+        :param rhs: the shape, as prepared by :func:`geometry`
+        :param op: the spatial operation. one of ``"INTERSECTS"``,
+                   ``"DISJOINT"``, ``"WITHIN"``, ``"CONTAINS"``.
+        :param bounding_box: use a ``geo_bounding_box`` query for envelopes
+                             which are tested for intersection
+        :return: a comparison expression object
+    """
+    lhs, shape, relation = spatial_relation(lhs, rhs, op)
+
+    if bounding_box and relation == 'intersects' and \
+            shape.get('type') == 'envelope':
+        return Q('geo_bounding_box', **{lhs: geo.bounding_box(shape)})
+
+    return Q('geo_shape', **{lhs: {'shape': shape, 'relation': relation}})
+
+
+def bbox(lhs: str,
+         minx: float,
+         miny: float,
+         maxx: float,
+         maxy: float,
+         crs: str = None,
+         bounding_box: bool = False,
+         precision: int = None) -> 'elasticsearch_dsl.query.Query':
+    """ Create a bounding box filter for the given spatial attribute.
+
+        :param lhs: the field to compare
+        :param minx: the lower x part of the bbox
+        :param miny: the lower y part of the bbox
+        :param maxx: the upper x part of the bbox
+        :param maxy: the upper y part of the bbox
+        :param crs: the CRS of the bbox. Elasticsearch only supports WGS84
+        :param bounding_box: use a ``geo_bounding_box`` query
+        :param precision: round the bbox outwards to this many decimal places
+        :return: a comparison expression object
+    """
+    shape = geo.envelope(minx, miny, maxx, maxy)
+    if precision is not None:
+        shape = geo.round_coordinates(shape, precision)
+    return spatial(lhs, shape, 'INTERSECTS', bounding_box)
+
+
+TEMPORAL_OPS = (
+    "BEFORE",
+    "BEFORE OR DURING",
+    "DURING",
+    "DURING OR AFTER",
+    "AFTER",
+    "TEQUALS",
+)
+
+GRANULARITIES = {
+    's': timedelta(seconds=1),
+    'm': timedelta(minutes=1),
+    'h': timedelta(hours=1),
+    'd': timedelta(days=1),
+}
+
+TEMPORAL_FORMAT = 'strict_date_optional_time'
+
+
+def temporal_bounds(time_or_period: Union['datetime', Tuple['datetime'],
+                                          Tuple['datetime', 'timedelta']],
+                    op: str) -> Tuple:
+    """ Resolve the lower and upper bounds of a temporal comparison.
+
+        :param time_or_period: the time instant or time span to use as a
+                               filter. A time span is a ``(start, end)``
+                               tuple, either of which may be a ``timedelta``
+                               relative to the other, or ``None`` for an open
+                               end.
+        :param op: the comparison operation. one of ``"BEFORE"``,
+                   ``"BEFORE OR DURING"``, ``"DURING"``, ``"DURING OR AFTER"``,
+                   ``"AFTER"``, ``"TEQUALS"``.
+        :return: a ``(low, high)`` tuple, either of which may be ``None``
+    """
+    assert op in TEMPORAL_OPS
+
+    if isinstance(time_or_period, tuple):
+        start, end = time_or_period
+        assert not (
+            isinstance(start, timedelta) and isinstance(end, timedelta)
+        )
+
+        if isinstance(start, timedelta):
+            assert end is not None
+            start = end - start
+
+        if isinstance(end, timedelta):
+            assert start is not None
+            end = start + end
+    else:
+        start = end = time_or_period
+
+    if op == "BEFORE":
+        return None, start
+    if op == "AFTER":
+        return end, None
+    if op == "BEFORE OR DURING":
+        return None, end
+    if op == "DURING OR AFTER":
+        return start, None
+    return start, end
+
+
+def round_time(value, granularity: Union[str, 'timedelta'], up: bool = False):
+    """ Round a datetime down, or up, to a multiple of the granularity since
+        the epoch, in the timezone of the datetime. Other values are returned
+        as they are.
+
+        :param value: the datetime
+        :param granularity: a ``timedelta``, or one of ``"s"``, ``"m"``,
+                            ``"h"``, ``"d"``
+        :param up: round up rather than down
+        :return: the rounded datetime
+    """
+    if not isinstance(value, datetime):
+        return value
+
+    step = GRANULARITIES.get(granularity, granularity)
+    assert isinstance(step, timedelta) and step > timedelta(0)
+
+    epoch = datetime(1970, 1, 1, tzinfo=value.tzinfo)
+    offset = value - epoch
+    rounded = epoch + (offset // step) * step
+    if up and rounded != value:
+        rounded += step
+    return rounded
+
+
+def format_time(value):
+    """ Format a datetime as an ISO 8601 string. Timezone aware datetimes are
+        converted to UTC, so equal instants give equal strings.
+
+        :param value: the datetime
+        :return: the string, or the value as it is if not a datetime
+    """
+    if not isinstance(value, datetime):
+        return value
+
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat() + 'Z'
+    return value.isoformat()
+
+
+def temporal_range(low, high,
+                   granularity: Union[str, 'timedelta'] = None) -> dict:
+    """ The bounds of a ``range`` query for a temporal comparison.
+
+        With a granularity, the bounds are widened to multiples of it and
+        formatted as ISO strings, so comparisons with nearby times give
+        identical, cacheable queries.
+
+        :param low: the lower bound, or ``None``
+        :param high: the upper bound, or ``None``
+        :param granularity: round the bounds to this granularity
+        :return: the range bounds
+    """
+    bounds = {}
+    if low is not None:
+        bounds['gte'] = low
+    if high is not None:
+        bounds['lte'] = high
+
+    if granularity:
+        if low is not None:
+            bounds['gte'] = format_time(round_time(low, granularity))
+        if high is not None:
+            bounds['lte'] = format_time(round_time(high, granularity, up=True))
+        bounds['format'] = TEMPORAL_FORMAT
+
+    return bounds
+
+
 def temporal(lhs: str,
-             time_or_period: Union['datetime', Tuple['datetime'], Tuple['datetime', 'timedelta']],
-             op: str) -> 'elasticsearch_dsl.query.Query':
+             time_or_period: Union['datetime', Tuple['datetime'],
+                                   Tuple['datetime', 'timedelta']],
+             op: str,
+             granularity: Union[str, 'timedelta'] = None,
+             ) -> 'elasticsearch_dsl.query.Query':
     """ Create a temporal filter for the given temporal attribute.
 
         :param lhs: the field to compare
         :param time_or_period: the time instant or time span to use as a filter
         :param op: the comparison operation. one of ``"BEFORE"``,
                    ``"BEFORE OR DURING"``, ``"DURING"``, ``"DURING OR AFTER"``,
-                   ``"AFTER"``.
+                   ``"AFTER"``, ``"TEQUALS"``.
+        :param granularity: round the bounds outwards to this granularity.
+                            See :func:`temporal_range`.
         :return: a comparison expression object
     """
     assert isinstance(lhs, str)
-    assert op in (
-        "BEFORE",
-        "BEFORE OR DURING",
-        "DURING",
-        "DURING OR AFTER",
-        "AFTER",
-    )
-
-    low = None
-    high = None
-
-    if op in ("BEFORE", "AFTER"):
-        if op == "BEFORE":
-            high = time_or_period
-        else:
-            low = time_or_period
-    else:
-        low, high = time_or_period
-        assert isinstance(low, datetime) or isinstance(high, datetime)
 
-        if isinstance(low, timedelta):
-            low = high - low
+    bounds = temporal_range(*temporal_bounds(time_or_period, op), granularity)
 
-        if isinstance(high, timedelta):
-            high = low + high
-
-    if low and high:
-        return between(lhs, low, high)
-    elif low:
-        return compare(lhs,low,'>=')
-    else:
-        return compare(lhs, high, '<=')
+    if not bounds:
+        return match_all()
+    return Q('range', **{lhs: bounds})
@@ -0,0 +1,83 @@
+# encoding: utf-8
+"""
+Constant folding
+
+Evaluate predicates between literals at translation time, with the same
+semantics as the queries they would otherwise become.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import operator
+from datetime import date
+
+from .filters import temporal_bounds
+
+COMPARISONS = {
+    '=': operator.eq,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def compare(lhs, rhs, op: str) -> bool:
+    """ Compare two literals. Literals which cannot be ordered, such as a
+        string and a number, do not satisfy an ordering comparison.
+
+        :param lhs: the left hand literal
+        :param rhs: the right hand literal
+        :param op: the comparison operator
+        :return: whether the comparison holds
+    """
+    try:
+        return COMPARISONS[op](lhs, rhs)
+    except TypeError:
+        return False
+
+
+def between(value, low, high, not_: bool = False) -> bool:
+    """ Test a literal is within an inclusive range.
+
+        :param value: the literal
+        :param low: the lower value of the range
+        :param high: the upper value of the range
+        :param not_: whether to negate the result
+        :return: whether the predicate holds
+    """
+    return (compare(value, low, '>=') and compare(value, high, '<=')) != not_
+
+
+def contains(value, items, not_: bool = False) -> bool:
+    """ Test a literal is one of a list of choices.
+
+        :param value: the literal
+        :param items: the choices
+        :param not_: whether to negate the result
+        :return: whether the predicate holds
+    """
+    return (value in items) != not_
+
+
+def temporal(value, time_or_period, op: str) -> bool:
+    """ Test a time instant against a time instant or span, with the
+        inclusive bounds of :func:`pygeofilter_elasticsearch.filters.temporal`.
+
+        :param value: the time instant
+        :param time_or_period: the time instant or ``(start, end)`` span
+        :param op: the temporal operation
+        :return: whether the predicate holds
+    """
+    low, high = temporal_bounds(time_or_period, op)
+    return (low is None or compare(value, low, '>=')) and \
+        (high is None or compare(value, high, '<='))
+
+
+def is_time(value) -> bool:
+    """Whether a literal is a time instant, ``datetime`` or ``date``."""
+    return isinstance(value, date)
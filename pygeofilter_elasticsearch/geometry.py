@@ -0,0 +1,527 @@
+# encoding: utf-8
+"""
+Geometry helpers
+
+Utilities to prepare GeoJSON geometries from CQL filters for use in
+Elasticsearch ``geo_shape`` queries.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from math import ceil, floor, hypot
+
+from typing import List, Optional, Tuple
+
+
+def envelope(minx: float, miny: float, maxx: float, maxy: float) -> dict:
+    """ Create an Elasticsearch envelope shape.
+
+        :return: the envelope, as used in ``geo_shape`` queries
+    """
+    return {'type': 'envelope', 'coordinates': [[minx, maxy], [maxx, miny]]}
+
+
+def bounding_box(shape: dict) -> dict:
+    """ Convert an envelope shape to the corners of a ``geo_bounding_box``
+        query.
+
+        :param shape: an envelope, as created by :func:`envelope`
+        :return: the ``top_left`` and ``bottom_right`` corners
+    """
+    (minx, maxy), (maxx, miny) = shape['coordinates']
+    return {
+        'top_left': {'lat': maxy, 'lon': minx},
+        'bottom_right': {'lat': miny, 'lon': maxx},
+    }
+
+
+def rectangle_bounds(
+        geometry: dict) -> Optional[Tuple[float, float, float, float]]:
+    """ Get the bounds of a polygon which is an axis aligned rectangle.
+
+        :param geometry: a GeoJSON geometry
+        :return: ``(minx, miny, maxx, maxy)`` or ``None`` if the geometry is
+                 not a rectangle
+    """
+    if geometry.get('type') != 'Polygon' or len(geometry['coordinates']) != 1:
+        return None
+
+    ring = geometry['coordinates'][0]
+    if len(ring) != 5 or ring[0] != ring[-1]:
+        return None
+
+    xs = {point[0] for point in ring}
+    ys = {point[1] for point in ring}
+    if len(xs) != 2 or len(ys) != 2:
+        return None
+
+    # every edge must be either horizontal or vertical
+    for start, end in zip(ring, ring[1:]):
+        if start[0] != end[0] and start[1] != end[1]:
+            return None
+
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def count_vertices(coordinates) -> int:
+    """ Count the vertices in a set of GeoJSON coordinates.
+
+        :param coordinates: the ``coordinates`` of a GeoJSON geometry
+        :return: the number of vertices
+    """
+    if not coordinates:
+        return 0
+    if not isinstance(coordinates[0], (list, tuple)):
+        return 1
+    return sum(count_vertices(part) for part in coordinates)
+
+
+def _segment_distance(point, start, end) -> float:
+    x, y = point[0], point[1]
+    x1, y1 = start[0], start[1]
+    dx = end[0] - x1
+    dy = end[1] - y1
+
+    if dx == 0 and dy == 0:
+        return hypot(x - x1, y - y1)
+
+    t = ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def _simplify_indices(coordinates: List, tolerance: float) -> List[int]:
+    last = len(coordinates) - 1
+    if last < 2:
+        return list(range(last + 1))
+
+    keep = [False] * (last + 1)
+    keep[0] = keep[last] = True
+    stack = [(0, last)]
+
+    while stack:
+        first, end = stack.pop()
+        furthest = None
+        max_distance = tolerance
+
+        for index in range(first + 1, end):
+            distance = _segment_distance(
+                coordinates[index], coordinates[first], coordinates[end]
+            )
+            if distance > max_distance:
+                furthest = index
+                max_distance = distance
+
+        if furthest is not None:
+            keep[furthest] = True
+            stack.append((first, furthest))
+            stack.append((furthest, end))
+
+    return [index for index, kept in enumerate(keep) if kept]
+
+
+def simplify_line(coordinates: List, tolerance: float) -> List:
+    """ Simplify a line using the Douglas-Peucker algorithm.
+
+        :param coordinates: the line coordinates
+        :param tolerance: the maximum distance of a removed vertex from the
+                          simplified line
+        :return: the simplified coordinates
+    """
+    return [
+        coordinates[index]
+        for index in _simplify_indices(coordinates, tolerance)
+    ]
+
+
+#: Longest distance of a corner of a simplified ring from the vertex it
+#: replaces, as a multiple of the offset of its edges. Sharper corners are
+#: bevelled.
+MITER_LIMIT = 4
+
+
+def _orientation(a, b, c) -> float:
+    """Positive if ``c`` is left of the line from ``a`` to ``b``, negative if
+    right and zero if on it."""
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _on_segment(point, start, end) -> bool:
+    return min(start[0], end[0]) <= point[0] <= max(start[0], end[0]) and \
+        min(start[1], end[1]) <= point[1] <= max(start[1], end[1])
+
+
+def _intersects(a, b, c, d) -> bool:
+    """Whether the segments ``ab`` and ``cd`` share any point."""
+    d1 = _orientation(c, d, a)
+    d2 = _orientation(c, d, b)
+    d3 = _orientation(a, b, c)
+    d4 = _orientation(a, b, d)
+
+    if ((d1 > 0 > d2) or (d1 < 0 < d2)) and ((d3 > 0 > d4) or (d3 < 0 < d4)):
+        return True
+    return (d1 == 0 and _on_segment(a, c, d)) or \
+        (d2 == 0 and _on_segment(b, c, d)) or \
+        (d3 == 0 and _on_segment(c, a, b)) or \
+        (d4 == 0 and _on_segment(d, a, b))
+
+
+def _folds_back(a, b, c) -> bool:
+    """Whether the segment ``bc`` doubles back along the segment ``ab``."""
+    forward = (b[0] - a[0]) * (c[0] - b[0]) + (b[1] - a[1]) * (c[1] - b[1])
+    return _orientation(a, b, c) == 0 and forward < 0
+
+
+def _overlapping_segments(segments: List) -> List[Tuple[int, int]]:
+    """The pairs of segments whose bounding boxes overlap, found by sweeping
+    the segments in order of their lowest x."""
+    boxes = sorted(
+        (
+            min(start[0], end[0]), max(start[0], end[0]),
+            min(start[1], end[1]), max(start[1], end[1]),
+            index
+        )
+        for index, (start, end) in enumerate(segments)
+    )
+    pairs = []
+
+    for position, (_, maxx, miny, maxy, index) in enumerate(boxes):
+        for other_minx, _, other_miny, other_maxy, other in \
+                boxes[position + 1:]:
+            if other_minx > maxx:
+                break
+            if other_miny <= maxy and miny <= other_maxy:
+                pairs.append((index, other))
+
+    return pairs
+
+
+def _signed_area(ring: List) -> float:
+    return sum(
+        start[0] * end[1] - end[0] * start[1]
+        for start, end in zip(ring, ring[1:])
+    ) / 2
+
+
+def _inside(point, ring: List) -> bool:
+    """Whether a point is inside a ring, by counting the edges a ray from it
+    crosses."""
+    x, y = point[0], point[1]
+    inside = False
+    for start, end in zip(ring, ring[1:]):
+        if (start[1] > y) != (end[1] > y):
+            crossing = start[0] + (y - start[1]) * (end[0] - start[0]) / \
+                (end[1] - start[1])
+            if x < crossing:
+                inside = not inside
+    return inside
+
+
+def _encloses(outer: List, inner: List) -> bool:
+    """ Whether a simple ring lies strictly inside another ring.
+
+        The simplified ring must not touch itself, and the two rings must
+        not touch. Then one ring is inside the other if any of its vertices
+        is.
+    """
+    edges = list(zip(outer, outer[1:]))
+    count = len(edges)
+    segments = edges + list(zip(inner, inner[1:]))
+
+    for index, other in _overlapping_segments(segments):
+        index, other = min(index, other), max(index, other)
+        if other >= count:
+            if index < count and \
+                    _intersects(*segments[index], *segments[other]):
+                return False
+        elif other - index == 1:
+            # neighbouring edges only meet at their shared vertex
+            if _folds_back(*segments[index], segments[other][1]):
+                return False
+        elif index == 0 and other == count - 1:
+            if _folds_back(*segments[other], segments[index][1]):
+                return False
+        elif _intersects(*segments[index], *segments[other]):
+            return False
+
+    return _inside(inner[0], outer)
+
+
+def _offset_ring(ring: List, kept: List[int], side: int, margin: float):
+    """ Build a ring from the edges between the ``kept`` vertices, each
+        moved outwards past the furthest vertex it replaces, plus a margin.
+
+        :param side: ``1`` if the outside of the ring is left of its edges,
+                     ``-1`` if right
+        :return: the ring, or ``None`` if an edge has no length
+    """
+    lines = []
+    for first, end in zip(kept, kept[1:]):
+        start, stop = ring[first], ring[end]
+        dx, dy = stop[0] - start[0], stop[1] - start[1]
+        length = hypot(dx, dy)
+        if not length:
+            return None
+
+        # the unit normal, pointing outwards
+        nx, ny = -side * dy / length, side * dx / length
+        offset = margin + max(
+            [
+                (point[0] - start[0]) * nx + (point[1] - start[1]) * ny
+                for point in ring[first + 1:end]
+            ] + [0.0]
+        )
+        lines.append((dx, dy, nx, ny, offset))
+
+    points = []
+    for position, (dx, dy, nx, ny, offset) in enumerate(lines):
+        # the corner before this edge, where the previous edge meets it
+        pdx, pdy, pnx, pny, previous = lines[position - 1]
+        x, y = ring[kept[position]][0], ring[kept[position]][1]
+        before = (x + pnx * previous, y + pny * previous)
+        after = (x + nx * offset, y + ny * offset)
+
+        cross = pdx * dy - pdy * dx
+        if cross:
+            t = ((after[0] - before[0]) * dy - (after[1] - before[1]) * dx) \
+                / cross
+            corner = [before[0] + t * pdx, before[1] + t * pdy]
+            if hypot(corner[0] - x, corner[1] - y) <= \
+                    MITER_LIMIT * max(offset, previous):
+                points.append(corner)
+                continue
+
+        # a straight or very sharp corner
+        points.append(list(before))
+        points.append(list(after))
+
+    return points + [points[0]]
+
+
+def _envelope_ring(ring: List) -> List:
+    xs = [point[0] for point in ring]
+    ys = [point[1] for point in ring]
+    minx, miny, maxx, maxy = min(xs), min(ys), max(xs), max(ys)
+    return [
+        [minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]
+    ]
+
+
+def _simplify_ring(ring: List, tolerance: float, hole: bool = False) -> List:
+    """ Simplify a ring so the polygon still covers the original: the
+        simplified edges of an exterior ring are moved out past the vertices
+        they replace, and those of a hole in.
+    """
+    kept = _simplify_indices(ring, tolerance)
+    if len(kept) == len(ring):
+        return list(ring)
+
+    area = _signed_area(ring)
+    # a ring needs at least 4 positions
+    if len(kept) >= 4 and area:
+        # the outside of a counter-clockwise ring is right of its edges
+        side = -1 if (area > 0) != hole else 1
+        simplified = _offset_ring(ring, kept, side, tolerance * 1e-6)
+        if simplified is not None and (
+                _encloses(ring, simplified) if hole else
+                _encloses(simplified, ring)):
+            return simplified
+
+    # The simplified ring would collapse or cross itself, so use a ring
+    # which still covers the polygon.
+    return list(ring) if hole else _envelope_ring(ring)
+
+
+def _simplify_polygon(polygon: List, tolerance: float) -> List:
+    return [
+        _simplify_ring(ring, tolerance, position > 0)
+        for position, ring in enumerate(polygon)
+    ]
+
+
+def _simplify_coordinates(geometry_type: str, coordinates, tolerance: float):
+    if geometry_type == 'LineString':
+        return simplify_line(coordinates, tolerance)
+    if geometry_type == 'MultiLineString':
+        return [simplify_line(line, tolerance) for line in coordinates]
+    if geometry_type == 'Polygon':
+        return _simplify_polygon(coordinates, tolerance)
+    if geometry_type == 'MultiPolygon':
+        return [
+            _simplify_polygon(polygon, tolerance) for polygon in coordinates
+        ]
+    return coordinates
+
+
+def _simplify(geometry: dict, tolerance: float) -> dict:
+    if geometry['type'] == 'GeometryCollection':
+        return {
+            'type': 'GeometryCollection',
+            'geometries': [
+                _simplify(part, tolerance) for part in geometry['geometries']
+            ]
+        }
+
+    return {
+        'type': geometry['type'],
+        'coordinates': _simplify_coordinates(
+            geometry['type'], geometry['coordinates'], tolerance
+        )
+    }
+
+
+def _count(geometry: dict) -> int:
+    if geometry['type'] == 'GeometryCollection':
+        return sum(_count(part) for part in geometry['geometries'])
+    return count_vertices(geometry['coordinates'])
+
+
+def _extent(geometry: dict) -> float:
+    xs, ys = [], []
+    stack = [
+        geometry.get('coordinates') or [
+            part.get('coordinates') for part in geometry.get('geometries', [])
+        ]
+    ]
+
+    while stack:
+        coordinates = stack.pop()
+        if coordinates and not isinstance(coordinates[0], (list, tuple)):
+            xs.append(coordinates[0])
+            ys.append(coordinates[1])
+        elif coordinates:
+            stack.extend(coordinates)
+
+    if not xs:
+        return 0.0
+    return hypot(max(xs) - min(xs), max(ys) - min(ys))
+
+
+def simplify(geometry: dict, tolerance: float = None,
+             max_vertices: int = None) -> dict:
+    """ Simplify a GeoJSON geometry.
+
+        Simplified geometries are approximate. Lines may move by up to the
+        tolerance. Polygons only grow, so they still cover the original: each
+        simplified edge of a ring is moved outwards past the vertices it
+        replaces, so the area grows by about the tolerance times the
+        perimeter. A ring whose simplification would still cross itself or
+        the original is replaced by its bounding rectangle, and such a hole
+        is kept as it is. Spatial predicates on a simplified polygon can
+        therefore match documents the original would not, e.g.
+        ``INTERSECTS`` near its edges, or miss them, e.g. ``DISJOINT`` or
+        ``CONTAINS``.
+
+        :param geometry: a GeoJSON geometry
+        :param tolerance: the Douglas-Peucker tolerance, in coordinate units
+        :param max_vertices: cap on the number of vertices. The tolerance is
+                             increased until the geometry fits, as far as the
+                             rings can be simplified without collapsing.
+        :return: the simplified geometry
+    """
+    if tolerance:
+        geometry = _simplify(geometry, tolerance)
+
+    if max_vertices is None or _count(geometry) <= max_vertices:
+        return geometry
+
+    tolerance = tolerance or _extent(geometry) / 10000
+    if not tolerance:
+        return geometry
+
+    # give up if the geometry cannot be simplified any further
+    previous = _count(geometry)
+    for _ in range(64):
+        tolerance *= 2
+        simplified = _simplify(geometry, tolerance)
+        count = _count(simplified)
+        if count <= max_vertices:
+            return simplified
+        if count == previous and tolerance > _extent(geometry):
+            return simplified
+        previous = count
+
+    return simplified
+
+
+def _round_point(point, precision: int) -> list:
+    return [round(value, precision) for value in point]
+
+
+def _round_line(line, precision: int, minimum: int):
+    """Round the vertices of a line or ring, dropping repeated vertices, or
+    return ``None`` if fewer than ``minimum`` remain."""
+    rounded = []
+    for point in line:
+        point = _round_point(point, precision)
+        if not rounded or rounded[-1] != point:
+            rounded.append(point)
+    return rounded if len(rounded) >= minimum else None
+
+
+def _round_envelope(coordinates, precision: int) -> list:
+    # round outwards, so the envelope still covers everything it did
+    scale = 10 ** precision
+    (minx, maxy), (maxx, miny) = coordinates
+    return [
+        [floor(minx * scale) / scale, ceil(maxy * scale) / scale],
+        [ceil(maxx * scale) / scale, floor(miny * scale) / scale],
+    ]
+
+
+def _round_coordinates(geometry_type: str, coordinates, precision: int):
+    if geometry_type == 'Point':
+        return _round_point(coordinates, precision)
+    if geometry_type == 'MultiPoint':
+        return [_round_point(point, precision) for point in coordinates]
+    if geometry_type == 'envelope':
+        return _round_envelope(coordinates, precision)
+    if geometry_type == 'LineString':
+        return _round_line(coordinates, precision, 2)
+
+    minimum = 2 if geometry_type == 'MultiLineString' else 4
+    if geometry_type in ('MultiLineString', 'Polygon'):
+        parts = [coordinates]
+    elif geometry_type == 'MultiPolygon':
+        parts = coordinates
+    else:
+        return coordinates
+
+    rounded = []
+    for part in parts:
+        lines = [_round_line(line, precision, minimum) for line in part]
+        if any(line is None for line in lines):
+            return None
+        rounded.append(lines)
+    return rounded[0] if geometry_type != 'MultiPolygon' else rounded
+
+
+def round_coordinates(geometry: dict, precision: int) -> dict:
+    """ Round the coordinates of a GeoJSON geometry or envelope to a number of
+        decimal places, to shorten the serialised query. Envelopes are rounded
+        outwards. Repeated vertices are dropped, and a geometry which would
+        collapse is returned unchanged.
+
+        :param geometry: a GeoJSON geometry, or an envelope
+        :param precision: the number of decimal places to keep
+        :return: the rounded geometry
+    """
+    if geometry['type'] == 'GeometryCollection':
+        return {
+            'type': 'GeometryCollection',
+            'geometries': [
+                round_coordinates(part, precision)
+                for part in geometry['geometries']
+            ]
+        }
+
+    coordinates = _round_coordinates(
+        geometry['type'], geometry['coordinates'], precision
+    )
+    if coordinates is None:
+        return geometry
+
+    return {'type': geometry['type'], 'coordinates': coordinates}
@@ -0,0 +1,202 @@
+# encoding: utf-8
+"""
+Hybrid pushdown
+
+Split an AST into the part Elasticsearch can evaluate, translated into a
+query, and a residual part which is compiled into a Python predicate and
+applied to the hits.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from pygeofilter import ast
+
+from .evaluate import ElasticsearchDictEvaluator, flatten_combination
+from .filters import SPATIAL_RELATIONS, TEMPORAL_OPS
+
+
+def attribute_names(node) -> set:
+    """ Collect the attribute names used in an AST.
+
+        :param node: the abstract syntax tree
+        :return: a set of names
+    """
+    names = set()
+    stack = [node]
+
+    while stack:
+        current = stack.pop()
+        if isinstance(current, ast.Attribute):
+            names.add(current.name)
+        elif hasattr(current, 'get_sub_nodes'):
+            sub_nodes = current.get_sub_nodes()
+            if isinstance(sub_nodes, list):
+                stack.extend(sub_nodes)
+            elif sub_nodes is not None:
+                stack.append(sub_nodes)
+
+    return names
+
+
+class HybridFilter:
+    """The result of splitting an AST for hybrid evaluation.
+
+    A hit matches the filter if it matches :attr:`query` in Elasticsearch and
+    :attr:`residual` in Python.
+
+    :param query: the query dict for the part Elasticsearch can evaluate
+    :param residual: the AST of the part it cannot, or ``None``
+    :param attribute_map: the ``_source`` path of each residual attribute
+    :param function_map: functions the residual may call, by name
+    """
+
+    def __init__(self, query, residual=None, attribute_map=None,
+                 function_map=None):
+        self.query = query
+        self.residual = residual
+        self.attribute_map = attribute_map or {}
+        self.function_map = function_map or {}
+        self._predicate = None
+
+    @property
+    def predicate(self):
+        """ The residual compiled into a function of a hit ``_source``, or
+            ``None`` if there is no residual. Needs pygeofilter's native
+            backend, and so ``shapely``.
+        """
+        if self.residual is None:
+            return None
+
+        if self._predicate is None:
+            from pygeofilter.backends.native.evaluate import NativeEvaluator
+
+            self._predicate = NativeEvaluator(
+                function_map=self.function_map,
+                attribute_map=self.attribute_map,
+                use_getattr=False
+            ).evaluate(self.residual)
+
+        return self._predicate
+
+    def filter_hits(self, hits):
+        """ Apply the residual to a stream of hits.
+
+            :param hits: search hits, with their ``_source``
+            :return: a generator of the hits which match
+        """
+        predicate = self.predicate
+        if predicate is None:
+            yield from hits
+            return
+
+        for hit in hits:
+            if predicate(hit['_source']):
+                yield hit
+
+
+class HybridEvaluator(ElasticsearchDictEvaluator):
+    """Dict evaluator which translates what it can of an AST and leaves the
+    rest as a residual AST.
+    """
+
+    def pushable(self, node) -> bool:
+        """Whether the operation of a predicate is supported at all. The
+        predicate may still fail to translate."""
+        if isinstance(node, ast.TemporalPredicate):
+            return node.op.value in TEMPORAL_OPS
+        if isinstance(node, ast.SpatialComparisonPredicate):
+            return node.op.value in SPATIAL_RELATIONS
+        return True
+
+    def split(self, node):
+        """ Split an AST into a query and a residual AST. Either may be
+            ``None``, for a filter which matches everything.
+
+            :param node: the abstract syntax tree
+            :return: a ``(query, residual)`` tuple
+        """
+        if isinstance(node, ast.And):
+            queries = []
+            residuals = []
+            for operand in flatten_combination(node):
+                query, residual = self.split(operand)
+                if query is not None:
+                    queries.append(query)
+                if residual is not None:
+                    residuals.append(residual)
+
+            query = None
+            if queries:
+                query = self.filters.combine(
+                    queries, 'AND', self.filter_context
+                )
+            return (
+                query, ast.And.from_items(*residuals) if residuals else None
+            )
+
+        if isinstance(node, ast.Or):
+            parts = [
+                self.split(operand) for operand in flatten_combination(node)
+            ]
+            queries = [query for query, _ in parts]
+
+            if any(query is None for query in queries):
+                # some operand may match anything Elasticsearch returns
+                return None, node
+
+            query = self.filters.combine(queries, 'OR', self.filter_context)
+            if all(residual is None for _, residual in parts):
+                return query, None
+            # the query narrows the hits down, but each operand still needs
+            # checking as a whole
+            return query, node
+
+        if isinstance(node, ast.Not):
+            query, residual = self.split(node.sub_node)
+            if residual is None and query is not None:
+                return self.filters.negate(query), None
+            return None, node
+
+        if not self.pushable(node):
+            return None, node
+
+        try:
+            return self.evaluate(node, False), None
+        except (NotImplementedError, AssertionError):
+            return None, node
+
+
+def split_filter(ast, field_mapping=None, field_default=None,
+                 function_map=None, **options) -> HybridFilter:
+    """ Split an AST into a query for Elasticsearch and a residual Python
+        predicate, for predicates Elasticsearch cannot evaluate, such as
+        arithmetic, functions and unsupported spatial or temporal operations.
+
+        :param ast: the abstract syntax tree
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param function_map: Functions the residual may call, by name.
+        :param options: Further evaluator options, such as ``filter_context``.
+        See :class:`.evaluate.ElasticsearchFilterEvaluator`.
+        :return: a :class:`HybridFilter`
+    """
+    evaluator = HybridEvaluator(field_mapping, field_default, **options)
+    query, residual = evaluator.split(ast)
+
+    if query is None:
+        query = evaluator.filters.match_all()
+    else:
+        query = evaluator.adopt_result(query)
+
+    attribute_map = None
+    if residual is not None:
+        attribute_map = {
+            name: evaluator.resolver(name)
+            for name in attribute_names(residual)
+        }
+
+    return HybridFilter(query, residual, attribute_map, function_map)
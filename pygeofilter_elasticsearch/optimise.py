@@ -0,0 +1,334 @@
+# encoding: utf-8
+"""
+Query optimiser
+
+Rewrites a translated query dict into an equivalent query which is cheaper
+for Elasticsearch to execute.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from datetime import date, datetime
+
+MATCH_ALL = 'match_all'
+MATCH_NONE = 'match_none'
+
+RANGE_LOWER = ('gt', 'gte')
+RANGE_UPPER = ('lt', 'lte')
+RANGE_BOUNDS = RANGE_LOWER + RANGE_UPPER
+
+
+def _is(query: dict, name: str) -> bool:
+    return name in query and len(query) == 1
+
+
+def min_should_match(clauses: dict) -> int:
+    """ The number of ``should`` clauses a bool query requires to match.
+
+        :param clauses: the clauses of a bool query
+        :return: the effective ``minimum_should_match``
+    """
+    if 'minimum_should_match' in clauses:
+        return clauses['minimum_should_match']
+    return 0 if clauses.get('must') or clauses.get('filter') else 1
+
+
+def _comparable(value):
+    """Key to compare range bounds by, or None if the bound cannot be
+    merged."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return 0, value
+    if isinstance(value, datetime):
+        # naive and aware datetimes cannot be compared
+        return (1, value.tzinfo is not None), value
+    if isinstance(value, date):
+        return 2, value
+    # strings are parsed by Elasticsearch according to the field type, with
+    # time zones, rounding of date-only bounds and date math, so they cannot
+    # be compared here
+    return None
+
+
+def _range_field(query: dict):
+    """The field and bounds of a range query which can be merged, if any."""
+    if not _is(query, 'range') or len(query['range']) != 1:
+        return None
+
+    (field, bounds), = query['range'].items()
+    if not isinstance(bounds, dict) or not bounds:
+        return None
+
+    if any(key not in RANGE_BOUNDS and key != 'format' for key in bounds):
+        return None
+
+    if any(
+        _comparable(bounds[key]) is None
+        for key in RANGE_BOUNDS if key in bounds
+    ):
+        return None
+
+    return field, bounds
+
+
+def _tighter(current, candidate, lower):
+    """Pick the tighter of two ``(operator, value)`` bounds."""
+    if current is None:
+        return candidate
+
+    current_value = current[1]
+    candidate_op, candidate_value = candidate
+
+    if _comparable(current_value)[0] != _comparable(candidate_value)[0]:
+        raise TypeError('Range bounds of different types')
+
+    if candidate_value == current_value:
+        # the exclusive bound is the tighter one
+        return candidate if len(candidate_op) == 2 else current
+
+    if (candidate_value > current_value) == lower:
+        return candidate
+    return current
+
+
+def _merge_ranges(queries: list):
+    """ Merge the range queries on the same field in a list of ANDed queries.
+
+        :return: the merged list, or ``None`` if the ranges contradict
+    """
+    merged = {}
+    result = []
+
+    for query in queries:
+        found = _range_field(query)
+        if found is None:
+            result.append(query)
+            continue
+
+        field, bounds = found
+        if field not in merged:
+            merged[field] = [len(result), None, None, bounds.get('format')]
+            result.append(None)
+
+        entry = merged[field]
+        if entry[3] != bounds.get('format'):
+            # ranges in different formats are left as they are
+            result.append(query)
+            continue
+
+        try:
+            for op in RANGE_BOUNDS:
+                if op in bounds:
+                    lower = op in RANGE_LOWER
+                    index = 1 if lower else 2
+                    entry[index] = _tighter(
+                        entry[index], (op, bounds[op]), lower
+                    )
+        except TypeError:
+            result.append(query)
+
+    for field, (index, low, high, format_) in merged.items():
+        if low and high and _comparable(low[1])[0] == _comparable(high[1])[0]:
+            (low_op, low_value), (high_op, high_value) = low, high
+            exclusive = low_op == 'gt' or high_op == 'lt'
+            if low_value > high_value or \
+                    (low_value == high_value and exclusive):
+                return None
+
+        bounds = dict(bound for bound in (low, high) if bound)
+        if format_ is not None:
+            bounds['format'] = format_
+        result[index] = {'range': {field: bounds}}
+
+    return result
+
+
+def _term_field(query: dict):
+    """The field and values of a term or terms query, if it can be merged."""
+    for name in ('term', 'terms'):
+        if _is(query, name) and len(query[name]) == 1:
+            (field, value), = query[name].items()
+            if name == 'term' and not isinstance(value, dict):
+                return field, [value]
+            if name == 'terms' and isinstance(value, list):
+                return field, value
+    return None
+
+
+def _merge_terms(queries: list) -> list:
+    """Merge the term and terms queries on the same field in a list of ORed
+    queries."""
+    merged = {}
+    result = []
+
+    for query in queries:
+        found = _term_field(query)
+        if found is None:
+            result.append(query)
+            continue
+
+        field, values = found
+        if field in merged:
+            merged[field][1].extend(values)
+        else:
+            merged[field] = (len(result), list(values), query)
+            result.append(query)
+
+    for field, (index, values, query) in merged.items():
+        if len(values) > 1 or 'terms' in query:
+            unique = []
+            seen = set()
+            for value in values:
+                key = (type(value), value)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(value)
+            result[index] = {'terms': {field: unique}}
+
+    return result
+
+
+def _lift(query: dict, kinds) -> bool:
+    clauses = query.get('bool') if _is(query, 'bool') else None
+    return clauses is not None and all(key in kinds for key in clauses)
+
+
+def _optimise_bool(clauses: dict, children: dict) -> dict:
+    """ Optimise the clauses of a bool query.
+
+        :param clauses: the clauses of the bool query
+        :param children: the optimised bool queries among its clauses, by id
+        :return: the optimised query dict
+    """
+    must = []
+    filter_ = []
+    must_not = []
+    should = []
+
+    for kind, target in (('must', must), ('filter', filter_)):
+        for query in clauses.get(kind, ()):
+            query = children.get(id(query), query)
+            if _is(query, MATCH_ALL):
+                continue
+            if _is(query, MATCH_NONE):
+                return {MATCH_NONE: {}}
+            if _lift(query, ('must', 'filter', 'must_not')):
+                child = query['bool']
+                target.extend(child.get('must', ()))
+                filter_.extend(child.get('filter', ()))
+                must_not.extend(child.get('must_not', ()))
+                continue
+            target.append(query)
+
+    for query in clauses.get('must_not', ()):
+        query = children.get(id(query), query)
+        if _is(query, MATCH_NONE):
+            continue
+        if _is(query, MATCH_ALL):
+            return {MATCH_NONE: {}}
+        if _lift(query, ('must_not',)) and len(query['bool']['must_not']) == 1:
+            # double negation. filter keeps the score of the clause at zero
+            query = query['bool']['must_not'][0]
+            if _is(query, MATCH_NONE):
+                return {MATCH_NONE: {}}
+            if not _is(query, MATCH_ALL):
+                filter_.append(query)
+            continue
+        must_not.append(query)
+
+    required = min_should_match(clauses)
+    for query in clauses.get('should', ()):
+        query = children.get(id(query), query)
+        if _is(query, MATCH_NONE):
+            continue
+        if _is(query, MATCH_ALL) and required == 1:
+            # the should clauses are satisfied by any document
+            should = None
+            break
+        if required == 1 and _lift(query, ('should',)):
+            should.extend(query['bool']['should'])
+            continue
+        should.append(query)
+
+    if should is None:
+        should = []
+    else:
+        if not should and required > 0 and clauses.get('should'):
+            return {MATCH_NONE: {}}
+
+        if required == 1:
+            should = _merge_terms(should)
+
+    for target in (must, filter_):
+        merged = _merge_ranges(target)
+        if merged is None:
+            return {MATCH_NONE: {}}
+        target[:] = merged
+
+    optimised = {}
+    for kind, target in (('filter', filter_), ('must', must),
+                         ('must_not', must_not), ('should', should)):
+        if target:
+            optimised[kind] = target
+
+    # keep the should clauses as required or optional as they were
+    if should and ('minimum_should_match' in clauses or
+                   min_should_match(optimised) != required):
+        optimised['minimum_should_match'] = required
+
+    for key, value in clauses.items():
+        if key not in ('filter', 'must', 'must_not', 'should',
+                       'minimum_should_match'):
+            optimised[key] = value
+
+    if not optimised:
+        return {MATCH_ALL: {}}
+
+    # unwrap a bool which only wraps one scoring clause
+    if list(optimised) in (['must'], ['should']):
+        scoring, = optimised.values()
+        if len(scoring) == 1:
+            return scoring[0]
+
+    return {'bool': optimised}
+
+
+def optimise(query: dict) -> dict:
+    """ Rewrite a query dict into an equivalent, cheaper query.
+
+        * ``range`` queries on the same field under AND are merged, and
+          contradictory ranges turn the query into ``match_none``
+        * ``term`` / ``terms`` queries on the same field under OR are merged
+          into a single ``terms`` query
+        * double negations are removed
+        * ``match_all`` / ``match_none`` clauses are folded into the enclosing
+          bool query
+        * nested bool queries which can be merged into their parent are lifted
+
+        :param query: the query dict
+        :return: the optimised query dict
+    """
+    if not _is(query, 'bool'):
+        return query
+
+    # Optimise nested bool queries before the queries containing them,
+    # without recursing, so deep queries do not exceed the recursion limit.
+    order = []
+    stack = [query]
+    while stack:
+        current = stack.pop()
+        order.append(current)
+        for kind in ('must', 'filter', 'must_not', 'should'):
+            stack.extend(
+                child for child in current['bool'].get(kind, ())
+                if _is(child, 'bool')
+            )
+
+    optimised = {}
+    for current in reversed(order):
+        optimised[id(current)] = _optimise_bool(current['bool'], optimised)
+    return optimised[id(query)]
@@ -0,0 +1,302 @@
+# encoding: utf-8
+"""
+Index pruning and routing
+
+Work out from an AST which time partitioned indices can hold matching
+documents, and the shard routing values its equality predicates imply, so a
+search only hits the shards it needs.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from pygeofilter import ast, values
+
+from .evaluate import flatten_combination
+from .fields import FieldResolver, _to_date
+from .filters import TEMPORAL_OPS, temporal_bounds
+
+PERIODS = ('year', 'month', 'day')
+
+
+def _analyse(node, leaf, both, either, unknown):
+    """Combine a value computed for each predicate of an AST, with ``both``
+    for ``AND`` and ``either`` for ``OR``. Negations give ``unknown``."""
+    results = []
+    stack = [(node, None)]
+
+    while stack:
+        current, count = stack.pop()
+
+        if isinstance(current, (ast.And, ast.Or)):
+            if count is None:
+                operands = flatten_combination(current)
+                stack.append((current, len(operands)))
+                stack.extend((operand, None) for operand in reversed(operands))
+            else:
+                operands = results[-count:]
+                del results[-count:]
+                combine = both if isinstance(current, ast.And) else either
+                results.append(combine(operands))
+        elif isinstance(current, ast.Not):
+            results.append(unknown)
+        else:
+            results.append(leaf(current))
+
+    result, = results
+    return result
+
+
+def _is_field(node, field, resolver) -> bool:
+    return isinstance(node, ast.Attribute) and resolver(node.name) == field
+
+
+def _time(value):
+    """A literal as an aware UTC datetime, or ``None`` if it is not a time."""
+    value = _to_date(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    if isinstance(value, date):
+        return datetime(
+            value.year, value.month, value.day, tzinfo=timezone.utc
+        )
+    return None
+
+
+def _time_span(value):
+    if isinstance(value, values.Interval):
+        return value.start, value.end
+    return value
+
+
+def _predicate_bounds(node, field, resolver):
+    if not _is_field(getattr(node, 'lhs', None), field, resolver):
+        return None, None
+
+    if isinstance(node, ast.TemporalPredicate):
+        if node.op.value not in TEMPORAL_OPS:
+            return None, None
+        try:
+            low, high = temporal_bounds(_time_span(node.rhs), node.op.value)
+        except (AssertionError, TypeError):
+            return None, None
+        return (
+            _time(low) if low is not None else None,
+            _time(high) if high is not None else None
+        )
+
+    if isinstance(node, ast.Between) and not node.not_:
+        return _time(node.low), _time(node.high)
+
+    if isinstance(node, ast.Comparison):
+        op = node.op.value
+        value = _time(node.rhs)
+        if op == '=':
+            return value, value
+        if op in ('<', '<='):
+            return None, value
+        if op in ('>', '>='):
+            return value, None
+
+    return None, None
+
+
+def _intersect_bounds(bounds):
+    lows = [low for low, _ in bounds if low is not None]
+    highs = [high for _, high in bounds if high is not None]
+    return max(lows) if lows else None, min(highs) if highs else None
+
+
+def _hull_bounds(bounds):
+    lows = [low for low, _ in bounds]
+    highs = [high for _, high in bounds]
+    return (
+        None if None in lows else min(lows),
+        None if None in highs else max(highs),
+    )
+
+
+def time_bounds(ast, time_field: str, field_mapping=None, field_default=None):
+    """ The span of times a document must have in a field to match an AST.
+
+        :param ast: the abstract syntax tree
+        :param time_field: the Elasticsearch time field
+        :param field_mapping: Lookup from field name to data model, or a
+                              :class:`pygeofilter_elasticsearch.fields.FieldResolver`
+        :param field_default: Default attribute value if not in lookup.
+        :return: a ``(low, high)`` tuple of inclusive UTC datetimes, either of
+                 which is ``None`` if unbounded
+    """
+    resolver = FieldResolver.from_options(field_mapping, field_default)
+    return _analyse(
+        ast,
+        lambda node: _predicate_bounds(node, time_field, resolver),
+        _intersect_bounds,
+        _hull_bounds,
+        (None, None)
+    )
+
+
+def _predicate_routing(node, field, resolver):
+    if not _is_field(getattr(node, 'lhs', None), field, resolver):
+        return None
+
+    if isinstance(node, ast.Equal) and not isinstance(node.rhs, ast.Node):
+        return {node.rhs}
+    if isinstance(node, ast.In) and not node.not_ and \
+            not any(isinstance(option, ast.Node) for option in node.sub_nodes):
+        return set(node.sub_nodes)
+    return None
+
+
+def _intersect_routing(routings):
+    known = [routing for routing in routings if routing is not None]
+    return set.intersection(*known) if known else None
+
+
+def _union_routing(routings):
+    if any(routing is None for routing in routings):
+        return None
+    return set.union(*routings)
+
+
+def routing_values(ast, routing_field: str, field_mapping=None,
+                   field_default=None):
+    """ The values a document must have in its routing field to match an AST.
+
+        :param ast: the abstract syntax tree
+        :param routing_field: the field documents are routed by
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :return: a sorted list of the values, or ``None`` if any value may
+                 match. An empty list if no value can match.
+    """
+    resolver = FieldResolver.from_options(field_mapping, field_default)
+    routing = _analyse(
+        ast,
+        lambda node: _predicate_routing(node, routing_field, resolver),
+        _intersect_routing,
+        _union_routing,
+        None
+    )
+    return None if routing is None else sorted(str(value) for value in routing)
+
+
+def _period_start(value: datetime, period: str) -> datetime:
+    if period == 'year':
+        return value.replace(
+            month=1, day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+    if period == 'month':
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_period(value: datetime, period: str) -> datetime:
+    if period == 'year':
+        return value.replace(year=value.year + 1)
+    if period == 'month':
+        if value.month == 12:
+            return value.replace(year=value.year + 1, month=1)
+        return value.replace(month=value.month + 1)
+    return value + timedelta(days=1)
+
+
+class TimePartitions:
+    """A scheme of one index per calendar year, month or day, in UTC.
+
+    :param name_format: the ``strftime`` format of the index names, e.g.
+    ``items-%Y-%m``
+    :param period: the period of each index, ``"year"``, ``"month"`` or
+    ``"day"``
+    :param first: the time of the first index, to prune searches with no
+    lower time bound. Leave as `None` to search the wildcard instead.
+    :param last: the time of the last index. Leave as `None` to use the
+    current time.
+    :param wildcard: the pattern matching every index. Leave as `None` to
+    use the name format up to its first ``%`` followed by ``*``.
+    """
+
+    def __init__(self, name_format: str, period: str = 'month', first=None,
+                 last=None, wildcard=None):
+        assert period in PERIODS, f'period must be one of {PERIODS}'
+        self.name_format = name_format
+        self.period = period
+        self.first = _time(first) if first is not None else None
+        self.last = _time(last) if last is not None else None
+        self.wildcard = wildcard or f"{name_format.split('%', 1)[0]}*"
+
+    def indices(self, low=None, high=None) -> list:
+        """ The indices which hold the documents in a span of time.
+
+            :param low: the inclusive lower time, or ``None``
+            :param high: the inclusive upper time, or ``None``
+            :return: the index names. An empty list if the span is empty.
+        """
+        low = low if low is not None else self.first
+        if low is None:
+            return [self.wildcard]
+
+        if high is None:
+            high = self.last or datetime.now(timezone.utc)
+        if self.first is not None:
+            low = max(low, self.first)
+        if self.last is not None:
+            high = min(high, self.last)
+        if low > high:
+            return []
+
+        names = []
+        current = _period_start(low, self.period)
+        while current <= high:
+            names.append(current.strftime(self.name_format))
+            current = _next_period(current, self.period)
+        return names
+
+
+def search_target(ast, partitions: TimePartitions, time_field: str,
+                  routing_field: str = None, field_mapping=None,
+                  field_default=None) -> Optional[dict]:
+    """ The ``index`` and ``routing`` arguments of the client ``search`` call
+        for an AST, limited to the indices and shards which can hold matching
+        documents.
+
+        e.g.::
+
+            target = search_target(ast, partitions, 'datetime', 'platform')
+            if target is not None:
+                response = client.search(**target, query=query)
+
+        :param ast: the abstract syntax tree
+        :param partitions: the partition scheme of the indices
+        :param time_field: the Elasticsearch field the indices are
+                           partitioned by
+        :param routing_field: the Elasticsearch field documents are routed by
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :return: the search arguments, or ``None`` if no document can match,
+                 so there is no need to search. An empty ``index`` would
+                 search every index of the cluster.
+    """
+    resolver = FieldResolver.from_options(field_mapping, field_default)
+    indices = partitions.indices(*time_bounds(ast, time_field, resolver))
+    if not indices:
+        return None
+    target = {'index': ','.join(indices)}
+
+    if routing_field is not None:
+        routing = routing_values(ast, routing_field, resolver)
+        if routing == []:
+            # contradictory equalities, e.g. ``r = 'a' AND r = 'b'``
+            return None
+        if routing is not None:
+            target['routing'] = ','.join(routing)
+
+    return target
@@ -0,0 +1,445 @@
+# encoding: utf-8
+"""
+Search helpers
+
+Translate CQL filters and execute them against Elasticsearch with a shared
+client, and stream every hit of a filter with ``search_after`` over a point
+in time.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import asyncio
+from queue import Queue, Full
+from threading import Event, Thread
+
+from pygeofilter import ast
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from .aggregations import to_aggregation_body
+from .evaluate import ElasticsearchDictEvaluator
+from .fields import FieldResolver
+from .hybrid import split_filter
+
+
+def parse(cql) -> 'ast.Node':
+    """ Parse a CQL filter.
+
+        :param cql: an AST, ECQL text, or CQL-JSON as a dict or a string
+        :return: the AST
+    """
+    if isinstance(cql, dict):
+        return parse_json(cql)
+    if isinstance(cql, str):
+        if cql.lstrip().startswith('{'):
+            return parse_json(cql)
+
+        # the ECQL grammar is slow to load, so only load it when used
+        from pygeofilter.parsers.ecql import parse as parse_text
+        return parse_text(cql)
+    return cql
+
+
+TIEBREAKER = {'_shard_doc': 'asc'}
+
+_DONE = object()
+
+
+def _query_dict(query) -> dict:
+    return query.to_dict() if hasattr(query, 'to_dict') else query
+
+
+def page_params(query: dict, pit_id: str, keep_alive: str, page_size: int,
+                sort: list = None, search_after: list = None,
+                **params) -> dict:
+    """ The keyword arguments of the client ``search`` call for one page of
+        hits of a point in time.
+
+        :param query: the query dict
+        :param pit_id: the point in time id
+        :param keep_alive: how long to keep the point in time open
+        :param page_size: the number of hits per page
+        :param sort: the sort order. The ``_shard_doc`` tiebreaker is added.
+        :param search_after: the sort values of the last hit of the previous
+                             page
+        :param params: further ``search`` arguments
+        :return: the keyword arguments
+    """
+    page = {
+        'query': query,
+        'pit': {'id': pit_id, 'keep_alive': keep_alive},
+        'size': page_size,
+        'sort': list(sort or []) + [TIEBREAKER],
+        'track_total_hits': False,
+        **params
+    }
+    if search_after is not None:
+        page['search_after'] = search_after
+    return page
+
+
+def _put(queue, item, stop):
+    """Put an item on the queue, unless stopped while waiting for space."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _prefetched(pages, size):
+    """Fetch up to ``size`` pages ahead in a thread while the caller
+    consumes the current page."""
+    queue = Queue(maxsize=size)
+    stop = Event()
+
+    def produce():
+        try:
+            for page in pages:
+                if not _put(queue, page, stop):
+                    return
+            item = _DONE
+        except Exception as exc:
+            item = exc
+        _put(queue, item, stop)
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            page = queue.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+    finally:
+        stop.set()
+        thread.join()
+
+
+def scan(client, query, index, page_size=1000, keep_alive='1m', sort=None,
+         prefetch=1, **params):
+    """ Stream every hit of a query, a page at a time, using ``search_after``
+        over a point in time, so deep pages cost the same as the first.
+
+        :param client: the Elasticsearch client
+        :param query: the output of
+                      :func:`pygeofilter_elasticsearch.to_filter`, or a query
+                      dict
+        :param index: the index to search
+        :param page_size: the number of hits per page
+        :param keep_alive: how long to keep the point in time open between
+                           pages
+        :param sort: the sort order. The ``_shard_doc`` tiebreaker is added.
+        :param prefetch: the number of pages to fetch ahead in a background
+                         thread. ``0`` to fetch each page when it is needed.
+        :param params: further ``search`` arguments, e.g. ``_source``
+        :return: a generator of hits
+    """
+    query = _query_dict(query)
+    pit = {
+        'id': client.open_point_in_time(
+            index=index, keep_alive=keep_alive
+        )['id']
+    }
+
+    def pages():
+        search_after = None
+        while True:
+            response = client.search(**page_params(
+                query, pit['id'], keep_alive, page_size, sort, search_after,
+                **params
+            ))
+            pit['id'] = response.get('pit_id', pit['id'])
+            hits = response['hits']['hits']
+            if hits:
+                yield hits
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]['sort']
+
+    try:
+        if prefetch:
+            yield from _prefetched(pages(), prefetch)
+        else:
+            for page in pages():
+                yield from page
+    finally:
+        client.close_point_in_time(id=pit['id'])
+
+
+async def async_scan(client, query, index, page_size=1000, keep_alive='1m',
+                     sort=None, prefetch=1, **params):
+    """ Async version of :func:`scan`, for an ``AsyncElasticsearch`` client.
+        Pages are fetched ahead in a task rather than a thread.
+
+        :return: an async generator of hits
+    """
+    query = _query_dict(query)
+    pit = {
+        'id': (await client.open_point_in_time(
+            index=index, keep_alive=keep_alive
+        ))['id']
+    }
+
+    async def pages():
+        search_after = None
+        while True:
+            response = await client.search(**page_params(
+                query, pit['id'], keep_alive, page_size, sort, search_after,
+                **params
+            ))
+            pit['id'] = response.get('pit_id', pit['id'])
+            hits = response['hits']['hits']
+            if hits:
+                yield hits
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]['sort']
+
+    async def produce(queue):
+        try:
+            async for page in pages():
+                await queue.put(page)
+            await queue.put(_DONE)
+        except Exception as exc:
+            await queue.put(exc)
+
+    try:
+        if not prefetch:
+            async for page in pages():
+                for hit in page:
+                    yield hit
+            return
+
+        queue = asyncio.Queue(maxsize=prefetch)
+        producer = asyncio.ensure_future(produce(queue))
+        try:
+            while True:
+                page = await queue.get()
+                if page is _DONE:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for hit in page:
+                    yield hit
+        finally:
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+    finally:
+        await client.close_point_in_time(id=pit['id'])
+
+
+class FilterSearch:
+    """Translates CQL filters into queries for one Elasticsearch client.
+
+    The field mapping is resolved once and reused by every search.
+
+    :param client: the Elasticsearch client, shared by every search
+    :param index: the index to search, unless another is given per search
+    :param field_mapping: Lookup from field name to data model.
+    :param field_default: Default attribute value if not in lookup.
+    :param options: Further evaluator options, such as ``filter_context``.
+    """
+
+    def __init__(self, client, index=None, field_mapping=None,
+                 field_default=None, **options):
+        self.client = client
+        self.index = index
+        self.resolver = FieldResolver.from_options(
+            field_mapping, field_default
+        )
+        self.options = options
+
+    def query(self, cql) -> dict:
+        """ Translate a CQL filter into a query dict.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :return: the query dict
+        """
+        evaluator = ElasticsearchDictEvaluator(
+            self.resolver, None, **self.options
+        )
+        return evaluator.evaluate(parse(cql))
+
+    def search_params(self, cql, index=None, **params) -> dict:
+        """The keyword arguments of the client ``search`` call for a filter."""
+        return {
+            'index': index or self.index, 'query': self.query(cql), **params
+        }
+
+    def search(self, cql, index=None, **params):
+        """ Translate a CQL filter and execute the search.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param index: the index to search
+            :param params: further ``search`` arguments, e.g. ``size``
+            :return: the search response
+        """
+        return self.client.search(**self.search_params(cql, index, **params))
+
+    def aggregation_params(self, cql, specs, index=None, count=True,
+                           **params) -> dict:
+        """The keyword arguments of the client ``search`` call for the
+        aggregations of a filter."""
+        body = to_aggregation_body(
+            parse(cql), specs, self.resolver, None, count, **self.options
+        )
+        return {'index': index or self.index, **body, **params}
+
+    def aggregate(self, cql, specs, index=None, count=True, **params):
+        """ Compute aggregations of the documents matching a CQL filter,
+            without fetching any hits. See
+            :func:`pygeofilter_elasticsearch.aggregations.to_aggregation_body`.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param specs: the aggregation specs by name
+            :param index: the index to search
+            :param count: count every matching document
+            :return: the search response
+        """
+        return self.client.search(
+            **self.aggregation_params(cql, specs, index, count, **params)
+        )
+
+    def scan(self, cql, index=None, **kwargs):
+        """ Translate a CQL filter and stream every hit.
+            See :func:`scan` for the further arguments.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param index: the index to search
+            :return: a generator of hits
+        """
+        return scan(
+            self.client, self.query(cql), index or self.index, **kwargs
+        )
+
+    def split(self, cql, function_map=None):
+        """ Split a CQL filter into a query and a residual Python predicate.
+            See :func:`pygeofilter_elasticsearch.hybrid.split_filter`.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param function_map: functions the residual may call, by name
+            :return: a :class:`pygeofilter_elasticsearch.hybrid.HybridFilter`
+        """
+        return split_filter(
+            parse(cql), self.resolver, None, function_map, **self.options
+        )
+
+    def hybrid_scan(self, cql, index=None, function_map=None, **kwargs):
+        """ Stream every hit of a CQL filter, letting Elasticsearch evaluate
+            what it can and applying the rest to the hits in Python.
+            See :func:`scan` for the further arguments.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param index: the index to search
+            :param function_map: functions the residual may call, by name
+            :return: a generator of hits
+        """
+        hybrid = self.split(cql, function_map)
+        return hybrid.filter_hits(
+            scan(self.client, hybrid.query, index or self.index, **kwargs)
+        )
+
+
+class AsyncFilterSearch(FilterSearch):
+    """Executes CQL filters concurrently with an ``AsyncElasticsearch``
+    client, which needs the ``async`` extra:
+    ``pip install pygeofilter-elasticsearch[async]``.
+
+    :param client: the async Elasticsearch client, shared by every search. Any
+    object with an async ``search`` method taking the client's keyword
+    arguments will do.
+    :param max_concurrency: The most searches to run at once.
+    """
+
+    def __init__(self, client, index=None, field_mapping=None,
+                 field_default=None, max_concurrency=10, **options):
+        super().__init__(
+            client, index, field_mapping, field_default, **options
+        )
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # created on first use, so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.BoundedSemaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def search(self, cql, index=None, **params):
+        """ Translate a CQL filter and execute the search.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param index: the index to search
+            :param params: further ``search`` arguments, e.g. ``size``
+            :return: the search response
+        """
+        search_params = self.search_params(cql, index, **params)
+        async with self.semaphore:
+            return await self.client.search(**search_params)
+
+    async def aggregate(self, cql, specs, index=None, count=True, **params):
+        """ Async version of :meth:`FilterSearch.aggregate`.
+
+            :return: the search response
+        """
+        search_params = self.aggregation_params(
+            cql, specs, index, count, **params
+        )
+        async with self.semaphore:
+            return await self.client.search(**search_params)
+
+    async def search_many(self, filters, index=None, **params) -> list:
+        """ Execute many CQL filters concurrently, at most
+            ``max_concurrency`` at a time.
+
+            :param filters: the CQL filters
+            :param index: the index to search
+            :param params: further ``search`` arguments, e.g. ``size``
+            :return: the search responses, in the order of ``filters``
+        """
+        return await asyncio.gather(*(
+            self.search(cql, index, **params) for cql in filters
+        ))
+
+    def scan(self, cql, index=None, **kwargs):
+        """ Translate a CQL filter and stream every hit.
+            See :func:`async_scan` for the further arguments.
+
+            :param cql: an AST, ECQL text, or CQL-JSON
+            :param index: the index to search
+            :return: an async generator of hits
+        """
+        return async_scan(
+            self.client, self.query(cql), index or self.index, **kwargs
+        )
+
+    async def hybrid_scan(self, cql, index=None, function_map=None, **kwargs):
+        """ Async version of :meth:`FilterSearch.hybrid_scan`.
+
+            :return: an async generator of hits
+        """
+        hybrid = self.split(cql, function_map)
+        predicate = hybrid.predicate
+        hits = async_scan(
+            self.client, hybrid.query, index or self.index, **kwargs
+        )
+
+        try:
+            async for hit in hits:
+                if predicate is None or predicate(hit['_source']):
+                    yield hit
+        finally:
+            await hits.aclose()
@@ -0,0 +1,116 @@
+# encoding: utf-8
+"""
+Serialisation
+
+Serialise translated queries straight to compact JSON bytes for the request
+body, with ``orjson`` when it is installed, and estimate their size without
+serialising them.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .evaluate import to_dict_filter
+
+
+def json_default(value):
+    """Serialise the values JSON does not support, dates as ISO strings."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(
+        f'Object of type {type(value).__name__} is not JSON serializable'
+    )
+
+
+def dumps(query) -> bytes:
+    """ Serialise a query to compact JSON.
+
+        :param query: a query dict or ``elasticsearch_dsl`` Query object, or a
+                      search body
+        :return: the UTF-8 encoded JSON
+    """
+    if hasattr(query, 'to_dict'):
+        query = query.to_dict()
+
+    if orjson is not None:
+        return orjson.dumps(query, default=json_default)
+    return json.dumps(
+        query, separators=(',', ':'), ensure_ascii=False, default=json_default
+    ).encode()
+
+
+def _string_size(value: str) -> int:
+    return len(value.encode()) + 2 + value.count('"') + value.count('\\')
+
+
+def estimate_size(query) -> int:
+    """ Estimate the size of a query serialised by :func:`dumps`, without
+        serialising it. The estimate is exact for queries without control
+        characters in their strings.
+
+        :param query: a query dict, or a search body
+        :return: the size in bytes
+    """
+    size = 0
+    stack = [query]
+
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, str):
+            size += _string_size(value)
+        elif value is True or value is None:
+            size += 4
+        elif value is False:
+            size += 5
+        elif isinstance(value, int):
+            size += len(str(value))
+        elif isinstance(value, float):
+            size += len(repr(value))
+        elif isinstance(value, dict):
+            # braces, a colon per item and the commas between them
+            size += 2 + 2 * len(value) - (1 if value else 0)
+            size += sum(_string_size(str(key)) for key in value)
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            size += 2 + max(len(value) - 1, 0)
+            stack.extend(value)
+        elif isinstance(value, (date, datetime)):
+            size += len(value.isoformat()) + 2
+        elif hasattr(value, 'to_dict'):
+            stack.append(value.to_dict())
+        else:
+            size += len(json.dumps(value, default=json_default))
+
+    return size
+
+
+def to_body(ast, field_mapping=None, field_default=None, search=None,
+            **options) -> bytes:
+    """ Translate an AST straight to a compact search request body.
+
+        Pass ``optimise=True`` to unwrap bool queries around a single clause,
+        and ``coordinate_precision`` to shorten geometries.
+
+        :param ast: the abstract syntax tree
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param search: Further parameters of the search body, e.g.
+        ``{'size': 10}``
+        :param options: Further evaluator options, such as ``filter_context``.
+        See :class:`.evaluate.ElasticsearchFilterEvaluator`.
+        :return: the UTF-8 encoded JSON body
+    """
+    query = to_dict_filter(ast, field_mapping, field_default, **options)
+    return dumps({**(search or {}), 'query': query})
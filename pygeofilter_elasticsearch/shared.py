@@ -0,0 +1,167 @@
+# encoding: utf-8
+"""
+Shared filters
+
+Find the conditions which every filter of a batch has in common, and hoist
+them into one shared filter clause, so Elasticsearch evaluates them once
+rather than once per filter.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import json
+
+from pygeofilter import ast
+
+from .aggregations import aggregations
+from .cache import canonical_key
+from .evaluate import ElasticsearchDictEvaluator, flatten_combination
+from .fields import FieldResolver
+from .serialise import json_default
+
+
+def _conjuncts(node) -> list:
+    return flatten_combination(node) if isinstance(node, ast.And) else [node]
+
+
+def split_shared(asts):
+    """ Split ASTs into the ``AND`` operands they all have in common and the
+        rest of each AST.
+
+        :param asts: the abstract syntax trees
+        :return: a ``(shared, residuals)`` tuple of the shared AST, ``None``
+                 if nothing is shared, and the remaining AST of each AST,
+                 ``None`` where nothing remains
+    """
+    keyed = [
+        [(canonical_key(conjunct), conjunct) for conjunct in _conjuncts(node)]
+        for node in asts
+    ]
+    if not keyed:
+        return None, []
+
+    common = set.intersection(
+        *({key for key, _ in conjuncts} for conjuncts in keyed)
+    )
+
+    shared = []
+    seen = set()
+    for key, conjunct in keyed[0]:
+        if key in common and key not in seen:
+            shared.append(conjunct)
+            seen.add(key)
+
+    residuals = []
+    for conjuncts in keyed:
+        rest = [conjunct for key, conjunct in conjuncts if key not in common]
+        residuals.append(ast.And.from_items(*rest) if rest else None)
+
+    return (ast.And.from_items(*shared) if shared else None), residuals
+
+
+def _translate_shared(asts, field_mapping, field_default, options):
+    shared, residuals = split_shared(list(asts))
+
+    options['filter_context'] = True
+    evaluator = ElasticsearchDictEvaluator(
+        FieldResolver.from_options(field_mapping, field_default), None,
+        **options
+    )
+
+    shared_query = evaluator.evaluate(shared) if shared is not None else None
+    queries = [
+        evaluator.evaluate(residual) if residual is not None else None
+        for residual in residuals
+    ]
+    return evaluator, shared_query, queries
+
+
+def to_shared_aggregation_body(asts, names=None, specs=None,
+                               field_mapping=None, field_default=None,
+                               count=True, name='queries', **options) -> dict:
+    """ Translate many ASTs into one ``size: 0`` search body. The conditions
+        every AST shares become the query, and the rest of each AST a bucket
+        of a ``filters`` aggregation, whose ``doc_count`` is the number of
+        documents matching that AST.
+
+        :param asts: the abstract syntax trees
+        :param names: the bucket name of each AST. Leave as `None` to name
+        them by their position.
+        :param specs: aggregation specs to compute in each bucket.
+        See :func:`pygeofilter_elasticsearch.aggregations.aggregation`.
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :param count: Count the documents matching the shared conditions.
+        :param name: The name of the ``filters`` aggregation.
+        :param options: Further evaluator options.
+        :return: the search body
+    """
+    asts = list(asts)
+    if names is None:
+        names = [str(position) for position in range(len(asts))]
+    else:
+        names = list(names)
+    assert len(names) == len(asts), 'Give one name per AST'
+
+    evaluator, shared_query, queries = _translate_shared(
+        asts, field_mapping, field_default, options
+    )
+
+    buckets = {
+        bucket: query if query is not None else evaluator.filters.match_all()
+        for bucket, query in zip(names, queries)
+    }
+    filters_agg = {'filters': {'filters': buckets}}
+    if specs:
+        filters_agg['aggs'] = aggregations(evaluator, specs)
+
+    if shared_query is None:
+        shared_query = evaluator.filters.match_all()
+
+    return {
+        'size': 0,
+        'query': shared_query,
+        'track_total_hits': count,
+        'aggs': {name: filters_agg},
+    }
+
+
+def to_shared_msearch(asts, field_mapping=None, field_default=None,
+                      index=None, search=None, **options) -> str:
+    """ Translate many ASTs to the NDJSON body of an ``_msearch`` request in
+        which the conditions every AST shares are one identical filter
+        clause of every search, which Elasticsearch caches after the first.
+
+        :param asts: the abstract syntax trees
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        :param index: The index for every search.
+        :param search: Further parameters of every search body.
+        :param options: Further evaluator options.
+        :return: the request body, a header line and a body line per AST
+    """
+    _, shared_query, queries = _translate_shared(
+        asts, field_mapping, field_default, options
+    )
+
+    header = json.dumps({'index': index} if index else {})
+    lines = []
+
+    for query in queries:
+        clauses = [
+            clause for clause in (shared_query, query) if clause is not None
+        ]
+        if len(clauses) == 1:
+            body_query = clauses[0]
+        else:
+            body_query = {'bool': {'filter': clauses}}
+
+        lines.append(header)
+        lines.append(json.dumps(
+            {**(search or {}), 'query': body_query}, default=json_default
+        ))
+
+    return ''.join(f'{line}\n' for line in lines)
@@ -0,0 +1,241 @@
+# encoding: utf-8
+"""
+Query templates
+
+Compile an AST once into a query template, where each literal becomes a named
+slot, then bind new literal values to produce the query dict without
+evaluating the AST again.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from pygeofilter.backends.evaluator import handle
+from pygeofilter import ast
+from pygeofilter import values
+
+from .cache import canonical_key
+from .evaluate import ElasticsearchDictEvaluator
+from .filters import temporal_bounds, temporal_range
+
+
+class Slot:
+    """Placeholder for a literal value in a query template."""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f'Slot({self.name!r})'
+
+
+class Computed:
+    """A value of a query template computed from slot values when it is
+    bound."""
+
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __repr__(self):
+        args = ', '.join(map(repr, self.args))
+        return f'Computed({self.function.__name__}, {args})'
+
+
+def _fill(query, bound):
+    if isinstance(query, dict):
+        return {key: _fill(value, bound) for key, value in query.items()}
+    if isinstance(query, list):
+        return [_fill(value, bound) for value in query]
+    if isinstance(query, tuple):
+        return tuple(_fill(value, bound) for value in query)
+    if isinstance(query, Slot):
+        return bound[query.name]
+    if isinstance(query, Computed):
+        return query.function(*_fill(query.args, bound))
+    return query
+
+
+def _temporal_range(time_or_period, op, granularity):
+    return temporal_range(*temporal_bounds(time_or_period, op), granularity)
+
+
+def literals(node):
+    """ Collect the literal values of an AST, in evaluation order.
+
+        :param node: the abstract syntax tree
+        :return: a list of literal values
+    """
+    found = []
+    stack = [node]
+
+    while stack:
+        current = stack.pop()
+        if isinstance(current, values.LITERALS):
+            found.append(current)
+        elif hasattr(current, 'get_sub_nodes'):
+            sub_nodes = current.get_sub_nodes()
+            if isinstance(sub_nodes, list):
+                stack.extend(reversed(sub_nodes))
+            elif sub_nodes is not None:
+                stack.append(sub_nodes)
+
+    return found
+
+
+#: Attributes of AST nodes which hold their sub-nodes
+SUB_NODE_FIELDS = frozenset(
+    ('sub_node', 'lhs', 'rhs', 'low', 'high', 'sub_nodes', 'arguments')
+)
+
+
+def signature(node):
+    """ The structure of an AST with its literal values masked, so ASTs
+        which differ only in the values :func:`literals` collects share it.
+
+        :param node: the abstract syntax tree
+        :return: a hashable signature
+    """
+    key = []
+    stack = [node]
+
+    while stack:
+        current = stack.pop()
+        if isinstance(current, values.LITERALS):
+            key.append(Slot)
+        elif hasattr(current, 'get_sub_nodes'):
+            key.append(type(current))
+            key.append(canonical_key({
+                name: value for name, value in vars(current).items()
+                if name not in SUB_NODE_FIELDS
+            }))
+            sub_nodes = current.get_sub_nodes()
+            if isinstance(sub_nodes, list):
+                key.append(len(sub_nodes))
+                stack.extend(reversed(sub_nodes))
+            elif sub_nodes is not None:
+                stack.append(sub_nodes)
+        else:
+            # values which are not slots, e.g. geometries, stay in the query
+            key.append(canonical_key(current))
+
+    return tuple(key)
+
+
+class TemplateEvaluator(ElasticsearchDictEvaluator):
+    """Dict evaluator which replaces every literal with a :class:`Slot`."""
+
+    # a slot may be bound to any value, so predicates on slots are not constant
+    fold_constants = False
+
+    def __init__(self, field_mapping, field_default, **options):
+        super().__init__(field_mapping, field_default, **options)
+        self.defaults = {}
+
+    def coerce(self, field, value, exact=True):
+        # convert the bound value, rather than the default
+        if isinstance(value, Slot) and self.index_mapping is not None:
+            return Computed(self.index_mapping.coerce, field, value, exact)
+        return super().coerce(field, value, exact)
+
+    @handle(*values.LITERALS)
+    def literal(self, node):
+        name = f'p{len(self.defaults)}'
+        self.defaults[name] = node
+        return Slot(name)
+
+    @handle(ast.TemporalPredicate, subclasses=True)
+    def temporal(self, node, lhs, rhs):
+        # The bounds may be computed from several literals, e.g. the start
+        # and duration of an interval, so compute them from the bound values.
+        op = node.op.value
+        granularity = self.temporal_granularity
+        bounds = _temporal_range(_fill(rhs, self.defaults), op, granularity)
+        if not bounds:
+            return self.filters.match_all()
+        return {
+            'range': {lhs: Computed(_temporal_range, rhs, op, granularity)}
+        }
+
+
+class QueryTemplate:
+    """A compiled query with named slots for its literal values.
+
+    :param query: the query dict, containing :class:`Slot` placeholders and
+    :class:`Computed` values
+    :param defaults: the literal values of the compiled AST, by slot name
+    :param signature: the :func:`signature` of the compiled AST. Leave as
+    `None` to only check the number of literals in :meth:`bind_ast`.
+    """
+
+    def __init__(self, query, defaults, signature=None):
+        self.query = query
+        self.defaults = defaults
+        self.signature = signature
+
+    @property
+    def slots(self):
+        """The slot names, in evaluation order."""
+        return tuple(self.defaults)
+
+    def bind(self, **values):
+        """ Produce the query dict with new literal values.
+
+            :param values: literal values by slot name. Slots which are not
+                           given keep the value from the compiled AST.
+            :return: a query dict
+            :raises ValueError: if a field of the ``index_mapping`` cannot
+                                hold a bound value
+        """
+        unknown = set(values).difference(self.defaults)
+        if unknown:
+            raise KeyError(
+                f'Unknown template slots: {", ".join(sorted(unknown))}'
+            )
+
+        return _fill(self.query, {**self.defaults, **values})
+
+    def bind_ast(self, ast):
+        """ Produce the query dict using the literal values of another AST with
+            the same structure as the compiled one.
+
+            :param ast: the abstract syntax tree
+            :return: a query dict
+            :raises ValueError: if the AST differs from the compiled one other
+                                than in its literal values, or a field of the
+                                ``index_mapping`` cannot hold one of them
+        """
+        if self.signature is not None and signature(ast) != self.signature:
+            raise ValueError(
+                'The AST does not have the structure of the compiled one'
+            )
+
+        found = literals(ast)
+        if len(found) != len(self.defaults):
+            raise ValueError(
+                f'Expected {len(self.defaults)} literal values, '
+                f'found {len(found)}'
+            )
+
+        return _fill(self.query, dict(zip(self.defaults, found)))
+
+
+def compile_template(ast, field_mapping=None, field_default=None, **options):
+    """ Compile an AST into a query template.
+
+        :param ast: the abstract syntax tree
+        :param field_mapping: Lookup from field name to data model.
+        :param field_default: Default attribute value if not in lookup.
+        Leave as `None` to use the field name as the default.
+        :param options: Further evaluator options.
+        :return: a :class:`QueryTemplate`
+    """
+    evaluator = TemplateEvaluator(field_mapping, field_default, **options)
+    query = evaluator.evaluate(ast)
+    return QueryTemplate(query, evaluator.defaults, signature(ast))
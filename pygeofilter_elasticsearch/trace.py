@@ -0,0 +1,195 @@
+# encoding: utf-8
+"""
+Instrumentation
+
+Record where translation time goes and the shape of the queries produced,
+for export to a metrics system such as Prometheus or OpenTelemetry.
+"""
+__author__ = 'Richard Smith'
+__date__ = '30 Jun 2021'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import json
+from threading import Lock
+
+BOOL_CLAUSES = ('filter', 'must', 'should', 'must_not')
+
+
+def query_shape(query: dict):
+    """ Count the leaf queries of a query dict and measure its nesting depth.
+
+        :param query: the query dict
+        :return: a ``(clauses, depth)`` tuple. A leaf query has depth 1, and
+                 each bool query adds 1.
+    """
+    clauses = 0
+    depth = 0
+    stack = [(query, 1)]
+
+    while stack:
+        current, level = stack.pop()
+        depth = max(depth, level)
+
+        if isinstance(current, dict) and len(current) == 1 and \
+                'bool' in current:
+            body = current['bool']
+            for kind in BOOL_CLAUSES:
+                stack.extend(
+                    (clause, level + 1) for clause in body.get(kind, ())
+                )
+        else:
+            clauses += 1
+
+    return clauses, depth
+
+
+def query_size(query: dict) -> int:
+    """ The size of a query dict serialised as compact JSON.
+
+        :param query: the query dict
+        :return: the size in bytes
+    """
+    return len(json.dumps(query, separators=(',', ':'), default=str).encode())
+
+
+class TranslationTrace:
+    """The measurements of translating one AST.
+
+    :param node_timings: ``[count, seconds]`` spent in the handlers by AST
+    node type name, excluding the time spent on their sub-nodes
+    :param seconds: the time taken by the whole translation
+    :param clauses: the number of leaf queries in the result
+    :param depth: the nesting depth of the result
+    :param size: the size of the result serialised as JSON, in bytes
+    """
+
+    def __init__(self, node_timings, seconds, clauses, depth, size):
+        self.node_timings = node_timings
+        self.seconds = seconds
+        self.clauses = clauses
+        self.depth = depth
+        self.size = size
+
+    def __repr__(self):
+        return (
+            f'TranslationTrace(seconds={self.seconds!r}, '
+            f'clauses={self.clauses!r}, depth={self.depth!r}, '
+            f'size={self.size!r})'
+        )
+
+
+class Tracer:
+    """Collects :class:`TranslationTrace` measurements from the evaluators it
+    is passed to as the ``tracer`` option, and totals them.
+
+    One tracer may be shared by evaluators in several threads. An evaluator
+    without a tracer measures nothing.
+
+    :param callback: Called with each :class:`TranslationTrace`, e.g. to log
+    or alert on pathological filters.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear the totals."""
+        with self._lock:
+            self.translations = 0
+            self.seconds = 0.0
+            self.node_timings = {}
+            self.clauses = 0
+            self.max_clauses = 0
+            self.max_depth = 0
+            self.size = 0
+            self.max_size = 0
+
+    def record(self, trace: TranslationTrace):
+        """ Add the measurements of one translation to the totals.
+
+            :param trace: the measurements
+        """
+        with self._lock:
+            self.translations += 1
+            self.seconds += trace.seconds
+            for name, (count, seconds) in trace.node_timings.items():
+                totals = self.node_timings.setdefault(name, [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+            self.clauses += trace.clauses
+            self.max_clauses = max(self.max_clauses, trace.clauses)
+            self.max_depth = max(self.max_depth, trace.depth)
+            self.size += trace.size
+            self.max_size = max(self.max_size, trace.size)
+
+        if self.callback is not None:
+            self.callback(trace)
+
+    def snapshot(self) -> dict:
+        """ The totals as plain data, for export to a metrics system.
+
+            :return: a dict of the totals
+        """
+        with self._lock:
+            return {
+                'translations': self.translations,
+                'seconds': self.seconds,
+                'nodes': {
+                    name: {'count': count, 'seconds': seconds}
+                    for name, (count, seconds)
+                    in sorted(self.node_timings.items())
+                },
+                'clauses': self.clauses,
+                'max_clauses': self.max_clauses,
+                'max_depth': self.max_depth,
+                'size': self.size,
+                'max_size': self.max_size,
+            }
+
+    def prometheus(self, prefix: str = 'pygeofilter_elasticsearch') -> str:
+        """ The totals in the Prometheus text exposition format.
+
+            :param prefix: the prefix of the metric names
+            :return: the metrics text
+        """
+        snapshot = self.snapshot()
+        metrics = [
+            ('translations_total', 'counter', 'Filters translated.',
+             snapshot['translations']),
+            ('translation_seconds_total', 'counter',
+             'Time spent translating filters.', snapshot['seconds']),
+            ('clauses_total', 'counter', 'Leaf queries produced.',
+             snapshot['clauses']),
+            ('clauses_max', 'gauge', 'Most leaf queries in one query.',
+             snapshot['max_clauses']),
+            ('query_depth_max', 'gauge', 'Deepest nesting of one query.',
+             snapshot['max_depth']),
+            ('query_bytes_total', 'counter',
+             'Serialised size of the queries produced.', snapshot['size']),
+            ('query_bytes_max', 'gauge',
+             'Serialised size of the largest query.', snapshot['max_size']),
+        ]
+
+        lines = []
+        for name, metric_type, description, value in metrics:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+            lines.append(f'{prefix}_{name} {value}')
+
+        for name, metric_type, field, description in (
+                ('nodes_total', 'counter', 'count',
+                 'AST nodes translated, by node type.'),
+                ('node_seconds_total', 'counter', 'seconds',
+                 'Time spent translating AST nodes, by node type.')):
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+            for node, totals in snapshot['nodes'].items():
+                lines.append(
+                    f'{prefix}_{name}{{node="{node}"}} {totals[field]}'
+                )
+
+        return ''.join(f'{line}\n' for line in lines)
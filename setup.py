@@ -24,6 +24,12 @@ requirements = [
     'elasticsearch_dsl'
 ]
 
+extras_requirements = {
+    'async': ['elasticsearch[async]'],
+    'hybrid': ['shapely'],
+    'fast': ['orjson'],
+}
+
 setup_requirements = [ ]
 
 test_requirements = [ ]
@@ -63,6 +69,7 @@ setup(
     license=__license__,
 
     install_requires=requirements,
+    extras_require=extras_requirements,
     long_description=_long_description,
     long_description_content_type='text/markdown',
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` aggregation pushdown.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from string import Template
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_aggregation_body
+
+EXPR = parse_json(json.dumps({'lt': [{'property': 'eo:cloud_cover'}, 10]}))
+
+FIELD_DEFAULT = Template('properties.${name}')
+
+
+class TestAggregationBody(unittest.TestCase):
+
+    def test_count(self):
+        self.assertEqual(
+            to_aggregation_body(EXPR, field_default=FIELD_DEFAULT),
+            {
+                'size': 0,
+                'query': {'bool': {'filter': [{'range': {'properties.eo:cloud_cover': {'lt': 10}}}]}},
+                'track_total_hits': True,
+            }
+        )
+
+    def test_aggregations(self):
+        body = to_aggregation_body(
+            EXPR,
+            {
+                'platforms': {'type': 'terms', 'property': 'platform', 'size': 20},
+                'monthly': {'type': 'date_histogram', 'property': 'datetime', 'interval': 'month'},
+                'daily': {'type': 'date_histogram', 'property': 'datetime', 'interval': '2d'},
+                'tiles': {'type': 'geotile_grid', 'property': 'geometry', 'precision': 6},
+                'cloud_cover': {'type': 'stats', 'property': 'eo:cloud_cover'},
+                'first': {'type': 'min', 'property': 'datetime'},
+                'with_instrument': {'type': 'count', 'property': 'instrument'},
+            },
+            field_mapping={'geometry': 'geometry'},
+            field_default=FIELD_DEFAULT,
+            count=False
+        )
+
+        self.assertEqual(body['size'], 0)
+        self.assertEqual(body['track_total_hits'], False)
+        self.assertEqual(body['aggs'], {
+            'platforms': {'terms': {'field': 'properties.platform', 'size': 20}},
+            'monthly': {'date_histogram': {'field': 'properties.datetime', 'calendar_interval': 'month'}},
+            'daily': {'date_histogram': {'field': 'properties.datetime', 'fixed_interval': '2d'}},
+            'tiles': {'geotile_grid': {'field': 'geometry', 'precision': 6}},
+            'cloud_cover': {'stats': {'field': 'properties.eo:cloud_cover'}},
+            'first': {'min': {'field': 'properties.datetime'}},
+            'with_instrument': {'value_count': {'field': 'properties.instrument'}},
+        })
+
+    def test_sub_aggregations(self):
+        body = to_aggregation_body(EXPR, {
+            'platforms': {
+                'type': 'terms',
+                'property': 'platform',
+                'aggregations': {'last': {'type': 'max', 'property': 'datetime'}}
+            }
+        })
+
+        self.assertEqual(body['aggs'], {
+            'platforms': {
+                'terms': {'field': 'platform'},
+                'aggs': {'last': {'max': {'field': 'datetime'}}}
+            }
+        })
+
+    def test_keyword_field(self):
+        mapping = {
+            'properties': {
+                'title': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}},
+                'eo:cloud_cover': {'type': 'float'},
+            }
+        }
+
+        body = to_aggregation_body(
+            EXPR, {'titles': {'type': 'terms', 'property': 'title'}}, index_mapping=mapping
+        )
+
+        self.assertEqual(body['aggs'], {'titles': {'terms': {'field': 'title.keyword'}}})
+
+    def test_invalid(self):
+        with self.assertRaises(AssertionError):
+            to_aggregation_body(EXPR, {'bad': {'type': 'top_hits', 'property': 'title'}})
+
+        with self.assertRaises(AssertionError):
+            to_aggregation_body(EXPR, {'bad': {
+                'type': 'stats',
+                'property': 'x',
+                'aggregations': {'y': {'type': 'min', 'property': 'y'}}
+            }})
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` batch translation.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from string import Template
+from unittest import mock
+
+from pygeofilter import ast
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, to_filters, to_dict_filters, to_msearch
+from pygeofilter_elasticsearch.batch import batch_key
+from pygeofilter_elasticsearch.evaluate import ElasticsearchDictEvaluator, ElasticsearchFilterEvaluator
+
+COLLECTION = {'eq': [{'property': 'collection'}, 'sentinel-2']}
+
+EXPRS = [
+    {'and': [COLLECTION, {'lt': [{'property': 'eo:cloud_cover'}, cloud_cover]}]}
+    for cloud_cover in (10, 20, 10, 30)
+] + [
+    {'or': [COLLECTION, {'not': COLLECTION}]},
+    {'after': [{'property': 'datetime'}, '2005-01-04T00:00:00Z']}
+]
+
+EQUAL = ast.Equal(ast.Attribute('a'), 1)
+
+
+def parse(expr):
+    return parse_json(json.dumps(expr))
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.asts = [parse(expr) for expr in EXPRS]
+
+    def test_matches_single(self):
+        options = {'field_default': Template('properties.${name}'), 'filter_context': True}
+
+        self.assertEqual(
+            to_dict_filters(self.asts, **options),
+            [to_dict_filter(ast, **options) for ast in self.asts]
+        )
+        self.assertEqual(
+            [query.to_dict() for query in to_filters(self.asts, **options)],
+            [to_filter(ast, **options).to_dict() for ast in self.asts]
+        )
+
+    def test_results_are_independent(self):
+        queries = to_dict_filters(self.asts)
+
+        queries[0]['bool']['must'].append({'match_all': {}})
+        queries[0]['bool']['must'][0]['term']['collection'] = 'landsat'
+
+        self.assertEqual(queries[2], to_dict_filter(self.asts[2]))
+        self.assertEqual(queries[1]['bool']['must'][0], {'term': {'collection': 'sentinel-2'}})
+
+    def test_repeated_ast_results_are_independent(self):
+        asts = [self.asts[0]] * 3
+
+        queries = to_dict_filters(asts)
+        queries[0]['bool']['must'].clear()
+        self.assertEqual(queries[1:], [to_dict_filter(self.asts[0])] * 2)
+
+        queries = to_filters(asts)
+        queries[0].must.clear()
+        self.assertEqual([query.to_dict() for query in queries[1:]], [to_filter(self.asts[0]).to_dict()] * 2)
+
+    def test_identical_asts_are_translated_once(self):
+        for function, evaluator in [
+            (to_dict_filters, ElasticsearchDictEvaluator),
+            (to_filters, ElasticsearchFilterEvaluator),
+        ]:
+            with mock.patch.object(evaluator, 'evaluate', autospec=True, side_effect=evaluator.evaluate) as evaluate:
+                queries = function(self.asts)
+
+            # the first and third expressions are parsed separately
+            self.assertEqual(evaluate.call_count, len(self.asts) - 1)
+            self.assertIsNot(queries[0], queries[2])
+
+    def test_batch_key(self):
+        self.assertEqual(batch_key(self.asts[0]), batch_key(parse(EXPRS[0])))
+
+        keys = [
+            batch_key(node) for node in [
+                ast.Equal(ast.Attribute('a'), 1),
+                ast.Equal(ast.Attribute('a'), 1.0),
+                ast.Equal(ast.Attribute('a'), True),
+                ast.Equal(ast.Attribute('b'), 1),
+                ast.NotEqual(ast.Attribute('a'), 1),
+                ast.Not(ast.Equal(ast.Attribute('a'), 1)),
+                ast.Equal(ast.Attribute('p'), ast.Attribute('q, rhs=ATTRIBUTE r')),
+                ast.Equal(ast.Attribute('p, rhs=ATTRIBUTE q'), ast.Attribute('r')),
+                ast.In(ast.Attribute('a'), [1, 2], False),
+                ast.In(ast.Attribute('a'), [1, 2], True),
+                ast.In(ast.Attribute('a'), [1, 2.0], False),
+                ast.And(ast.Or(EQUAL, EQUAL), EQUAL),
+                ast.Or(ast.And(EQUAL, EQUAL), EQUAL),
+                ast.And(EQUAL, ast.Or(EQUAL, EQUAL)),
+            ]
+        ]
+
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_processes(self):
+        self.assertEqual(
+            to_dict_filters(self.asts, processes=2, chunksize=2),
+            [to_dict_filter(ast) for ast in self.asts]
+        )
+
+    def test_msearch(self):
+        body = to_msearch(self.asts[:2], index='items', search={'size': 10})
+
+        self.assertEqual(
+            body,
+            '{"index": "items"}\n'
+            '{"size": 10, "query": {"bool": {"must": [{"term": {"collection": "sentinel-2"}}, '
+            '{"range": {"eo:cloud_cover": {"lt": 10}}}]}}}\n'
+            '{"index": "items"}\n'
+            '{"size": 10, "query": {"bool": {"must": [{"term": {"collection": "sentinel-2"}}, '
+            '{"range": {"eo:cloud_cover": {"lt": 20}}}]}}}\n'
+        )
+
+        lines = to_msearch(self.asts[-1:]).splitlines()
+
+        self.assertEqual(lines[0], '{}')
+        self.assertEqual(
+            json.loads(lines[1]),
+            {'query': {'range': {'datetime': {'gte': '2005-01-04T00:00:00+00:00'}}}}
+        )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` translation cache.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
+
+from pygeofilter import ast
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, FilterCache
+from pygeofilter_elasticsearch.cache import canonical_key
+
+
+def parse(expr):
+    return parse_json(json.dumps(expr))
+
+
+EXPR = {
+    'and': [
+        {'eq': [{'property': 'platform'}, 'faam']},
+        {'lt': [{'property': 'cloud_cover'}, 50]}
+    ]
+}
+
+
+class TestCanonicalKey(unittest.TestCase):
+
+    def test_equal_asts(self):
+        self.assertEqual(canonical_key(parse(EXPR)), canonical_key(parse(EXPR)))
+
+    def test_literal_types_differ(self):
+        self.assertNotEqual(
+            canonical_key(parse({'eq': [{'property': 'a'}, 1]})),
+            canonical_key(parse({'eq': [{'property': 'a'}, 1.0]}))
+        )
+
+    def test_attribute_names_differ(self):
+        # these print the same, ``Equal(lhs=ATTRIBUTE p, rhs=ATTRIBUTE q, ...)``
+        first = ast.Equal(ast.Attribute('p'), ast.Attribute('q, rhs=ATTRIBUTE r'))
+        second = ast.Equal(ast.Attribute('p, rhs=ATTRIBUTE q'), ast.Attribute('r'))
+
+        self.assertEqual(repr(first), repr(second))
+        self.assertNotEqual(canonical_key(first), canonical_key(second))
+
+    def test_operators_differ(self):
+        self.assertNotEqual(
+            canonical_key(parse({'lt': [{'property': 'a'}, 1]})),
+            canonical_key(parse({'gt': [{'property': 'a'}, 1]}))
+        )
+
+
+class TestFilterCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = FilterCache()
+
+        first = cache.to_filter(parse(EXPR))
+        second = cache.to_filter(parse(EXPR))
+
+        self.assertEqual(first.to_dict(), to_filter(parse(EXPR)).to_dict())
+        self.assertEqual(first, second)
+        self.assertEqual(cache.info().hits, 1)
+        self.assertEqual(cache.info().misses, 1)
+
+    def test_mapping_is_part_of_key(self):
+        cache = FilterCache()
+
+        plain = cache.to_dict_filter(parse(EXPR))
+        mapped = cache.to_dict_filter(parse(EXPR), field_default=Template('properties.${name}'))
+
+        self.assertNotEqual(plain, mapped)
+        self.assertEqual(cache.info().misses, 2)
+
+    def test_results_are_copies(self):
+        cache = FilterCache()
+
+        first = cache.to_dict_filter(parse(EXPR))
+        first['bool']['must'][0]['term']['platform'] = 'changed'
+        first['bool']['must'].clear()
+
+        second = cache.to_dict_filter(parse(EXPR))
+        self.assertEqual(second, to_filter(parse(EXPR)).to_dict())
+
+    def test_filter_results_are_copies(self):
+        cache = FilterCache()
+
+        first = cache.to_filter(parse(EXPR))
+        first.must[0].platform = 'changed'
+        first.must.clear()
+
+        second = cache.to_filter(parse(EXPR))
+        self.assertEqual(second.to_dict(), to_filter(parse(EXPR)).to_dict())
+        self.assertEqual(cache.info().hits, 1)
+
+    def test_options_are_part_of_key(self):
+        cache = FilterCache()
+
+        cache.to_dict_filter(parse(EXPR), filter_context=True)
+        cache.to_dict_filter(parse(EXPR), filter_context=True)
+        query = cache.to_dict_filter(parse(EXPR))
+
+        self.assertEqual(query, to_filter(parse(EXPR)).to_dict())
+        self.assertEqual(cache.info().hits, 1)
+
+    def test_no_collision(self):
+        cache = FilterCache()
+        first = ast.Equal(ast.Attribute('p'), ast.Attribute('q, rhs=ATTRIBUTE r'))
+        second = ast.Equal(ast.Attribute('p, rhs=ATTRIBUTE q'), ast.Attribute('r'))
+
+        cache.to_dict_filter(first)
+
+        self.assertEqual(cache.to_dict_filter(second), to_dict_filter(second))
+        self.assertEqual(cache.info().hits, 0)
+
+    def test_deep_tree(self):
+        node = ast.Equal(ast.Attribute('a'), 0)
+        for i in range(1, 20000):
+            node = (ast.And if i % 2 else ast.Or)(node, ast.Equal(ast.Attribute('a'), i))
+
+        cache = FilterCache()
+        first = cache.to_dict_filter(node)
+        second = cache.to_dict_filter(node)
+
+        self.assertEqual(cache.info().hits, 1)
+        # comparing the nested dicts would recurse, so compare the top
+        self.assertEqual(first.keys(), second.keys())
+        first['bool'].clear()
+        self.assertTrue(second['bool'])
+
+    def test_lru_eviction(self):
+        cache = FilterCache(maxsize=2)
+
+        for value in (1, 2, 1, 3):
+            cache.to_dict_filter(parse({'eq': [{'property': 'a'}, value]}))
+
+        self.assertEqual(cache.info().currsize, 2)
+
+        # 2 was least recently used, so has been evicted
+        cache.to_dict_filter(parse({'eq': [{'property': 'a'}, 1]}))
+        cache.to_dict_filter(parse({'eq': [{'property': 'a'}, 2]}))
+        self.assertEqual(cache.info().hits, 2)
+        self.assertEqual(cache.info().misses, 4)
+
+    def test_threads(self):
+        cache = FilterCache(maxsize=8)
+        asts = [parse({'eq': [{'property': 'a'}, i % 16]}) for i in range(400)]
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(cache.to_dict_filter, asts))
+
+        self.assertEqual(results, [{'term': {'a': i % 16}} for i in range(400)])
+        info = cache.info()
+        self.assertEqual(info.hits + info.misses, 400)
+        self.assertLessEqual(info.currsize, 8)
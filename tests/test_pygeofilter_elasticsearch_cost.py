@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` clause ordering.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter import ast
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+from pygeofilter_elasticsearch.cost import order_clauses, cost
+
+POLYGON = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 2], [2, 0], [0, 0]]]}
+
+EXPR = {
+    'and': [
+        {'intersects': [{'property': 'geometry'}, POLYGON]},
+        {'like': {'like': [{'property': 'title'}, '%lidar%']}},
+        {'gt': [{'property': 'cloud_cover'}, 10]},
+        {'in': {'value': {'property': 'platform'}, 'list': ['faam', 'bas']}},
+        {'eq': [{'property': 'public'}, True]},
+        {'eq': [{'property': 'flight_number'}, 'b069']}
+    ]
+}
+
+GEO_SHAPE = {'geo_shape': {'geometry': {'shape': POLYGON, 'relation': 'intersects'}}}
+WILDCARD = {'wildcard': {'title': {'value': '*lidar*', 'case_insensitive': True}}}
+RANGE = {'range': {'cloud_cover': {'gt': 10}}}
+TERMS = {'terms': {'platform': ['faam', 'bas']}}
+PUBLIC = {'term': {'public': True}}
+FLIGHT = {'term': {'flight_number': 'b069'}}
+
+
+class CompareOrderedOutputMixin:
+    def compare_output(self, expr, expected, **kwargs):
+        ast = parse_json(json.dumps(expr))
+
+        self.assertEqual(to_dict_filter(ast, order_clauses=True, **kwargs), expected)
+        self.assertEqual(to_filter(ast, order_clauses=True, **kwargs).to_dict(), expected)
+
+
+class TestOrderFilters(CompareOrderedOutputMixin, unittest.TestCase):
+
+    def test_scoring_context(self):
+        expected = {'bool': {'must': [PUBLIC, FLIGHT, TERMS, RANGE, WILDCARD, GEO_SHAPE]}}
+
+        self.compare_output(EXPR, expected)
+
+    def test_field_cardinality(self):
+        expected = {'bool': {'must': [FLIGHT, PUBLIC, TERMS, RANGE, WILDCARD, GEO_SHAPE]}}
+
+        self.compare_output(EXPR, expected, field_cardinality={'public': 2, 'flight_number': 5000})
+
+    def test_guarded_filter(self):
+        expected = {
+            'bool': {
+                'filter': [
+                    PUBLIC, FLIGHT, TERMS, RANGE,
+                    {'bool': {'filter': [WILDCARD, GEO_SHAPE]}}
+                ]
+            }
+        }
+
+        self.compare_output(EXPR, expected, filter_context=True)
+
+
+class TestOrderClauses(unittest.TestCase):
+
+    def test_nested(self):
+        query = {
+            'bool': {
+                'should': [
+                    {'bool': {'must': [GEO_SHAPE, FLIGHT]}},
+                    TERMS
+                ],
+                'minimum_should_match': 1
+            }
+        }
+
+        self.assertEqual(
+            order_clauses(query),
+            {
+                'bool': {
+                    'should': [
+                        TERMS,
+                        {'bool': {'must': [FLIGHT, GEO_SHAPE]}}
+                    ],
+                    'minimum_should_match': 1
+                }
+            }
+        )
+
+    def test_single_expensive_bool_is_not_wrapped(self):
+        query = {'bool': {'filter': [{'bool': {'should': [GEO_SHAPE, WILDCARD]}}, FLIGHT]}}
+
+        self.assertEqual(
+            order_clauses(query),
+            {'bool': {'filter': [FLIGHT, {'bool': {'should': [WILDCARD, GEO_SHAPE]}}]}}
+        )
+
+    def test_cost(self):
+        self.assertLess(cost(FLIGHT), cost(TERMS))
+        self.assertLess(cost(RANGE), cost({'prefix': {'title': 'lid'}}))
+        self.assertEqual(cost({'bool': {'filter': [FLIGHT, GEO_SHAPE]}}), cost(GEO_SHAPE))
+
+    def test_deep_query(self):
+        node = ast.Like(ast.Attribute('title'), 'lid%', False, '%', '_', '\\', False)
+        for i in range(20000):
+            node = (ast.And if i % 2 else ast.Or)(node, ast.Equal(ast.Attribute('flight'), i))
+
+        query = to_dict_filter(node, order_clauses=True)
+
+        # the cheap term comes first, before the nested bool with the prefix
+        self.assertEqual(query['bool']['must'][0], {'term': {'flight': 19999}})
+        self.assertEqual(cost(query), cost({'prefix': {'title': 'lid'}}))
@@ -14,16 +14,18 @@ __license__ = "BSD - see LICENSE file in top-level package directory"
 
 import unittest
 import json
+from datetime import datetime, timedelta, timezone
 
 from pygeofilter.parsers.cql_json import parse as parse_json
+from pygeofilter import ast, values
 
-from pygeofilter_elasticsearch import to_filter
+from pygeofilter_elasticsearch import to_filter, geometry
 
 
 class CompareOutputMixin:
-    def compare_output(self, expr, expected):
-        ast = parse_json(expr)
-        filters = to_filter(ast)
+    def compare_output(self, expr, expected, **kwargs):
+        ast = parse_json(expr) if isinstance(expr, str) else expr
+        filters = to_filter(ast, **kwargs)
         query = filters.to_dict()
 
         self.assertDictEqual(query, expected)
@@ -105,6 +107,117 @@ class TestCombine(CompareOutputMixin, unittest.TestCase):
 
         self.compare_output(expr, expected)
 
+    def test_OR_chain_is_flat(self):
+        expr = json.dumps(
+            {
+                'or': [
+                    {'eq': [{'property': 'flight_number'}, f'b{i:03d}']}
+                    for i in range(200)
+                ]
+            }
+        )
+        expected = {'bool': {'should': [{'term': {'flight_number': f'b{i:03d}'}} for i in range(200)]}}
+
+        self.compare_output(expr, expected)
+
+    def test_nested_AND_runs_are_flat(self):
+        expr = json.dumps(
+            {
+                'and': [
+                    {'eq': [{'property': 'platform'}, 'faam']},
+                    {
+                        'and': [
+                            {'eq': [{'property': 'flight_number'}, 'b069']},
+                            {'not': {'eq': [{'property': 'instrument'}, 'lidar']}}
+                        ]
+                    },
+                    {
+                        'or': [
+                            {'lt': [{'property': 'cloud_cover'}, 10]},
+                            {'gt': [{'property': 'cloud_cover'}, 90]}
+                        ]
+                    }
+                ]
+            }
+        )
+        expected = {
+            'bool': {
+                'must': [
+                    {'term': {'platform': 'faam'}},
+                    {'term': {'flight_number': 'b069'}},
+                    {'bool': {'should': [
+                        {'range': {'cloud_cover': {'lt': 10}}},
+                        {'range': {'cloud_cover': {'gt': 90}}}
+                    ]}}
+                ],
+                'must_not': [{'term': {'instrument': 'lidar'}}]
+            }
+        }
+
+        self.compare_output(expr, expected)
+
+
+class TestFilterContext(CompareOutputMixin, unittest.TestCase):
+
+    def test_predicate(self):
+        expr = json.dumps({'eq': [{'property': 'platform'}, 'faam']})
+        expected = {'bool': {'filter': [{'term': {'platform': 'faam'}}]}}
+
+        self.compare_output(expr, expected, filter_context=True)
+
+    def test_ne(self):
+        expr = json.dumps({'not': {'eq': [{'property': 'platform'}, 'faam']}})
+        expected = {'bool': {'must_not': [{'term': {'platform': 'faam'}}]}}
+
+        self.compare_output(expr, expected, filter_context=True)
+
+    def test_AND_combine(self):
+        expr = json.dumps(
+            {
+                'and': [
+                    {'eq': [{'property': 'platform'}, 'faam']},
+                    {
+                        'between': {
+                            'value': {'property': 'depth'},
+                            'lower': 100.0,
+                            'upper': 150.0
+                        }
+                    },
+                    {'not': {'eq': [{'property': 'instrument'}, 'lidar']}}
+                ]
+            }
+        )
+        expected = {
+            'bool': {
+                'filter': [
+                    {'term': {'platform': 'faam'}},
+                    {'range': {'depth': {'gte': 100.0, 'lte': 150.0}}}
+                ],
+                'must_not': [{'term': {'instrument': 'lidar'}}]
+            }
+        }
+
+        self.compare_output(expr, expected, filter_context=True)
+
+    def test_OR_combine(self):
+        expr = json.dumps(
+            {
+                'or': [
+                    {'eq': [{'property': 'platform'}, 'faam']},
+                    {'eq': [{'property': 'flight_number'}, 'b069']}
+                ]
+            }
+        )
+        expected = {
+            'bool': {
+                'filter': [
+                    {'bool': {'should': [{'term': {'platform': 'faam'}}, {'term': {'flight_number': 'b069'}}]}}
+                ]
+            }
+        }
+
+        self.compare_output(expr, expected, filter_context=True)
+
 
 class TestBetween(CompareOutputMixin, unittest.TestCase):
 
@@ -121,19 +234,62 @@ class TestBetween(CompareOutputMixin, unittest.TestCase):
         self.compare_output(expr, expected)
 
 
-@unittest.skip
 class TestLike(CompareOutputMixin, unittest.TestCase):
 
     def test_like(self):
         expr = json.dumps({
-            "like": [
-                {"property": "name"},
-                "Smith."
-            ],
-            "singleChar": ".",
-            "nocase": True
+            "like": {
+                "like": [
+                    {"property": "name"},
+                    "Smith."
+                ],
+                "singleChar": ".",
+                "nocase": True
+            }
+        })
+        expected = {'wildcard': {'name': {'value': 'Smith?', 'case_insensitive': True}}}
+
+        self.compare_output(expr, expected)
+
+    def test_like_prefix(self):
+        expr = json.dumps({
+            "like": {
+                "like": [
+                    {"property": "id"},
+                    "faam-b0%"
+                ],
+                "nocase": False
+            }
         })
-        expected = {'query_string': {'fields': ['name'], 'query': 'Smith?'}}
+        expected = {'prefix': {'id': 'faam-b0'}}
+
+        self.compare_output(expr, expected)
+
+    def test_like_term(self):
+        expr = json.dumps({
+            "like": {
+                "like": [
+                    {"property": "id"},
+                    "faam\\%b069"
+                ],
+                "nocase": False
+            }
+        })
+        expected = {'term': {'id': 'faam%b069'}}
+
+        self.compare_output(expr, expected)
+
+    def test_like_wildcard_escaping(self):
+        expr = json.dumps({
+            "like": {
+                "like": [
+                    {"property": "name"},
+                    "*%?.\\."
+                ],
+                "nocase": False
+            }
+        })
+        expected = {'wildcard': {'name': '\\**\\??.'}}
 
         self.compare_output(expr, expected)
 
@@ -152,42 +308,205 @@ class TestIn(CompareOutputMixin, unittest.TestCase):
         self.compare_output(expr, expected)
 
 
+class TestSpatial(CompareOutputMixin, unittest.TestCase):
+
+    polygon = {
+        'type': 'Polygon',
+        'coordinates': [[[0.0, 0.0], [10.0, 0.0], [5.0, 10.0], [0.0, 0.0]]]
+    }
+
+    rectangle = {
+        'type': 'Polygon',
+        'coordinates': [[[-10.0, 50.0], [2.0, 50.0], [2.0, 60.0], [-10.0, 60.0], [-10.0, 50.0]]]
+    }
+
+    def test_intersects(self):
+        expr = json.dumps({'intersects': [{'property': 'geometry'}, self.polygon]})
+        expected = {'geo_shape': {'geometry': {'shape': self.polygon, 'relation': 'intersects'}}}
+
+        self.compare_output(expr, expected)
+
+    def test_within(self):
+        expr = json.dumps({'within': [{'property': 'geometry'}, self.polygon]})
+        expected = {'geo_shape': {'geometry': {'shape': self.polygon, 'relation': 'within'}}}
+
+        self.compare_output(expr, expected)
+
+    def test_contains_geometry_first(self):
+        expr = json.dumps({'contains': [self.polygon, {'property': 'geometry'}]})
+        expected = {'geo_shape': {'geometry': {'shape': self.polygon, 'relation': 'within'}}}
+
+        self.compare_output(expr, expected)
+
+    def test_disjoint_rectangle(self):
+        expr = json.dumps({'disjoint': [{'property': 'geometry'}, self.rectangle]})
+        expected = {
+            'geo_shape': {
+                'geometry': {
+                    'shape': {'type': 'envelope', 'coordinates': [[-10.0, 60.0], [2.0, 50.0]]},
+                    'relation': 'disjoint'
+                }
+            }
+        }
+
+        self.compare_output(expr, expected)
+
+    def test_intersects_bounding_box(self):
+        expr = json.dumps({'intersects': [{'property': 'location'}, self.rectangle]})
+        expected = {
+            'geo_bounding_box': {
+                'location': {
+                    'top_left': {'lat': 60.0, 'lon': -10.0},
+                    'bottom_right': {'lat': 50.0, 'lon': 2.0}
+                }
+            }
+        }
+
+        self.compare_output(expr, expected, bounding_box=True)
+
+    def test_simplify(self):
+        ring = [[float(x), 0.001 * (x % 2)] for x in range(100)] + [[99.0, 10.0], [0.0, 10.0], [0.0, 0.0]]
+        polygon = {'type': 'Polygon', 'coordinates': [ring]}
+        expr = json.dumps({'intersects': [{'property': 'geometry'}, polygon]})
+        shape = geometry.simplify(polygon, tolerance=0.01)
+        expected = {'geo_shape': {'geometry': {'shape': shape, 'relation': 'intersects'}}}
+
+        # the zigzag is replaced by one edge moved out past it
+        self.assertEqual(len(shape['coordinates'][0]), 5)
+        self.compare_output(expr, expected, simplify_tolerance=0.01)
+
+    def test_unsupported(self):
+        expr = json.dumps({'touches': [{'property': 'geometry'}, self.polygon]})
+
+        with self.assertRaises(NotImplementedError):
+            self.compare_output(expr, {})
+
+
 class TestTemporal(CompareOutputMixin, unittest.TestCase):
+    start = '2005-01-04T00:00:00Z'
+    end = '2005-01-06T00:00:00Z'
+    start_dt = datetime(2005, 1, 4, tzinfo=timezone.utc)
+    end_dt = datetime(2005, 1, 6, tzinfo=timezone.utc)
 
     def test_before(self):
-        expr = json.dumps({})
-        expected = {}
-        ...
+        expr = json.dumps({'before': [{'property': 'datetime'}, self.start]})
+        expected = {'range': {'datetime': {'lte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_after(self):
-        ...
+        expr = json.dumps({'after': [{'property': 'datetime'}, self.start]})
+        expected = {'range': {'datetime': {'gte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
+
+    def test_before_interval(self):
+        expr = json.dumps({'before': [{'property': 'datetime'}, [self.start, self.end]]})
+        expected = {'range': {'datetime': {'lte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
+
+    def test_after_interval(self):
+        expr = json.dumps({'after': [{'property': 'datetime'}, [self.start, self.end]]})
+        expected = {'range': {'datetime': {'gte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_before_or_during_dt_dt(self):
-        ...
+        expr = ast.TimeBeforeOrDuring(ast.Attribute('datetime'), values.Interval(self.start_dt, self.end_dt))
+        expected = {'range': {'datetime': {'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_before_or_during_dt_td(self):
-        ...
+        expr = ast.TimeBeforeOrDuring(ast.Attribute('datetime'), values.Interval(self.start_dt, timedelta(days=2)))
+        expected = {'range': {'datetime': {'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_before_or_during_td_dt(self):
-        ...
+        expr = ast.TimeBeforeOrDuring(ast.Attribute('datetime'), values.Interval(timedelta(days=2), self.end_dt))
+        expected = {'range': {'datetime': {'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_during_dt_dt(self):
-        ...
+        expr = json.dumps({'during': [{'property': 'datetime'}, [self.start, self.end]]})
+        expected = {'range': {'datetime': {'gte': self.start_dt, 'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_during_dt_td(self):
-        ...
+        expr = json.dumps({'during': [{'property': 'datetime'}, [self.start, 'P2D']]})
+        expected = {'range': {'datetime': {'gte': self.start_dt, 'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_during_td_dt(self):
-        ...
+        expr = json.dumps({'during': [{'property': 'datetime'}, ['P2D', self.end]]})
+        expected = {'range': {'datetime': {'gte': self.start_dt, 'lte': self.end_dt}}}
+
+        self.compare_output(expr, expected)
+
+    def test_during_open_ended(self):
+        expr = json.dumps({'during': [{'property': 'datetime'}, [self.start, '..']]})
+        expected = {'range': {'datetime': {'gte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
+
+        expr = json.dumps({'during': [{'property': 'datetime'}, ['..', '..']]})
+
+        self.compare_output(expr, {'match_all': {}})
 
     def test_during_or_after_dt_dt(self):
-        ...
+        expr = ast.TimeDuringOrAfter(ast.Attribute('datetime'), values.Interval(self.start_dt, self.end_dt))
+        expected = {'range': {'datetime': {'gte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_during_or_after_dt_td(self):
-        ...
+        expr = ast.TimeDuringOrAfter(ast.Attribute('datetime'), values.Interval(self.start_dt, timedelta(days=2)))
+        expected = {'range': {'datetime': {'gte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
 
     def test_during_or_after_td_dt(self):
-        ...
+        expr = ast.TimeDuringOrAfter(ast.Attribute('datetime'), values.Interval(timedelta(days=2), self.end_dt))
+        expected = {'range': {'datetime': {'gte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
+
+    def test_tequals(self):
+        expr = json.dumps({'tequals': [{'property': 'datetime'}, self.start]})
+        expected = {'range': {'datetime': {'gte': self.start_dt, 'lte': self.start_dt}}}
+
+        self.compare_output(expr, expected)
+
+    def test_granularity(self):
+        expr = json.dumps({
+            'during': [{'property': 'datetime'}, ['2005-01-04T10:17:23.104+02:00', '2005-01-06T10:00:00Z']]
+        })
+        expected = {
+            'range': {
+                'datetime': {
+                    'gte': '2005-01-04T08:00:00Z',
+                    'lte': '2005-01-06T10:00:00Z',
+                    'format': 'strict_date_optional_time'
+                }
+            }
+        }
+
+        self.compare_output(expr, expected, temporal_granularity='h')
+
+    def test_granularity_timedelta(self):
+        expr = json.dumps({'after': [{'property': 'datetime'}, '2005-01-04T10:17:23Z']})
+        expected = {
+            'range': {
+                'datetime': {'gte': '2005-01-04T10:15:00Z', 'format': 'strict_date_optional_time'}
+            }
+        }
+
+        self.compare_output(expr, expected, temporal_granularity=timedelta(minutes=15))
 
     @unittest.skip
     def test_anyinteracts(self):
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the plain dict output of `pygeofilter_elasticsearch`.
+
+These re-run the CQL-JSON tests against ``to_dict_filter`` and check the
+output matches ``to_filter(ast).to_dict()``.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+
+from tests import test_pygeofilter_elasticsearch_cql_json as cql_json
+
+
+class CompareDictOutputMixin:
+    def compare_output(self, expr, expected, **kwargs):
+        ast = parse_json(expr) if isinstance(expr, str) else expr
+        query = to_dict_filter(ast, **kwargs)
+
+        self.assertEqual(
+            json.dumps(query, default=str),
+            json.dumps(to_filter(ast, **kwargs).to_dict(), default=str)
+        )
+        self.assertDictEqual(query, expected)
+
+
+class TestDictComparison(CompareDictOutputMixin, cql_json.TestComparison):
+    pass
+
+
+class TestDictCombine(CompareDictOutputMixin, cql_json.TestCombine):
+    pass
+
+
+class TestDictFilterContext(CompareDictOutputMixin, cql_json.TestFilterContext):
+    pass
+
+
+class TestDictBetween(CompareDictOutputMixin, cql_json.TestBetween):
+    pass
+
+
+class TestDictLike(CompareDictOutputMixin, cql_json.TestLike):
+    pass
+
+
+class TestDictIn(CompareDictOutputMixin, cql_json.TestIn):
+
+    def test_in(self):
+        # the dict evaluator emits the choices as a list, as to_dict() does
+        expr = json.dumps({
+            "in": {
+                "value": {"property": "cityName"},
+                "list": ["Toronto", "Franfurt", "Tokyo", "New York"],
+            }
+        })
+        expected = {'terms': {'cityName': ["Toronto", "Franfurt", "Tokyo", "New York"]}}
+
+        self.compare_output(expr, expected)
+
+
+class TestDictSpatial(CompareDictOutputMixin, cql_json.TestSpatial):
+    pass
+
+
+class TestDictTemporal(CompareDictOutputMixin, cql_json.TestTemporal):
+    pass
+
+
+class TestDictNested(unittest.TestCase):
+
+    def compare_with_query(self, expr):
+        ast = parse_json(json.dumps(expr))
+
+        self.assertEqual(to_dict_filter(ast), to_filter(ast).to_dict())
+
+    def test_not_and(self):
+        self.compare_with_query({
+            'not': {
+                'and': [
+                    {'eq': [{'property': 'platform'}, 'faam']},
+                    {'lt': [{'property': 'cloud_cover'}, 50]}
+                ]
+            }
+        })
+
+    def test_and_or(self):
+        self.compare_with_query({
+            'and': [
+                {'eq': [{'property': 'platform'}, 'faam']},
+                {
+                    'or': [
+                        {'eq': [{'property': 'flight_number'}, 'b069']},
+                        {'eq': [{'property': 'flight_number'}, 'b070']}
+                    ]
+                },
+                {'not': {'eq': [{'property': 'instrument'}, 'lidar']}}
+            ]
+        })
+
+    def test_or_and(self):
+        self.compare_with_query({
+            'or': [
+                {
+                    'and': [
+                        {'eq': [{'property': 'platform'}, 'faam']},
+                        {'gte': [{'property': 'cloud_cover'}, 10]}
+                    ]
+                },
+                {'not': {'eq': [{'property': 'instrument'}, 'lidar']}},
+                {'eq': [{'property': 'flight_number'}, 'b069']}
+            ]
+        })
+
+    def test_double_negation(self):
+        self.compare_with_query({
+            'not': {'not': {'eq': [{'property': 'platform'}, 'faam']}}
+        })
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` evaluator on very deep ASTs.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import sys
+
+from pygeofilter import ast
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, FilterCache
+from pygeofilter_elasticsearch.evaluate import ElasticsearchDictEvaluator
+
+DEPTH = sys.getrecursionlimit() * 5
+
+
+def equal(value):
+    return ast.Equal(ast.Attribute('flight_number'), value)
+
+
+class TestDeepTrees(unittest.TestCase):
+
+    def test_right_deep_or_chain(self):
+        node = equal(DEPTH)
+        for i in reversed(range(DEPTH)):
+            node = ast.Or(equal(i), node)
+
+        expected = [{'term': {'flight_number': i}} for i in range(DEPTH + 1)]
+
+        self.assertEqual(to_dict_filter(node), {'bool': {'should': expected}})
+        self.assertEqual(to_filter(node).to_dict(), {'bool': {'should': expected}})
+
+    def test_not_chain(self):
+        node = equal(1)
+        for _ in range(DEPTH + 1):
+            node = ast.Not(node)
+
+        expected = {'bool': {'must_not': [{'term': {'flight_number': 1}}]}}
+
+        self.assertEqual(to_dict_filter(node), expected)
+        self.assertEqual(to_filter(node).to_dict(), expected)
+
+    def test_alternating_tree(self):
+        node = equal(0)
+        for i in range(1, DEPTH):
+            node = (ast.And if i % 2 else ast.Or)(node, equal(i))
+
+        query = to_dict_filter(node)
+
+        self.assertEqual(query['bool']['must'][-1], {'term': {'flight_number': DEPTH - 1}})
+
+    def test_stack_walk_matches_recursion(self):
+        node = equal(0)
+        for i in range(1, 50):
+            node = ast.Not((ast.And if i % 2 else ast.Or)(node, ast.In(ast.Attribute('platform'), [i, 'faam'], False)))
+
+        evaluator = ElasticsearchDictEvaluator(None, None)
+        evaluator.max_depth = 0
+
+        self.assertEqual(evaluator.evaluate(node), to_dict_filter(node))
+
+    def test_cache_key(self):
+        node = equal(0)
+        for i in range(1, DEPTH):
+            node = ast.And(node, equal(i))
+
+        cache = FilterCache()
+        cache.to_dict_filter(node)
+        cache.to_dict_filter(node)
+
+        self.assertEqual(cache.info().hits, 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` field resolver.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from string import Template
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, FieldResolver, FilterCache
+from pygeofilter_elasticsearch.filters import attribute
+
+EXPR = {
+    'and': [
+        {'eq': [{'property': 'collection'}, 'sentinel-2']},
+        {'lt': [{'property': 'eo:cloud_cover'}, 10]},
+        {'eq': [{'property': 'platform'}, 'sentinel-2a']}
+    ]
+}
+
+
+class TestFieldResolver(unittest.TestCase):
+
+    def test_matches_attribute(self):
+        field_mapping = {'collection': 'collection_id'}
+        field_default = Template('properties.${name}.keyword')
+        resolver = FieldResolver(field_mapping, field_default)
+
+        for name in ('collection', 'platform', 'eo:cloud_cover'):
+            self.assertEqual(resolver(name), attribute(name, field_mapping, field_default))
+
+        self.assertEqual(FieldResolver()('platform'), 'platform')
+
+    def test_rules(self):
+        resolver = FieldResolver(
+            {'collection': 'collection_id'},
+            'properties.$name',
+            rules={
+                'eo:*': 'properties.eo.$match',
+                'assets.*.href': 'assets.$match.href.keyword'
+            }
+        )
+
+        self.assertEqual(resolver('collection'), 'collection_id')
+        self.assertEqual(resolver('eo:cloud_cover'), 'properties.eo.cloud_cover')
+        self.assertEqual(resolver('assets.thumbnail.href'), 'assets.thumbnail.href.keyword')
+        self.assertEqual(resolver('assets.thumbnail.type'), 'properties.assets.thumbnail.type')
+
+    def test_memoised(self):
+        resolver = FieldResolver(field_default='properties.$name', maxsize=1)
+
+        resolver('platform')
+        resolver('instrument')
+
+        self.assertEqual(resolver._resolved, {'platform': 'properties.platform'})
+        self.assertEqual(resolver('instrument'), 'properties.instrument')
+
+    def test_evaluator(self):
+        ast = parse_json(json.dumps(EXPR))
+        field_mapping = {'collection': 'collection_id'}
+        field_default = Template('properties.${name}')
+        resolver = FieldResolver(field_mapping, field_default)
+
+        self.assertEqual(
+            to_dict_filter(ast, resolver),
+            to_dict_filter(ast, field_mapping, field_default)
+        )
+        self.assertEqual(
+            to_filter(ast, resolver).to_dict(),
+            to_filter(ast, field_mapping, field_default).to_dict()
+        )
+
+    def test_cache_key(self):
+        ast = parse_json(json.dumps(EXPR))
+        cache = FilterCache()
+
+        cache.to_dict_filter(ast, FieldResolver(field_default='properties.$name'))
+        cache.to_dict_filter(ast, FieldResolver(field_default='properties.$name'))
+        cache.to_dict_filter(ast, FieldResolver(field_default='$name.keyword'))
+
+        self.assertEqual(cache.info().hits, 1)
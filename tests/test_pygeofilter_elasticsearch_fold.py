@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` constant folding.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from pygeofilter import ast, values
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+
+MATCH_ALL = {'match_all': {}}
+MATCH_NONE = {'match_none': {}}
+
+PLATFORM = ast.Equal(ast.Attribute('platform'), 'faam')
+PLATFORM_QUERY = {'term': {'platform': 'faam'}}
+
+TRUE = ast.LessThan('abc', 'bce')
+FALSE = ast.GreaterThan(1, 2)
+
+
+def at(day):
+    return datetime(2020, 1, day, tzinfo=timezone.utc)
+
+
+class CompareFoldedOutputMixin:
+    def compare_output(self, node, expected, **kwargs):
+        self.assertEqual(to_dict_filter(node, **kwargs), expected)
+        self.assertEqual(to_filter(node, **kwargs).to_dict(), expected)
+
+
+class TestFoldPredicates(CompareFoldedOutputMixin, unittest.TestCase):
+
+    def test_comparison(self):
+        self.compare_output(TRUE, MATCH_ALL)
+        self.compare_output(FALSE, MATCH_NONE)
+        self.compare_output(ast.NotEqual(1, 1.0), MATCH_NONE)
+        self.compare_output(ast.GreaterThan('a', 1), MATCH_NONE)
+
+    def test_between(self):
+        self.compare_output(ast.Between(5, 1, 10, False), MATCH_ALL)
+        self.compare_output(ast.Between(5, 1, 10, True), MATCH_NONE)
+
+    def test_in(self):
+        self.compare_output(ast.In('b', ['a', 'b'], False), MATCH_ALL)
+        self.compare_output(ast.In('c', ['a', 'b'], False), MATCH_NONE)
+        self.compare_output(ast.In('c', ['a', 'b'], True), MATCH_ALL)
+
+    def test_temporal(self):
+        self.compare_output(ast.TimeBefore(at(1), at(2)), MATCH_ALL)
+        self.compare_output(ast.TimeAfter(at(1), at(2)), MATCH_NONE)
+        self.compare_output(ast.TimeDuring(at(2), values.Interval(at(1), timedelta(days=2))), MATCH_ALL)
+        self.compare_output(ast.TimeDuring(at(4), values.Interval(at(1), at(3))), MATCH_NONE)
+
+    def test_attribute_is_not_folded(self):
+        self.compare_output(ast.LessThan(ast.Attribute('a'), 1), {'range': {'a': {'lt': 1}}})
+
+
+class TestFoldCombinations(CompareFoldedOutputMixin, unittest.TestCase):
+
+    def test_and(self):
+        self.compare_output(ast.And(PLATFORM, TRUE), PLATFORM_QUERY)
+        self.compare_output(ast.And(PLATFORM, FALSE), MATCH_NONE)
+        self.compare_output(ast.And(TRUE, TRUE), MATCH_ALL)
+
+    def test_or(self):
+        self.compare_output(ast.Or(PLATFORM, TRUE), MATCH_ALL)
+        self.compare_output(ast.Or(PLATFORM, FALSE), PLATFORM_QUERY)
+        self.compare_output(ast.Or(FALSE, FALSE), MATCH_NONE)
+
+    def test_not(self):
+        self.compare_output(ast.Not(TRUE), MATCH_NONE)
+        self.compare_output(ast.And(PLATFORM, ast.Not(FALSE)), PLATFORM_QUERY)
+
+    def test_nested(self):
+        node = ast.Or(ast.And(FALSE, PLATFORM), ast.And(TRUE, ast.Equal(ast.Attribute('b'), 1)))
+
+        self.compare_output(node, {'term': {'b': 1}})
+
+    def test_filter_context(self):
+        self.compare_output(
+            ast.And(ast.And(PLATFORM, TRUE), ast.Equal(ast.Attribute('b'), 1)),
+            {'bool': {'filter': [PLATFORM_QUERY, {'term': {'b': 1}}]}},
+            filter_context=True
+        )
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` geometry helpers.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+from math import cos, sin, pi
+
+from pygeofilter_elasticsearch import geometry
+
+
+def circle(vertices):
+    ring = [[cos(2 * pi * i / vertices), sin(2 * pi * i / vertices)] for i in range(vertices)]
+    return {'type': 'Polygon', 'coordinates': [ring + [ring[0]]]}
+
+
+def covers(ring, point):
+    """Whether a point is inside a ring or on its boundary."""
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (x2 - x1) * (point[1] - y1) == (y2 - y1) * (point[0] - x1) and \
+                min(x1, x2) <= point[0] <= max(x1, x2) and min(y1, y2) <= point[1] <= max(y1, y2):
+            return True
+        if (y1 > point[1]) != (y2 > point[1]) and \
+                point[0] < x1 + (point[1] - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:])) / 2
+
+
+class TestRectangleBounds(unittest.TestCase):
+
+    def test_rectangle(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [0, 2], [1, 2], [1, 0], [0, 0]]]}
+
+        self.assertEqual(geometry.rectangle_bounds(polygon), (0, 0, 1, 2))
+
+    def test_not_rectangle(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 2], [1, 0], [0, 2], [0, 0]]]}
+
+        self.assertIsNone(geometry.rectangle_bounds(polygon))
+        self.assertIsNone(geometry.rectangle_bounds(circle(4)))
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_tolerance(self):
+        line = {'type': 'LineString', 'coordinates': [[0, 0], [1, 0.01], [2, 0], [3, 5]]}
+
+        self.assertEqual(
+            geometry.simplify(line, tolerance=0.1),
+            {'type': 'LineString', 'coordinates': [[0, 0], [2, 0], [3, 5]]}
+        )
+
+    def test_max_vertices(self):
+        simplified = geometry.simplify(circle(2000), max_vertices=100)
+
+        self.assertLessEqual(geometry.count_vertices(simplified['coordinates']), 100)
+        self.assertGreaterEqual(len(simplified['coordinates'][0]), 4)
+
+    def test_concave_polygon_covers_original(self):
+        ring = [[0, 0], [10, 0], [10, 1], [1, 1], [1, 2], [10, 2], [10, 3], [0, 3], [0, 0]]
+        # Douglas-Peucker alone cuts the concave polygon and crosses itself
+        self.assertEqual(
+            geometry.simplify_line(ring, 1.1),
+            [[0, 0], [10, 0], [1, 1], [10, 3], [0, 3], [0, 0]]
+        )
+
+        simplified = geometry.simplify({'type': 'Polygon', 'coordinates': [ring]}, tolerance=1.1)
+
+        self.assertEqual(simplified['coordinates'], [[[0, 0], [10, 0], [10, 3], [0, 3], [0, 0]]])
+        self.assertTrue(all(covers(simplified['coordinates'][0], point) for point in ring))
+
+    def test_polygon_covers_original(self):
+        ring = [[0, 0], [4, 0], [4, 4], [2.2, 4], [2, 5], [1.8, 4], [0, 4], [0, 0]]
+        simplified = geometry.simplify({'type': 'Polygon', 'coordinates': [ring]}, tolerance=1.1)
+
+        self.assertTrue(all(covers(simplified['coordinates'][0], point) for point in ring))
+
+        simplified = geometry.simplify(circle(2000), max_vertices=100)
+
+        self.assertTrue(all(covers(simplified['coordinates'][0], point) for point in circle(2000)['coordinates'][0]))
+
+    def test_circle_is_close_to_original(self):
+        ring = circle(2000)['coordinates'][0]
+        simplified = geometry.simplify(circle(2000), tolerance=0.01)['coordinates'][0]
+
+        self.assertLess(len(simplified), 100)
+        self.assertTrue(all(covers(simplified, point) for point in ring))
+        self.assertAlmostEqual(area(simplified) / area(ring), 1, delta=0.01)
+
+    def test_hole_is_covered_by_original(self):
+        hole = [[1, 1], [1, 3], [2, 2.5], [3, 3], [3, 1], [1, 1]]
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], hole]}
+
+        simplified = geometry.simplify(polygon, tolerance=1)['coordinates'][1]
+
+        self.assertEqual(len(simplified), 5)
+        self.assertTrue(all(covers(hole, point) for point in simplified))
+
+    def test_ring_does_not_collapse(self):
+        simplified = geometry.simplify(circle(8), max_vertices=2)
+
+        self.assertGreaterEqual(len(simplified['coordinates'][0]), 4)
+
+
+class TestRoundCoordinates(unittest.TestCase):
+
+    def test_polygon(self):
+        polygon = {
+            'type': 'Polygon',
+            'coordinates': [[[0.1234, 0.0], [1.0004, 0.0], [1.0001, 0.0002], [1.0, 1.0], [0.1234, 0.0]]]
+        }
+
+        self.assertEqual(
+            geometry.round_coordinates(polygon, 3),
+            {'type': 'Polygon', 'coordinates': [[[0.123, 0.0], [1.0, 0.0], [1.0, 1.0], [0.123, 0.0]]]}
+        )
+
+    def test_collapsed_polygon_is_unchanged(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[[0.01, 0.01], [0.02, 0.01], [0.02, 0.02], [0.01, 0.01]]]}
+
+        self.assertEqual(geometry.round_coordinates(polygon, 0), polygon)
+
+    def test_envelope_rounds_outwards(self):
+        envelope = geometry.envelope(-1.234, 50.111, 2.221, 60.999)
+
+        self.assertEqual(
+            geometry.round_coordinates(envelope, 1),
+            {'type': 'envelope', 'coordinates': [[-1.3, 61.0], [2.3, 50.1]]}
+        )
+
+    def test_collection(self):
+        collection = {
+            'type': 'GeometryCollection',
+            'geometries': [
+                {'type': 'Point', 'coordinates': [1.26, 2.24]},
+                {'type': 'LineString', 'coordinates': [[0.04, 0.0], [0.0, 0.01], [1.0, 1.0]]},
+            ]
+        }
+
+        self.assertEqual(
+            geometry.round_coordinates(collection, 1),
+            {
+                'type': 'GeometryCollection',
+                'geometries': [
+                    {'type': 'Point', 'coordinates': [1.3, 2.2]},
+                    {'type': 'LineString', 'coordinates': [[0.0, 0.0], [1.0, 1.0]]},
+                ]
+            }
+        )
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` hybrid pushdown.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import importlib.util
+from string import Template
+
+from pygeofilter import ast
+
+from pygeofilter_elasticsearch import split_filter, FilterSearch
+
+HAS_NATIVE = importlib.util.find_spec('shapely') is not None
+
+PLATFORM = ast.Equal(ast.Attribute('platform'), 'faam')
+INSTRUMENT = ast.Equal(ast.Attribute('instrument'), 'lidar')
+ARITHMETIC = ast.GreaterThan(ast.Add(ast.Attribute('cloud_cover'), 10), 50)
+FUNCTION = ast.GreaterThan(ast.Function('strlen', [ast.Attribute('title')]), 3)
+
+
+class TestSplit(unittest.TestCase):
+
+    def test_pushdown_only(self):
+        hybrid = split_filter(ast.And(PLATFORM, INSTRUMENT))
+
+        self.assertEqual(
+            hybrid.query,
+            {'bool': {'must': [{'term': {'platform': 'faam'}}, {'term': {'instrument': 'lidar'}}]}}
+        )
+        self.assertIsNone(hybrid.residual)
+        self.assertIsNone(hybrid.predicate)
+
+    def test_and(self):
+        hybrid = split_filter(
+            ast.And(ast.And(PLATFORM, ARITHMETIC), FUNCTION),
+            field_default=Template('properties.${name}'),
+            filter_context=True
+        )
+
+        self.assertEqual(hybrid.query, {'bool': {'filter': [{'term': {'properties.platform': 'faam'}}]}})
+        self.assertEqual(hybrid.residual, ast.And(ARITHMETIC, FUNCTION))
+        self.assertEqual(
+            hybrid.attribute_map,
+            {'cloud_cover': 'properties.cloud_cover', 'title': 'properties.title'}
+        )
+
+    def test_or(self):
+        hybrid = split_filter(ast.Or(PLATFORM, ARITHMETIC))
+
+        self.assertEqual(hybrid.query, {'match_all': {}})
+        self.assertEqual(hybrid.residual, ast.Or(PLATFORM, ARITHMETIC))
+
+        node = ast.Or(ast.And(PLATFORM, ARITHMETIC), INSTRUMENT)
+        hybrid = split_filter(node)
+
+        self.assertEqual(
+            hybrid.query,
+            {'bool': {'should': [{'term': {'platform': 'faam'}}, {'term': {'instrument': 'lidar'}}]}}
+        )
+        self.assertEqual(hybrid.residual, node)
+
+    def test_not(self):
+        hybrid = split_filter(ast.Not(ast.Or(PLATFORM, INSTRUMENT)))
+
+        self.assertEqual(
+            hybrid.query,
+            {'bool': {'must_not': [{'term': {'platform': 'faam'}}, {'term': {'instrument': 'lidar'}}]}}
+        )
+        self.assertIsNone(hybrid.residual)
+
+        node = ast.Not(ast.And(PLATFORM, ARITHMETIC))
+
+        self.assertEqual(split_filter(node).residual, node)
+
+    def test_unsupported_operations(self):
+        touches = ast.GeometryTouches(ast.Attribute('geometry'), ast.Attribute('other'))
+        meets = ast.TimeMeets(ast.Attribute('datetime'), ast.Attribute('other'))
+        hybrid = split_filter(ast.And(ast.And(touches, PLATFORM), meets))
+
+        self.assertEqual(hybrid.query, {'term': {'platform': 'faam'}})
+        self.assertEqual(hybrid.residual, ast.And(touches, meets))
+
+
+class StubPitClient:
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.queries = []
+
+    def open_point_in_time(self, index, keep_alive):
+        return {'id': 'pit'}
+
+    def close_point_in_time(self, id):
+        pass
+
+    def search(self, query, size, search_after=None, **kwargs):
+        self.queries.append(query)
+        start = search_after[0] + 1 if search_after else 0
+        hits = [
+            {'_source': source, 'sort': [i]}
+            for i, source in enumerate(self.sources[start:start + size], start)
+        ]
+        return {'hits': {'hits': hits}}
+
+
+@unittest.skipUnless(HAS_NATIVE, 'needs shapely for the pygeofilter native backend')
+class TestResidual(unittest.TestCase):
+
+    def test_predicate(self):
+        hybrid = split_filter(ast.And(PLATFORM, ARITHMETIC), field_default=Template('properties.${name}'))
+
+        self.assertTrue(hybrid.predicate({'properties': {'cloud_cover': 45}}))
+        self.assertFalse(hybrid.predicate({'properties': {'cloud_cover': 35}}))
+
+    def test_hybrid_scan(self):
+        client = StubPitClient([{'platform': 'faam', 'cloud_cover': cover} for cover in range(0, 100, 10)])
+        hits = FilterSearch(client, 'items').hybrid_scan(ast.And(PLATFORM, ARITHMETIC), page_size=4)
+
+        self.assertEqual([hit['_source']['cloud_cover'] for hit in hits], [50, 60, 70, 80, 90])
+        self.assertEqual(client.queries[0], {'term': {'platform': 'faam'}})
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the index mapping aware output of `pygeofilter_elasticsearch`.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from datetime import datetime, timezone
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+from pygeofilter_elasticsearch.fields import IndexMapping
+
+MAPPING = {
+    'items': {
+        'mappings': {
+            'properties': {
+                'id': {'type': 'keyword'},
+                'title': {
+                    'type': 'text',
+                    'fields': {'raw': {'type': 'keyword'}}
+                },
+                'properties': {
+                    'properties': {
+                        'platform': {
+                            'type': 'text',
+                            'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}}
+                        },
+                        'description': {'type': 'text'},
+                        'orbit': {'type': 'integer'},
+                        'eo:cloud_cover': {'type': 'float'},
+                        'datetime': {'type': 'date'},
+                        'public': {'type': 'boolean'}
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+class CompareMappedOutputMixin:
+    def compare_output(self, expr, expected, **kwargs):
+        ast = parse_json(json.dumps(expr))
+        kwargs.setdefault('index_mapping', MAPPING)
+
+        self.assertEqual(to_dict_filter(ast, **kwargs), expected)
+        self.assertEqual(to_filter(ast, **kwargs).to_dict(), expected)
+
+
+class TestIndexMapping(unittest.TestCase):
+
+    def test_fields(self):
+        mapping = IndexMapping(MAPPING)
+
+        self.assertEqual(mapping.field_type('properties.orbit'), 'integer')
+        self.assertEqual(mapping.field_type('properties.platform.keyword'), 'keyword')
+        self.assertEqual(mapping.field_type('properties'), 'object')
+        self.assertIsNone(mapping.field_type('missing'))
+
+        self.assertEqual(mapping.exact_field('title'), 'title.raw')
+        self.assertEqual(mapping.exact_field('properties.platform'), 'properties.platform.keyword')
+        self.assertEqual(mapping.exact_field('properties.description'), 'properties.description')
+
+        self.assertEqual(IndexMapping(MAPPING['items']['mappings']).fields, mapping.fields)
+
+    def test_coerce(self):
+        mapping = IndexMapping(MAPPING)
+
+        self.assertEqual(mapping.coerce('id', 12), '12')
+        self.assertEqual(mapping.coerce('properties.orbit', '12'), 12)
+        self.assertEqual(mapping.coerce('properties.orbit', 12.0), 12)
+        self.assertEqual(mapping.coerce('properties.orbit', 12.5, exact=False), 12.5)
+        self.assertEqual(mapping.coerce('properties.eo:cloud_cover', '2.5'), 2.5)
+        self.assertEqual(mapping.coerce('properties.public', 'true'), True)
+        self.assertEqual(
+            mapping.coerce('properties.datetime', '2021-01-01T00:00:00Z'),
+            datetime(2021, 1, 1, tzinfo=timezone.utc)
+        )
+        self.assertEqual(mapping.coerce('properties.datetime', 'now-1d'), 'now-1d')
+        self.assertEqual(mapping.coerce('missing', '12'), '12')
+
+        with self.assertRaises(ValueError):
+            mapping.coerce('properties.orbit', 12.5)
+        with self.assertRaises(ValueError):
+            mapping.coerce('properties.orbit', 'twelve')
+        with self.assertRaises(ValueError):
+            mapping.coerce('properties.public', 1)
+
+
+class TestMappedFilters(CompareMappedOutputMixin, unittest.TestCase):
+
+    def test_keyword_sub_field(self):
+        expr = {'eq': [{'property': 'platform'}, 'sentinel-2a']}
+
+        self.compare_output(
+            expr,
+            {'term': {'properties.platform.keyword': 'sentinel-2a'}},
+            field_default='properties.$name'
+        )
+
+    def test_coerce_literal(self):
+        expr = {'eq': [{'property': 'properties.orbit'}, '12']}
+
+        self.compare_output(expr, {'term': {'properties.orbit': 12}})
+
+    def test_impossible_equality(self):
+        self.compare_output({'eq': [{'property': 'properties.orbit'}, 'twelve']}, {'match_none': {}})
+        self.compare_output({'eq': [{'property': 'properties.orbit'}, 12.5]}, {'match_none': {}})
+        self.compare_output(
+            {'not': {'eq': [{'property': 'properties.orbit'}, 12.5]}},
+            {'match_all': {}}
+        )
+
+    def test_in(self):
+        expr = {'in': {'value': {'property': 'properties.orbit'}, 'list': ['12', 'twelve', 13]}}
+
+        self.compare_output(expr, {'terms': {'properties.orbit': [12, 13]}})
+
+        expr = {'in': {'value': {'property': 'properties.orbit'}, 'list': ['twelve']}}
+
+        self.compare_output(expr, {'match_none': {}})
+
+    def test_between(self):
+        expr = {'between': {'value': {'property': 'properties.orbit'}, 'lower': 10.5, 'upper': '20'}}
+
+        self.compare_output(expr, {'range': {'properties.orbit': {'gte': 10.5, 'lte': 20}}})
+
+    def test_date_equality(self):
+        expr = {'eq': [{'property': 'properties.datetime'}, '2021-01-01T00:00:00Z']}
+        value = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+        self.compare_output(expr, {'range': {'properties.datetime': {'gte': value, 'lte': value}}})
+
+    def test_unmapped_field(self):
+        expr = {'eq': [{'property': 'platform'}, 12]}
+
+        self.compare_output(expr, {'term': {'platform': 12}})
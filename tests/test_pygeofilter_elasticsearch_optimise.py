@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` query optimiser.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter import ast
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+from pygeofilter_elasticsearch.optimise import optimise
+
+PLATFORM = {'term': {'platform': 'faam'}}
+INSTRUMENT = {'term': {'instrument': 'lidar'}}
+
+
+class CompareOptimisedMixin:
+    def compare_output(self, expr, expected, **kwargs):
+        ast = parse_json(json.dumps(expr))
+
+        self.assertEqual(to_dict_filter(ast, optimise=True, **kwargs), expected)
+        self.assertEqual(to_filter(ast, optimise=True, **kwargs).to_dict(), expected)
+
+
+class TestOptimiseFilters(CompareOptimisedMixin, unittest.TestCase):
+
+    def test_merge_ranges(self):
+        expr = {
+            'and': [
+                {'gt': [{'property': 'cloud_cover'}, 10]},
+                {'eq': [{'property': 'platform'}, 'faam']},
+                {'lte': [{'property': 'cloud_cover'}, 50]},
+                {'gte': [{'property': 'cloud_cover'}, 20]}
+            ]
+        }
+        expected = {
+            'bool': {
+                'must': [
+                    {'range': {'cloud_cover': {'gte': 20, 'lte': 50}}},
+                    PLATFORM
+                ]
+            }
+        }
+
+        self.compare_output(expr, expected)
+
+    def test_contradictory_ranges(self):
+        expr = {
+            'and': [
+                {'gt': [{'property': 'cloud_cover'}, 50]},
+                {'lt': [{'property': 'cloud_cover'}, 10]}
+            ]
+        }
+
+        self.compare_output(expr, {'match_none': {}})
+        self.compare_output(expr, {'match_none': {}}, filter_context=True)
+
+    def test_equal_exclusive_bounds(self):
+        expr = {
+            'and': [
+                {'gte': [{'property': 'cloud_cover'}, 50]},
+                {'lt': [{'property': 'cloud_cover'}, 50]}
+            ]
+        }
+
+        self.compare_output(expr, {'match_none': {}})
+
+    def test_terms_under_or(self):
+        expr = {
+            'or': [
+                {'eq': [{'property': 'platform'}, 'faam']},
+                {'eq': [{'property': 'instrument'}, 'lidar']},
+                {'eq': [{'property': 'platform'}, 'bas']},
+                {'in': {'value': {'property': 'platform'}, 'list': ['faam', 'nerc']}}
+            ]
+        }
+        expected = {
+            'bool': {
+                'should': [
+                    {'terms': {'platform': ['faam', 'bas', 'nerc']}},
+                    INSTRUMENT
+                ]
+            }
+        }
+
+        self.compare_output(expr, expected)
+
+    def test_single_terms_is_unwrapped(self):
+        expr = {
+            'and': [
+                {
+                    'or': [
+                        {'eq': [{'property': 'platform'}, 'faam']},
+                        {'eq': [{'property': 'platform'}, 'bas']}
+                    ]
+                },
+                {'eq': [{'property': 'instrument'}, 'lidar']}
+            ]
+        }
+        expected = {
+            'bool': {
+                'filter': [
+                    {'terms': {'platform': ['faam', 'bas']}},
+                    INSTRUMENT
+                ]
+            }
+        }
+
+        self.compare_output(expr, expected, filter_context=True)
+
+
+class TestOptimise(unittest.TestCase):
+
+    def test_double_negation(self):
+        query = {'bool': {'must_not': [{'bool': {'must_not': [PLATFORM]}}]}}
+
+        self.assertEqual(optimise(query), {'bool': {'filter': [PLATFORM]}})
+
+    def test_tautologies(self):
+        query = {'bool': {'must': [{'match_all': {}}, PLATFORM], 'must_not': [{'match_none': {}}]}}
+
+        self.assertEqual(optimise(query), PLATFORM)
+        self.assertEqual(optimise({'bool': {'filter': [{'match_all': {}}]}}), {'match_all': {}})
+        self.assertEqual(optimise({'bool': {'should': [PLATFORM, {'match_all': {}}]}}), {'match_all': {}})
+
+    def test_contradictions(self):
+        self.assertEqual(optimise({'bool': {'must_not': [{'match_all': {}}]}}), {'match_none': {}})
+        self.assertEqual(optimise({'bool': {'filter': [PLATFORM, {'match_none': {}}]}}), {'match_none': {}})
+        self.assertEqual(optimise({'bool': {'should': [{'match_none': {}}]}}), {'match_none': {}})
+
+    def test_deep_query(self):
+        node = ast.Equal(ast.Attribute('a'), 0)
+        for i in range(1, 20000):
+            node = ast.And(node, ast.Equal(ast.Attribute('a'), i))
+
+        query = to_dict_filter(node, optimise=True)
+
+        self.assertEqual(len(query['bool']['must']), 20000)
+
+        for i in range(20000, 40000):
+            node = (ast.And if i % 2 else ast.Or)(node, ast.Equal(ast.Attribute('a'), i))
+
+        self.assertEqual(list(to_dict_filter(node, optimise=True)), ['bool'])
+
+    def test_lift_nested_bool(self):
+        query = {
+            'bool': {
+                'filter': [
+                    PLATFORM,
+                    {'bool': {'filter': [INSTRUMENT], 'must_not': [{'term': {'flight': 'b069'}}]}}
+                ]
+            }
+        }
+        expected = {
+            'bool': {
+                'filter': [PLATFORM, INSTRUMENT],
+                'must_not': [{'term': {'flight': 'b069'}}]
+            }
+        }
+
+        self.assertEqual(optimise(query), expected)
+
+    def test_optional_should_stays_optional(self):
+        query = {'bool': {'must': [{'match_all': {}}], 'should': [PLATFORM, INSTRUMENT]}}
+
+        self.assertEqual(
+            optimise(query),
+            {'bool': {'should': [PLATFORM, INSTRUMENT], 'minimum_should_match': 0}}
+        )
+
+    def test_date_math_is_not_merged(self):
+        query = {
+            'bool': {
+                'filter': [
+                    {'range': {'datetime': {'gte': 'now-1d'}}},
+                    {'range': {'datetime': {'gte': 'now-2d'}}}
+                ]
+            }
+        }
+
+        self.assertEqual(optimise(query), query)
+
+
+class TestStringBounds(unittest.TestCase):
+
+    mapping = {
+        'properties': {
+            'datetime': {'type': 'date'},
+            'orbit': {'type': 'integer'},
+        }
+    }
+
+    def translate(self, expr, **kwargs):
+        return to_dict_filter(parse_json(json.dumps(expr)), optimise=True, **kwargs)
+
+    def test_time_zones(self):
+        # 12:00+05:00 is 07:00Z, so the range is not empty
+        expr = {
+            'and': [
+                {'gte': [{'property': 'datetime'}, '2021-01-01T12:00:00+05:00']},
+                {'lte': [{'property': 'datetime'}, '2021-01-01T08:00:00Z']}
+            ]
+        }
+        query = {
+            'bool': {
+                'filter': [
+                    {'range': {'datetime': {'gte': '2021-01-01T12:00:00+05:00'}}},
+                    {'range': {'datetime': {'lte': '2021-01-01T08:00:00Z'}}}
+                ]
+            }
+        }
+
+        self.assertEqual(optimise(query), query)
+        self.assertNotEqual(self.translate(expr), {'match_none': {}})
+        self.assertNotEqual(self.translate(expr, index_mapping=self.mapping), {'match_none': {}})
+
+    def test_date_only_bound(self):
+        # Elasticsearch rounds a date-only lte up to the end of the day
+        query = {
+            'bool': {
+                'filter': [
+                    {'range': {'datetime': {'gte': '2021-01-01T12:00:00'}}},
+                    {'range': {'datetime': {'lte': '2021-01-01'}}}
+                ]
+            }
+        }
+        expr = {
+            'and': [
+                {'gte': [{'property': 'datetime'}, '2021-01-01T12:00:00']},
+                {'lte': [{'property': 'datetime'}, '2021-01-01']}
+            ]
+        }
+
+        self.assertEqual(optimise(query), query)
+        self.assertNotEqual(self.translate(expr, index_mapping=self.mapping), {'match_none': {}})
+
+    def test_numeric_strings(self):
+        expr = {
+            'and': [
+                {'gt': [{'property': 'orbit'}, '9']},
+                {'lt': [{'property': 'orbit'}, '10']}
+            ]
+        }
+
+        self.assertNotEqual(self.translate(expr), {'match_none': {}})
+        self.assertEqual(
+            self.translate(expr, index_mapping=self.mapping),
+            {'range': {'orbit': {'gt': 9, 'lt': 10}}}
+        )
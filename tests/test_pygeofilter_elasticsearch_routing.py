@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` index pruning and routing.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from datetime import datetime, timedelta, timezone
+from string import Template
+
+from pygeofilter import ast, values
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import TimePartitions, search_target
+from pygeofilter_elasticsearch.routing import time_bounds, routing_values
+
+
+def at(year, month, day):
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+DATETIME = {'property': 'datetime'}
+PLATFORM = {'property': 'platform'}
+
+MONTHLY = TimePartitions('items-%Y-%m', first=at(2019, 1, 1), last=at(2021, 12, 31))
+
+
+def parse(expr):
+    return parse_json(json.dumps(expr))
+
+
+class TestTimeBounds(unittest.TestCase):
+
+    def test_during(self):
+        node = parse({'during': [DATETIME, ['2020-01-15T00:00:00Z', '2020-03-02T00:00:00Z']]})
+
+        self.assertEqual(time_bounds(node, 'datetime'), (at(2020, 1, 15), at(2020, 3, 2)))
+
+    def test_and(self):
+        node = parse({'and': [
+            {'after': [DATETIME, '2020-01-15T00:00:00Z']},
+            {'eq': [PLATFORM, 'faam']},
+            {'lt': [DATETIME, '2020-06-01T00:00:00Z']},
+        ]})
+
+        self.assertEqual(time_bounds(node, 'datetime'), (at(2020, 1, 15), at(2020, 6, 1)))
+
+    def test_or(self):
+        node = parse({'or': [
+            {'during': [DATETIME, ['2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z']]},
+            {'during': [DATETIME, ['2020-05-01T00:00:00Z', '2020-05-31T00:00:00Z']]},
+        ]})
+        self.assertEqual(time_bounds(node, 'datetime'), (at(2020, 1, 1), at(2020, 5, 31)))
+
+        node = parse({'or': [
+            {'after': [DATETIME, '2020-01-01T00:00:00Z']},
+            {'eq': [PLATFORM, 'faam']},
+        ]})
+        self.assertEqual(time_bounds(node, 'datetime'), (None, None))
+
+    def test_not_is_unbounded(self):
+        node = parse({'not': [{'before': [DATETIME, '2020-01-01T00:00:00Z']}]})
+
+        self.assertEqual(time_bounds(node, 'datetime'), (None, None))
+
+    def test_interval_with_duration(self):
+        node = ast.TimeDuring(ast.Attribute('time'), values.Interval(at(2020, 1, 1), timedelta(days=40)))
+
+        self.assertEqual(
+            time_bounds(node, 'properties.datetime', {'time': 'properties.datetime'}),
+            (at(2020, 1, 1), at(2020, 2, 10))
+        )
+
+    def test_field_default(self):
+        node = parse({'gte': [DATETIME, '2020-01-01T00:00:00Z']})
+
+        self.assertEqual(
+            time_bounds(node, 'properties.datetime', field_default=Template('properties.${name}')),
+            (at(2020, 1, 1), None)
+        )
+
+
+class TestRoutingValues(unittest.TestCase):
+
+    def test_equal(self):
+        node = parse({'and': [{'eq': [PLATFORM, 'faam']}, {'gt': [{'property': 'a'}, 1]}]})
+
+        self.assertEqual(routing_values(node, 'platform'), ['faam'])
+
+    def test_in_and_or(self):
+        node = parse({'or': [
+            {'eq': [PLATFORM, 'faam']},
+            {'in': {'value': PLATFORM, 'list': ['bas', 'nerc']}},
+        ]})
+        self.assertEqual(routing_values(node, 'platform'), ['bas', 'faam', 'nerc'])
+
+        node = parse({'or': [{'eq': [PLATFORM, 'faam']}, {'gt': [{'property': 'a'}, 1]}]})
+        self.assertIsNone(routing_values(node, 'platform'))
+
+    def test_contradiction(self):
+        node = parse({'and': [{'eq': [PLATFORM, 'faam']}, {'eq': [PLATFORM, 'bas']}]})
+
+        self.assertEqual(routing_values(node, 'platform'), [])
+
+
+class TestTimePartitions(unittest.TestCase):
+
+    def test_months(self):
+        self.assertEqual(
+            MONTHLY.indices(at(2020, 11, 15), at(2021, 2, 1)),
+            ['items-2020-11', 'items-2020-12', 'items-2021-01', 'items-2021-02']
+        )
+
+    def test_open_ends(self):
+        self.assertEqual(MONTHLY.indices(at(2021, 11, 2), None), ['items-2021-11', 'items-2021-12'])
+        self.assertEqual(MONTHLY.indices(None, at(2019, 2, 1)), ['items-2019-01', 'items-2019-02'])
+        self.assertEqual(TimePartitions('items-%Y-%m').indices(None, at(2019, 2, 1)), ['items-*'])
+
+    def test_empty(self):
+        self.assertEqual(MONTHLY.indices(at(2020, 1, 20), at(2020, 1, 10)), [])
+        self.assertEqual(MONTHLY.indices(at(2025, 1, 1), None), [])
+
+    def test_periods(self):
+        self.assertEqual(
+            TimePartitions('items-%Y', 'year').indices(at(2019, 6, 1), at(2021, 1, 1)),
+            ['items-2019', 'items-2020', 'items-2021']
+        )
+        self.assertEqual(
+            TimePartitions('items-%Y.%m.%d', 'day').indices(at(2020, 2, 28), at(2020, 3, 1)),
+            ['items-2020.02.28', 'items-2020.02.29', 'items-2020.03.01']
+        )
+
+
+class TestSearchTarget(unittest.TestCase):
+
+    def test_target(self):
+        node = parse({'and': [
+            {'during': [DATETIME, ['2020-01-15T00:00:00Z', '2020-03-02T00:00:00Z']]},
+            {'eq': [PLATFORM, 'faam']},
+        ]})
+
+        self.assertEqual(
+            search_target(node, MONTHLY, 'datetime', 'platform'),
+            {'index': 'items-2020-01,items-2020-02,items-2020-03', 'routing': 'faam'}
+        )
+
+    def test_no_routing(self):
+        node = parse({'before': [DATETIME, '2019-01-15T00:00:00Z']})
+
+        self.assertEqual(search_target(node, MONTHLY, 'datetime', 'platform'), {'index': 'items-2019-01'})
+
+    def test_no_match(self):
+        node = parse({'and': [
+            {'during': [DATETIME, ['2020-01-15T00:00:00Z', '2020-03-02T00:00:00Z']]},
+            {'eq': [PLATFORM, 'faam']},
+            {'eq': [PLATFORM, 'bas']},
+        ]})
+
+        self.assertIsNone(search_target(node, MONTHLY, 'datetime', 'platform'))
+
+    def test_empty_time_span(self):
+        node = parse({'and': [
+            {'after': [DATETIME, '2020-03-01T00:00:00Z']},
+            {'before': [DATETIME, '2020-01-01T00:00:00Z']},
+        ]})
+
+        self.assertIsNone(search_target(node, MONTHLY, 'datetime'))
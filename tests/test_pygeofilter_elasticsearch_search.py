@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` search helpers.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import asyncio
+from string import Template
+
+from pygeofilter_elasticsearch import FilterSearch, AsyncFilterSearch, to_filter, scan, async_scan
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+EXPR = {'eq': [{'property': 'platform'}, 'faam']}
+EXPR_QUERY = {'term': {'platform': 'faam'}}
+
+
+class StubPitClient:
+    """Serves pages of numbered documents from point in time searches."""
+
+    def __init__(self, total):
+        self.total = total
+        self.searches = []
+        self.open = set()
+        self.opened = 0
+
+    def open_point_in_time(self, index, keep_alive):
+        self.opened += 1
+        pit_id = f'pit-{self.opened}'
+        self.open.add(pit_id)
+        return {'id': pit_id}
+
+    def close_point_in_time(self, id):
+        self.open.remove(id)
+
+    def search(self, pit, size, search_after=None, **kwargs):
+        assert pit['id'] in self.open
+        self.searches.append({'pit': pit, 'size': size, 'search_after': search_after, **kwargs})
+        start = search_after[0] + 1 if search_after else 0
+        hits = [{'_id': str(i), 'sort': [i]} for i in range(start, min(start + size, self.total))]
+        return {'pit_id': pit['id'], 'hits': {'hits': hits}}
+
+
+class StubAsyncPitClient(StubPitClient):
+
+    async def open_point_in_time(self, index, keep_alive):
+        return super().open_point_in_time(index, keep_alive)
+
+    async def close_point_in_time(self, id):
+        super().close_point_in_time(id)
+
+    async def search(self, **kwargs):
+        await asyncio.sleep(0)
+        return super().search(**kwargs)
+
+
+class StubAsyncClient:
+    """Records the searches made and how many ran at once."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    async def search(self, **kwargs):
+        self.calls.append(kwargs)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return {'hits': {'hits': [], 'total': {'value': len(self.calls)}}, 'query': kwargs['query']}
+
+
+class TestAsyncFilterSearch(unittest.IsolatedAsyncioTestCase):
+
+    async def test_search(self):
+        client = StubAsyncClient()
+        search = AsyncFilterSearch(client, index='items', field_default=Template('properties.${name}'))
+
+        await search.search(EXPR, size=10)
+        await search.search("platform = 'faam'", index='other')
+
+        self.assertEqual(client.calls, [
+            {'index': 'items', 'query': {'term': {'properties.platform': 'faam'}}, 'size': 10},
+            {'index': 'other', 'query': {'term': {'properties.platform': 'faam'}}},
+        ])
+
+    async def test_search_many(self):
+        client = StubAsyncClient()
+        search = AsyncFilterSearch(client, index='items', max_concurrency=3, filter_context=True)
+        filters = [f'flight_number = {i}' for i in range(10)]
+
+        responses = await search.search_many(filters)
+
+        self.assertEqual(client.max_running, 3)
+        self.assertEqual(
+            [response['query'] for response in responses],
+            [{'bool': {'filter': [{'term': {'flight_number': i}}]}} for i in range(10)]
+        )
+
+
+class StubClient:
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'hits': {'hits': []}}
+
+
+class TestFilterSearch(unittest.TestCase):
+
+    def test_search(self):
+        client = StubClient()
+        FilterSearch(client, index='items').search('{"eq": [{"property": "platform"}, "faam"]}', size=0)
+
+        self.assertEqual(client.calls, [{'index': 'items', 'query': {'term': {'platform': 'faam'}}, 'size': 0}])
+
+    def test_aggregate(self):
+        client = StubClient()
+        search = FilterSearch(client, index='items', field_default=Template('properties.${name}'))
+
+        search.aggregate("platform = 'faam'", {'platforms': {'type': 'terms', 'property': 'platform'}})
+
+        self.assertEqual(client.calls, [{
+            'index': 'items',
+            'size': 0,
+            'query': {'bool': {'filter': [{'term': {'properties.platform': 'faam'}}]}},
+            'track_total_hits': True,
+            'aggs': {'platforms': {'terms': {'field': 'properties.platform'}}},
+        }])
+
+
+class TestScan(unittest.TestCase):
+
+    def setUp(self):
+        self.query = to_filter(parse_json(EXPR))
+
+    def test_scan(self):
+        for prefetch in (0, 1, 3):
+            client = StubPitClient(25)
+            hits = list(scan(client, self.query, 'items', page_size=10, prefetch=prefetch))
+
+            self.assertEqual([hit['_id'] for hit in hits], [str(i) for i in range(25)])
+            self.assertEqual(len(client.searches), 3)
+            self.assertEqual(client.open, set())
+
+        self.assertEqual(client.searches[0]['query'], {'term': {'platform': 'faam'}})
+        self.assertEqual(client.searches[0]['sort'], [{'_shard_doc': 'asc'}])
+        self.assertEqual(client.searches[1]['search_after'], [9])
+
+    def test_stop_early(self):
+        client = StubPitClient(1000)
+        hits = scan(client, self.query, 'items', page_size=10, prefetch=2)
+
+        self.assertEqual(next(hits)['_id'], '0')
+        hits.close()
+
+        self.assertEqual(client.open, set())
+        self.assertLessEqual(len(client.searches), 4)
+
+    def test_filter_search(self):
+        client = StubPitClient(5)
+        hits = list(FilterSearch(client, 'items').scan(EXPR, page_size=10, sort=[{'datetime': 'desc'}]))
+
+        self.assertEqual(len(hits), 5)
+        self.assertEqual(client.searches[0]['sort'], [{'datetime': 'desc'}, {'_shard_doc': 'asc'}])
+
+
+class TestAsyncScan(unittest.IsolatedAsyncioTestCase):
+
+    async def test_scan(self):
+        for prefetch in (0, 2):
+            client = StubAsyncPitClient(25)
+            hits = [hit async for hit in async_scan(client, EXPR_QUERY, 'items', page_size=10, prefetch=prefetch)]
+
+            self.assertEqual([hit['_id'] for hit in hits], [str(i) for i in range(25)])
+            self.assertEqual(client.open, set())
+
+    async def test_stop_early(self):
+        client = StubAsyncPitClient(1000)
+        hits = AsyncFilterSearch(client, 'items').scan(EXPR, page_size=10)
+
+        async for hit in hits:
+            break
+        await hits.aclose()
+
+        self.assertEqual(client.open, set())
+        self.assertLessEqual(len(client.searches), 3)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` request body serialisation.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from datetime import datetime, timezone
+from unittest import mock
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, to_body, dumps, estimate_size
+from pygeofilter_elasticsearch import serialise
+
+EXPR = parse_json(json.dumps({
+    'and': [
+        {'eq': [{'property': 'title'}, 'Météo "daily"']},
+        {'in': {'value': {'property': 'platform'}, 'list': ['faam', 'bas']}},
+        {'intersects': [
+            {'property': 'geometry'},
+            {'type': 'Polygon', 'coordinates': [[[0.1234567, 0.0], [1.0, 2.7654321], [2.0, 0.0], [0.1234567, 0.0]]]}
+        ]},
+        {'after': [{'property': 'datetime'}, '2005-01-04T00:00:00Z']}
+    ]
+}))
+
+
+class TestDumps(unittest.TestCase):
+
+    def test_compact(self):
+        query = to_dict_filter(EXPR)
+        body = dumps(query)
+
+        self.assertIsInstance(body, bytes)
+        self.assertNotIn(b', ', body)
+        self.assertEqual(json.loads(body), json.loads(json.dumps(query, default=serialise.json_default)))
+
+    def test_query_object(self):
+        self.assertEqual(dumps(to_filter(EXPR)), dumps(to_dict_filter(EXPR)))
+
+    def test_without_orjson(self):
+        query = to_dict_filter(EXPR)
+        expected = dumps(query)
+
+        with mock.patch.object(serialise, 'orjson', None):
+            self.assertEqual(dumps(query), expected)
+
+    def test_datetime(self):
+        query = {'range': {'datetime': {'gt': datetime(2005, 1, 4, tzinfo=timezone.utc)}}}
+
+        self.assertEqual(dumps(query), b'{"range":{"datetime":{"gt":"2005-01-04T00:00:00+00:00"}}}')
+
+
+class TestEstimateSize(unittest.TestCase):
+
+    def test_exact(self):
+        for query in (
+            to_dict_filter(EXPR),
+            {'terms': {'id': list(range(1000))}},
+            {'bool': {'filter': [], 'minimum_should_match': 1, 'boost': 1.5, 'x': None, 'y': False}},
+        ):
+            self.assertEqual(estimate_size(query), len(dumps(query)))
+
+    def test_query_object(self):
+        self.assertEqual(estimate_size(to_filter(EXPR)), len(dumps(to_filter(EXPR))))
+
+
+class TestToBody(unittest.TestCase):
+
+    def test_body(self):
+        body = json.loads(to_body(EXPR, search={'size': 10}, coordinate_precision=3))
+
+        self.assertEqual(body['size'], 10)
+        self.assertEqual(
+            body['query']['bool']['must'][2]['geo_shape']['geometry']['shape']['coordinates'],
+            [[[0.123, 0.0], [1.0, 2.765], [2.0, 0.0], [0.123, 0.0]]]
+        )
+
+    def test_optimise_is_opt_in(self):
+        ast = parse_json(json.dumps({'or': [
+            {'eq': [{'property': 'platform'}, 'faam']},
+            {'eq': [{'property': 'platform'}, 'bas']}
+        ]}))
+
+        self.assertEqual(
+            to_body(ast),
+            b'{"query":{"bool":{"should":[{"term":{"platform":"faam"}},{"term":{"platform":"bas"}}]}}}'
+        )
+        self.assertEqual(to_body(ast, optimise=True), b'{"query":{"terms":{"platform":["faam","bas"]}}}')
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` shared filter hoisting.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_shared_aggregation_body, to_shared_msearch
+from pygeofilter_elasticsearch.shared import split_shared
+
+COLLECTION = {'eq': [{'property': 'collection'}, 'sentinel-2']}
+WINDOW = {'lt': [{'property': 'cloud_cover'}, 20]}
+
+COLLECTION_QUERY = {'term': {'collection': 'sentinel-2'}}
+WINDOW_QUERY = {'range': {'cloud_cover': {'lt': 20}}}
+
+
+def facet(*extra):
+    return parse_json(json.dumps({'and': [COLLECTION, *extra, WINDOW]}))
+
+
+class TestSplitShared(unittest.TestCase):
+
+    def test_split(self):
+        asts = [
+            facet({'eq': [{'property': 'platform'}, 'faam']}),
+            facet({'eq': [{'property': 'platform'}, 'bas']}),
+            parse_json(json.dumps({'and': [WINDOW, COLLECTION]})),
+        ]
+
+        shared, residuals = split_shared(asts)
+
+        self.assertEqual(shared, parse_json(json.dumps({'and': [COLLECTION, WINDOW]})))
+        self.assertEqual(residuals, [
+            parse_json(json.dumps({'eq': [{'property': 'platform'}, 'faam']})),
+            parse_json(json.dumps({'eq': [{'property': 'platform'}, 'bas']})),
+            None,
+        ])
+
+    def test_nothing_shared(self):
+        asts = [parse_json(json.dumps(COLLECTION)), parse_json(json.dumps(WINDOW))]
+
+        self.assertEqual(split_shared(asts), (None, asts))
+
+
+class TestSharedAggregationBody(unittest.TestCase):
+
+    def test_body(self):
+        asts = [
+            facet({'eq': [{'property': 'platform'}, 'faam']}),
+            facet({'eq': [{'property': 'platform'}, 'bas']}),
+            facet(),
+        ]
+
+        body = to_shared_aggregation_body(
+            asts,
+            names=['faam', 'bas', 'all'],
+            specs={'last': {'type': 'max', 'property': 'datetime'}}
+        )
+
+        self.assertEqual(body, {
+            'size': 0,
+            'query': {'bool': {'filter': [COLLECTION_QUERY, WINDOW_QUERY]}},
+            'track_total_hits': True,
+            'aggs': {
+                'queries': {
+                    'filters': {
+                        'filters': {
+                            'faam': {'bool': {'filter': [{'term': {'platform': 'faam'}}]}},
+                            'bas': {'bool': {'filter': [{'term': {'platform': 'bas'}}]}},
+                            'all': {'match_all': {}},
+                        }
+                    },
+                    'aggs': {'last': {'max': {'field': 'datetime'}}}
+                }
+            }
+        })
+
+    def test_names(self):
+        with self.assertRaises(AssertionError):
+            to_shared_aggregation_body([facet()], names=['a', 'b'])
+
+
+class TestSharedMsearch(unittest.TestCase):
+
+    def test_msearch(self):
+        asts = [facet({'eq': [{'property': 'platform'}, 'faam']}), facet()]
+
+        lines = to_shared_msearch(asts, index='items', search={'size': 10}).splitlines()
+
+        self.assertEqual(lines[0], '{"index": "items"}')
+        self.assertEqual(json.loads(lines[1]), {
+            'size': 10,
+            'query': {
+                'bool': {
+                    'filter': [
+                        {'bool': {'filter': [COLLECTION_QUERY, WINDOW_QUERY]}},
+                        {'bool': {'filter': [{'term': {'platform': 'faam'}}]}},
+                    ]
+                }
+            }
+        })
+        self.assertEqual(json.loads(lines[3]), {
+            'size': 10,
+            'query': {'bool': {'filter': [COLLECTION_QUERY, WINDOW_QUERY]}}
+        })
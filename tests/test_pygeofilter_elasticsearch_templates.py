@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `pygeofilter_elasticsearch` query templates.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+from datetime import datetime, timedelta
+
+from pygeofilter import ast, values
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_dict_filter, compile_template
+from pygeofilter_elasticsearch.fields import IndexMapping
+
+
+def parse(expr):
+    return parse_json(json.dumps(expr))
+
+
+def search(platform, cloud_cover, cities):
+    return parse({
+        'and': [
+            {'eq': [{'property': 'platform'}, platform]},
+            {'lt': [{'property': 'cloud_cover'}, cloud_cover]},
+            {'in': {'value': {'property': 'city'}, 'list': cities}}
+        ]
+    })
+
+
+class TestQueryTemplate(unittest.TestCase):
+
+    def test_defaults(self):
+        template = compile_template(search('faam', 50, ['Leeds', 'York']))
+
+        self.assertEqual(template.slots, ('p0', 'p1', 'p2', 'p3'))
+        self.assertEqual(template.bind(), to_dict_filter(search('faam', 50, ['Leeds', 'York'])))
+
+    def test_bind(self):
+        template = compile_template(search('faam', 50, ['Leeds', 'York']))
+
+        self.assertEqual(
+            template.bind(p0='bas', p1=20, p3='Hull'),
+            to_dict_filter(search('bas', 20, ['Leeds', 'Hull']))
+        )
+
+    def test_bind_unknown_slot(self):
+        template = compile_template(search('faam', 50, ['Leeds', 'York']))
+
+        with self.assertRaises(KeyError):
+            template.bind(platform='bas')
+
+    def test_bind_ast(self):
+        template = compile_template(search('faam', 50, ['Leeds', 'York']), filter_context=True)
+
+        self.assertEqual(
+            template.bind_ast(search('bas', 20, ['Hull', 'Selby'])),
+            to_dict_filter(search('bas', 20, ['Hull', 'Selby']), filter_context=True)
+        )
+
+        with self.assertRaises(ValueError):
+            template.bind_ast(search('bas', 20, ['Hull']))
+
+    def test_bind_ast_structure(self):
+        template = compile_template(parse({'eq': [{'property': 'a'}, 1]}))
+
+        self.assertEqual(
+            template.bind_ast(parse({'eq': [{'property': 'a'}, 2]})),
+            to_dict_filter(parse({'eq': [{'property': 'a'}, 2]}))
+        )
+        for expr in [
+            {'eq': [{'property': 'b'}, 1]},
+            {'gt': [{'property': 'a'}, 1]},
+            {'not': {'eq': [{'property': 'a'}, 1]}},
+        ]:
+            with self.assertRaises(ValueError):
+                template.bind_ast(parse(expr))
+
+    def test_bind_ast_like(self):
+        template = compile_template(ast.Like(ast.Attribute('a'), 'x%', False, '%', '_', '\\', False))
+
+        for node in [
+            ast.Like(ast.Attribute('a'), 'y%', False, '%', '_', '\\', False),
+            ast.Like(ast.Attribute('a'), 'x%', True, '%', '_', '\\', False),
+            ast.Like(ast.Attribute('a'), 'x%', False, '%', '_', '\\', True),
+        ]:
+            with self.assertRaises(ValueError):
+                template.bind_ast(node)
+
+    def test_bound_queries_are_independent(self):
+        template = compile_template(search('faam', 50, ['Leeds', 'York']))
+
+        query = template.bind()
+        query['bool']['must'].clear()
+
+        self.assertEqual(len(template.bind()['bool']['must']), 3)
+
+    def test_temporal(self):
+        node = ast.TimeBefore(ast.Attribute('datetime'), datetime(2021, 1, 1))
+        template = compile_template(node)
+
+        self.assertEqual(
+            template.bind(p0=datetime(2022, 1, 1)),
+            {'range': {'datetime': {'lte': datetime(2022, 1, 1)}}}
+        )
+
+    def test_temporal_during(self):
+        node = ast.TimeDuring(ast.Attribute('datetime'), values.Interval(datetime(2021, 1, 1), datetime(2021, 2, 1)))
+        template = compile_template(node)
+
+        self.assertEqual(
+            template.bind(p0=datetime(2022, 1, 1)),
+            {'range': {'datetime': {'gte': datetime(2022, 1, 1), 'lte': datetime(2021, 2, 1)}}}
+        )
+
+    def test_temporal_duration(self):
+        node = ast.TimeDuring(ast.Attribute('datetime'), values.Interval(datetime(2021, 1, 1), timedelta(days=1)))
+        template = compile_template(node)
+
+        self.assertEqual(
+            template.bind(p0=datetime(2022, 6, 1)),
+            {'range': {'datetime': {'gte': datetime(2022, 6, 1), 'lte': datetime(2022, 6, 2)}}}
+        )
+        self.assertEqual(
+            template.bind(p1=timedelta(days=30)),
+            {'range': {'datetime': {'gte': datetime(2021, 1, 1), 'lte': datetime(2021, 1, 31)}}}
+        )
+
+    def test_temporal_granularity(self):
+        node = ast.TimeAfter(ast.Attribute('datetime'), datetime(2021, 1, 1, 12, 30))
+        template = compile_template(node, temporal_granularity='h')
+
+        self.assertEqual(
+            template.bind(p0=datetime(2022, 3, 4, 5, 6)),
+            to_dict_filter(ast.TimeAfter(ast.Attribute('datetime'), datetime(2022, 3, 4, 5, 6)),
+                           temporal_granularity='h')
+        )
+
+    def test_index_mapping(self):
+        mapping = IndexMapping({'properties': {'platform': {'type': 'keyword'}, 'orbit': {'type': 'integer'}}})
+        node = parse({'and': [
+            {'eq': [{'property': 'platform'}, 'faam']},
+            {'gt': [{'property': 'orbit'}, 5]},
+        ]})
+        template = compile_template(node, index_mapping=mapping)
+
+        self.assertEqual(
+            template.bind(p0=7, p1='9'),
+            to_dict_filter(parse({'and': [
+                {'eq': [{'property': 'platform'}, 7]},
+                {'gt': [{'property': 'orbit'}, '9']},
+            ]}), index_mapping=mapping)
+        )
+
+        with self.assertRaises(ValueError):
+            template.bind(p1='nine')
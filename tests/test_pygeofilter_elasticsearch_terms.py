@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` handling of long IN lists.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter
+from pygeofilter_elasticsearch.filters import terms_values
+
+
+def in_list(values, not_=False):
+    expr = {'in': {'value': {'property': 'dataset_id'}, 'list': values}}
+    return parse_json(json.dumps({'not': [expr]} if not_ else expr))
+
+
+class CompareTermsOutputMixin:
+    def compare_output(self, ast, expected, **kwargs):
+        self.assertEqual(to_dict_filter(ast, **kwargs), expected)
+        self.assertEqual(to_filter(ast, **kwargs).to_dict(), expected)
+
+
+class TestTerms(CompareTermsOutputMixin, unittest.TestCase):
+
+    def test_under_threshold(self):
+        self.compare_output(
+            in_list(['c', 'a', 'b']),
+            {'terms': {'dataset_id': ['c', 'a', 'b']}},
+            max_terms=3
+        )
+
+    def test_deduplicated_under_threshold(self):
+        self.compare_output(
+            in_list(['c', 'a', 'c', 'b', 'a']),
+            {'terms': {'dataset_id': ['a', 'b', 'c']}},
+            max_terms=3
+        )
+
+    def test_chunked(self):
+        self.compare_output(
+            in_list([5, 3, 1, 4, 2, 3]),
+            {
+                'bool': {
+                    'should': [
+                        {'terms': {'dataset_id': [1, 2]}},
+                        {'terms': {'dataset_id': [3, 4]}},
+                        {'terms': {'dataset_id': [5]}},
+                    ]
+                }
+            },
+            max_terms=2
+        )
+
+    def test_chunked_negated(self):
+        self.compare_output(
+            in_list([3, 2, 1], not_=True),
+            {
+                'bool': {
+                    'must_not': [
+                        {'terms': {'dataset_id': [1, 2]}},
+                        {'terms': {'dataset_id': [3]}},
+                    ]
+                }
+            },
+            max_terms=2
+        )
+
+    def test_chunked_in_filter_context(self):
+        ast = parse_json(json.dumps({
+            'and': [
+                {'eq': [{'property': 'public'}, True]},
+                {'in': {'value': {'property': 'dataset_id'}, 'list': [3, 2, 1]}}
+            ]
+        }))
+
+        self.compare_output(
+            ast,
+            {
+                'bool': {
+                    'filter': [
+                        {'term': {'public': True}},
+                        {
+                            'bool': {
+                                'should': [
+                                    {'terms': {'dataset_id': [1, 2]}},
+                                    {'terms': {'dataset_id': [3]}},
+                                ]
+                            }
+                        }
+                    ]
+                }
+            },
+            max_terms=2,
+            filter_context=True
+        )
+
+    def test_terms_lookup(self):
+        stored = {}
+
+        def store(field, values):
+            stored[field] = values
+            return {'index': 'lists', 'id': field, 'path': 'values'}
+
+        self.compare_output(
+            in_list(['b', 'c', 'a', 'b']),
+            {'terms': {'dataset_id': {'index': 'lists', 'id': 'dataset_id', 'path': 'values'}}},
+            max_terms=2,
+            terms_lookup=store
+        )
+        self.assertEqual(stored, {'dataset_id': ['a', 'b', 'c']})
+
+    def test_large_list(self):
+        values = [f'ds-{i:05d}' for i in reversed(range(50000))]
+
+        query = to_dict_filter(in_list(values), max_terms=10000)
+
+        chunks = query['bool']['should']
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(chunks[0]['terms']['dataset_id'][0], 'ds-00000')
+        self.assertEqual(chunks[-1]['terms']['dataset_id'][-1], 'ds-49999')
+
+
+class TestTermsValues(unittest.TestCase):
+
+    def test_mixed_types(self):
+        self.assertEqual(terms_values([2, 'b', 1, 'a', 2]), [1, 2, 'a', 'b'])
+
+    def test_unhashable(self):
+        self.assertEqual(terms_values([[2], [1], [2]]), [[2], [1]])
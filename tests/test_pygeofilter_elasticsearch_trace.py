@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `pygeofilter_elasticsearch` instrumentation.
+"""
+
+__author__ = """Richard Smith"""
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+__copyright__ = "Copyright 2018 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+
+import unittest
+import json
+
+from pygeofilter.parsers.cql_json import parse as parse_json
+
+from pygeofilter_elasticsearch import to_filter, to_dict_filter, Tracer
+from pygeofilter_elasticsearch.trace import query_shape, query_size
+
+EXPR = parse_json(json.dumps({
+    'and': [
+        {'eq': [{'property': 'platform'}, 'faam']},
+        {'or': [
+            {'gt': [{'property': 'cloud_cover'}, 10]},
+            {'like': {'like': [{'property': 'title'}, '%lidar%']}}
+        ]}
+    ]
+}))
+
+
+class TestTracer(unittest.TestCase):
+
+    def test_records_translation(self):
+        traces = []
+        tracer = Tracer(traces.append)
+
+        query = to_dict_filter(EXPR, tracer=tracer)
+
+        trace, = traces
+        self.assertEqual(trace.clauses, 3)
+        self.assertEqual(trace.depth, 3)
+        self.assertEqual(trace.size, query_size(query))
+        self.assertGreater(trace.seconds, 0)
+        self.assertEqual(trace.node_timings['And'][0], 1)
+        self.assertEqual(trace.node_timings['Attribute'][0], 3)
+
+    def test_totals(self):
+        tracer = Tracer()
+
+        to_dict_filter(EXPR, tracer=tracer)
+        to_filter(EXPR, tracer=tracer)
+
+        snapshot = tracer.snapshot()
+        self.assertEqual(snapshot['translations'], 2)
+        self.assertEqual(snapshot['clauses'], 6)
+        self.assertEqual(snapshot['max_clauses'], 3)
+        self.assertEqual(snapshot['max_depth'], 3)
+        self.assertEqual(snapshot['nodes']['Or']['count'], 2)
+
+        tracer.reset()
+        self.assertEqual(tracer.snapshot()['translations'], 0)
+
+    def test_prometheus(self):
+        tracer = Tracer()
+        to_dict_filter(EXPR, tracer=tracer)
+
+        text = tracer.prometheus()
+
+        self.assertIn('# TYPE pygeofilter_elasticsearch_translations_total counter\n', text)
+        self.assertIn('pygeofilter_elasticsearch_translations_total 1\n', text)
+        self.assertIn('pygeofilter_elasticsearch_query_depth_max 3\n', text)
+        self.assertIn('pygeofilter_elasticsearch_nodes_total{node="Attribute"} 3\n', text)
+
+    def test_disabled(self):
+        self.assertEqual(to_dict_filter(EXPR), to_dict_filter(EXPR, tracer=Tracer()))
+
+
+class TestQueryShape(unittest.TestCase):
+
+    def test_leaf(self):
+        self.assertEqual(query_shape({'term': {'a': 1}}), (1, 1))
+
+    def test_nested(self):
+        query = {
+            'bool': {
+                'filter': [{'term': {'a': 1}}],
+                'must_not': [{'bool': {'should': [{'term': {'b': 1}}, {'term': {'c': 1}}]}}]
+            }
+        }
+        self.assertEqual(query_shape(query), (3, 3))